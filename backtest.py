@@ -0,0 +1,160 @@
+#!/usr/bin/python
+# -*- coding: iso-8859-1 -*-
+
+from exchanges.port.btce import *
+from strategies.triangularArbitrage import *
+from strategies.triangularArbitrageVectorized import *
+from strategies.negativeCycleArbitrage import *
+from strategies.stableCurrency import *
+from bot import *
+
+import argparse
+import itertools
+import multiprocessing
+import time
+
+# Algorithms that can be used by the backtests
+ALGORITHMS = {
+	'triangularArbitrage': triangularArbitrage,
+	'triangularArbitrageVectorized': triangularArbitrageVectorized,
+	'negativeCycleArbitrage': negativeCycleArbitrage,
+	'stableCurrency': stableCurrency
+}
+
+def runBacktest(run):
+	"""
+	Run a single backtest, this function is executed by the worker processes
+	"""
+	UtilzLog.setVerbosity(run['verbosity'])
+	# Set the parameters of the algorithms
+	for name in run['parameters']:
+		algorithm, attribute = name.split(".")
+		setattr(ALGORITHMS[algorithm], attribute, run['parameters'][name])
+
+	result = {
+		'record': run['record'],
+		'parameters': run['parameters'],
+		'error': None
+	}
+	start = time.time()
+	try:
+		# Each run has its own trading context (always in simulation mode)
+		exchange = run['exchange']({
+			'recordRead': run['record'],
+			'info': run['info'],
+			'context': TradingContext()
+		})
+		b = Bot({
+			'exchanges': [exchange],
+			'algorithms': [ALGORITHMS[name] for name in run['algorithms']],
+			'debug': False,
+			'display': False
+		})
+		result.update(b.run()[0])
+	except Exception as e:
+		result['error'] = str(e)
+	result['duration'] = time.time() - start
+	return result
+
+class Backtest(object):
+	"""
+	Run backtests over several records and a grid of algorithm parameters.
+	Each run is executed in a dedicated process, as the algorithm parameters
+	are class attributes.
+	"""
+
+	def __init__(self, config = {}):
+		self.config = {
+			# List of records to replay
+			'records': [],
+			# Grid of parameters, the key is `algorithm.ATTRIBUTE' and the value is the list of values to test
+			'parameters': {},
+			# Algorithms to run
+			'algorithms': ['triangularArbitrage', 'stableCurrency'],
+			# Exchange replaying the records
+			'exchange': ExchangeBTCE,
+			# Saved exchange info, so that no request is sent to the exchange
+			'info': None,
+			# Number of processes, by default the number of CPUs
+			'processes': None,
+			# Verbosity level of the runs
+			'verbosity': 0
+		}
+		self.config.update(config)
+		# Validate the parameters
+		for name in self.config['parameters']:
+			if len(name.split(".")) != 2 or not ALGORITHMS.has_key(name.split(".")[0]):
+				raise error("Invalid parameter `%s', it must be formatted as `algorithm.ATTRIBUTE'." % (str(name)))
+
+	def getRuns(self):
+		"""
+		Build the list of runs from the records and the parameter grid
+		"""
+		names = sorted(self.config['parameters'])
+		runs = []
+		for record in self.config['records']:
+			for values in itertools.product(*[self.config['parameters'][name] for name in names]):
+				runs.append({
+					'record': record,
+					'parameters': dict(zip(names, values)),
+					'algorithms': self.config['algorithms'],
+					'exchange': self.config['exchange'],
+					'info': self.config['info'],
+					'verbosity': self.config['verbosity']
+				})
+		return runs
+
+	def run(self):
+		"""
+		Run all the backtests and returns the list of results
+		"""
+		runs = self.getRuns()
+		UtilzLog.info("Running %i backtest(s)" % (len(runs)), 1)
+		# A new process is used for each run to isolate the algorithm parameters
+		pool = multiprocessing.Pool(processes = self.config['processes'], maxtasksperchild = 1)
+		try:
+			results = pool.map(runBacktest, runs, chunksize = 1)
+		finally:
+			pool.close()
+			pool.join()
+		return results
+
+	@staticmethod
+	def printResults(results):
+		"""
+		Print the results as a table
+		"""
+		stringList = ["record\tparameters\tinitial\tfinal\tgain\ttrades\tticks\ttime"]
+		for result in results:
+			parameters = ";".join(["%s=%s" % (name, str(result['parameters'][name])) for name in sorted(result['parameters'])])
+			if result['error'] != None:
+				stringList.append("%s\t%s\terror: %s\t\t\t\t\t%.1fs" % (result['record'], parameters, result['error'], result['duration']))
+			else:
+				stringList.append("%s\t%s\t%f\t%f\t%+.2f%%\t%i\t%i\t%.1fs" % (result['record'], parameters, result['initialValue'], result['value'], result['gainPercent'], result['trades'], result['ticks'], result['duration']))
+		return "\n".join(stringList)
+
+if __name__ == "__main__":
+
+	parser = argparse.ArgumentParser(description = "Backtest the algorithms over records.")
+	parser.add_argument("records", nargs = "+", help = "Records to replay")
+	parser.add_argument("--param", action = "append", default = [], help = "Parameter grid, formatted as `algorithm.ATTRIBUTE=value1,value2,...'")
+	parser.add_argument("--algorithms", default = "triangularArbitrage,stableCurrency", help = "Comma separated list of algorithms, among: %s" % (", ".join(sorted(ALGORITHMS.keys()))))
+	parser.add_argument("--info", default = None, help = "Saved response of the exchange info API")
+	parser.add_argument("--processes", type = int, default = None, help = "Number of processes")
+	parser.add_argument("--verbosity", type = int, default = 0, help = "Verbosity level of the runs")
+	args = parser.parse_args()
+
+	parameters = {}
+	for param in args.param:
+		name, values = param.split("=", 1)
+		parameters[name] = [int(value) if value.isdigit() else float(value) for value in values.split(",")]
+
+	b = Backtest({
+		'records': args.records,
+		'parameters': parameters,
+		'algorithms': args.algorithms.split(","),
+		'info': args.info,
+		'processes': args.processes,
+		'verbosity': args.verbosity
+	})
+	print Backtest.printResults(b.run())
@@ -0,0 +1,346 @@
+#!/usr/bin/python
+# -*- coding: iso-8859-1 -*-
+
+from exchanges.port.btce import *
+from exchanges.record import *
+from utilz.log import *
+
+import BaseHTTPServer
+import SocketServer
+import argparse
+import hashlib
+import hmac
+import json
+import random
+import threading
+import time
+import urlparse
+
+class BTCEServerHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+	"""
+	Handle the HTTP requests of the mock BTC-e server
+	"""
+	protocol_version = "HTTP/1.1"
+	# Send the responses in a single packet
+	wbufsize = -1
+	disable_nagle_algorithm = True
+
+	def do_GET(self):
+		self.server.mock.delay()
+		path = urlparse.urlparse(self.path).path
+		if path == "/api/3/info":
+			self.reply(self.server.mock.info)
+		elif path.startswith("/api/3/ticker/"):
+			ticker = self.server.mock.ticker(path[len("/api/3/ticker/"):].split("-"))
+			if ticker == None:
+				self.reply({'success': 0, 'error': "end of the record"}, 404)
+			else:
+				self.reply(ticker)
+		elif path.startswith("/api/3/depth/"):
+			self.reply(self.server.mock.depth(path[len("/api/3/depth/"):].split("-")))
+		else:
+			self.reply({'success': 0, 'error': "invalid method"}, 404)
+
+	def do_POST(self):
+		received = time.time()
+		self.server.mock.delay()
+		body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+		if urlparse.urlparse(self.path).path != "/tapi":
+			self.reply({'success': 0, 'error': "invalid method"}, 404)
+			return
+		self.reply(self.server.mock.privateAPI(body, self.headers.get("Key"), self.headers.get("Sign"), received))
+
+	def reply(self, data, status = 200):
+		body = json.dumps(data)
+		self.send_response(status)
+		self.send_header("Content-Type", "application/json")
+		self.send_header("Content-Length", str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, format, *args):
+		UtilzLog.info("Mock BTC-e: " + (format % args), 3)
+
+class BTCEHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+	daemon_threads = True
+	allow_reuse_address = True
+
+class BTCEServer(object):
+	"""
+	Local stand-in of the BTC-e API.
+
+	The public API replays a record (one tick per ticker request) and serves
+	a saved info file. The depth API serves order books built around the
+	current tick. The private API (getInfo, Trade, ActiveOrders) checks
+	the key, the HMAC signature and the nonce, and fills the trades
+	immediately at the requested rate. Latency and nonce errors can be
+	injected.
+
+	The time elapsed between the last ticker response and each trade request
+	is recorded, this is the tick-to-order latency seen by the server.
+	"""
+
+	def __init__(self, config = {}):
+		self.config = {
+			# Record replayed by the ticker (JSON or binary)
+			'record': None,
+			# Saved response of the info API
+			'info': None,
+			'apiKey': "key",
+			'apiSecret': "secret",
+			# Initial funds of the account
+			'funds': {
+				Currency.LTC: 100.,
+				Currency.BTC: 5.
+			},
+			# Latency added to each response, in seconds
+			'latency': 0.,
+			# Random latency added on top, in seconds
+			'jitter': 0.,
+			# Probability of rejecting a valid nonce
+			'nonceErrorRate': 0.,
+			# Order books served by the depth API: number of levels per side,
+			# rate spacing between the levels (relative) and amount of the best level
+			'depthLevels': 10,
+			'depthStep': 0.001,
+			'depthAmount': 0.1,
+			# Address and port to listen to, a port of 0 selects a free one
+			'host': "127.0.0.1",
+			'port': 0,
+			'seed': 0
+		}
+		self.config.update(config)
+		if self.config['record'] == None or self.config['info'] == None:
+			raise error("The mock BTC-e server needs a record and an info file.")
+		with open(self.config['info']) as f:
+			self.info = json.load(f)
+		self.random = random.Random(self.config['seed'])
+		self.lock = threading.Lock()
+		# Key of each pair from its currencies
+		self.pairKeys = {}
+		for key in ExchangeBTCE.SUPPORTED_PAIRS:
+			currencies = ExchangeBTCE.SUPPORTED_PAIRS[key]
+			self.pairKeys[str(currencies[0]) + str(currencies[1])] = key
+		# Record state
+		if RecordBinary.isBinary(self.config['record']):
+			self.recordReader = RecordBinaryReader(self.config['record'])
+			self.recordFile = None
+		else:
+			self.recordReader = None
+			self.recordFile = open(self.config['record'])
+		self.tickerData = {}
+		# Private API state
+		self.nonce = 0
+		self.funds = dict([(str(currency).lower(), amount) for currency, amount in self.config['funds'].items()])
+		self.orderId = 0
+		self.ticks = 0
+		self.lastTickTime = None
+		self.latencies = []
+		self.nonceErrors = 0
+		# Start the server
+		self.server = BTCEHTTPServer((self.config['host'], self.config['port']), BTCEServerHandler)
+		self.server.mock = self
+		self.thread = None
+
+	def getUrl(self):
+		"""
+		Returns the base URL of the server
+		"""
+		return "http://%s:%i" % self.server.server_address[:2]
+
+	def start(self):
+		"""
+		Serve the requests in a background thread
+		"""
+		self.thread = threading.Thread(target = self.server.serve_forever)
+		self.thread.daemon = True
+		self.thread.start()
+		return self
+
+	def stop(self):
+		self.server.shutdown()
+		self.server.server_close()
+
+	def getRecordLength(self):
+		"""
+		Returns the number of ticks of the record
+		"""
+		if self.recordReader != None:
+			reader = RecordBinaryReader(self.config['record'])
+			length = 0
+			while reader.next() != None:
+				length = length + 1
+			reader.close()
+			return length
+		with open(self.config['record']) as f:
+			return sum([1 for line in f if line.strip()])
+
+	def delay(self):
+		"""
+		Emulate the network and server latency
+		"""
+		latency = self.config['latency'] + self.random.random() * self.config['jitter']
+		if latency > 0:
+			time.sleep(latency)
+
+	def readTick(self):
+		"""
+		Read the next tick of the record into the ticker, returns False at the end of the record
+		"""
+		if self.recordReader != None:
+			values = self.recordReader.next()
+			if values == None:
+				return False
+			for i, pair in enumerate(self.recordReader.getPairs()):
+				# Undefined values are stored as NaN
+				data = dict([(column, value) for column, value in zip(RecordBinary.COLUMNS, values[i]) if value == value])
+				data['b'], data['q'] = pair
+				self.updateTicker(data)
+			return True
+		line = self.recordFile.readline()
+		if line == "":
+			return False
+		for data in json.loads(line):
+			self.updateTicker(data)
+		return True
+
+	def updateTicker(self, data):
+		key = self.pairKeys.get(str(data['b']) + str(data['q']))
+		if key == None:
+			return
+		if not self.tickerData.has_key(key):
+			self.tickerData[key] = {}
+		ticker = self.tickerData[key]
+		if data.has_key('bid'):
+			ticker['sell'] = data['bid']
+		if data.has_key('ask'):
+			ticker['buy'] = data['ask']
+		if data.has_key('avg'):
+			ticker['avg'] = data['avg']
+			ticker['last'] = data['avg']
+			ticker['high'] = data['avg']
+			ticker['low'] = data['avg']
+		if data.has_key('v'):
+			ticker['vol'] = data['v']
+			ticker['vol_cur'] = data['v'] * ticker.get('avg', 0.)
+		if data.has_key('t'):
+			ticker['updated'] = int(data['t'])
+
+	def ticker(self, keys):
+		"""
+		Returns the next tick for the requested pairs, None at the end of the record
+		"""
+		with self.lock:
+			if self.readTick() == False:
+				return None
+			self.ticks = self.ticks + 1
+			self.lastTickTime = time.time()
+			return dict([(key, self.tickerData[key]) for key in keys if self.tickerData.has_key(key)])
+
+	def depth(self, keys):
+		"""
+		Returns the order books of the requested pairs at the current tick, each
+		level being further from the best rate and holding more than the previous one
+		"""
+		depth = {}
+		with self.lock:
+			for key in keys:
+				if not self.tickerData.has_key(key):
+					continue
+				ticker = self.tickerData[key]
+				bids = []
+				asks = []
+				for i in range(self.config['depthLevels']):
+					amount = self.config['depthAmount'] * (i + 1)
+					if ticker.has_key('sell'):
+						bids.append([ticker['sell'] * (1. - self.config['depthStep'] * i), amount])
+					if ticker.has_key('buy'):
+						asks.append([ticker['buy'] * (1. + self.config['depthStep'] * i), amount])
+				depth[key] = {'bids': bids, 'asks': asks}
+		return depth
+
+	def privateAPI(self, body, key, sign, received = None):
+		"""
+		Process a request to the private API
+		\param received Time at which the request has been received
+		"""
+		if key != self.config['apiKey']:
+			return {'success': 0, 'error': "invalid api key"}
+		if sign != hmac.new(self.config['apiSecret'], body, digestmod = hashlib.sha512).hexdigest():
+			return {'success': 0, 'error': "invalid sign"}
+		params = dict(urlparse.parse_qsl(body))
+		with self.lock:
+			# Check the nonce
+			nonce = int(params.get('nonce', 0))
+			if nonce <= self.nonce or self.random.random() < self.config['nonceErrorRate']:
+				self.nonceErrors = self.nonceErrors + 1
+				return {'success': 0, 'error': "invalid nonce parameter; on key:%i, you sent:%i, you should send:%i" % (self.nonce, nonce, self.nonce + 1)}
+			self.nonce = nonce
+			method = params.get('method')
+			if method == "getInfo":
+				return {'success': 1, 'return': {'funds': dict(self.funds), 'open_orders': 0, 'server_time': int(time.time())}}
+			if method == "ActiveOrders":
+				# Orders are filled immediately
+				return {'success': 0, 'error': "no orders"}
+			if method == "Trade":
+				return self.trade(params, received)
+			return {'success': 0, 'error': "invalid method"}
+
+	def trade(self, params, received = None):
+		"""
+		Fill an order immediately at the requested rate
+		"""
+		if self.lastTickTime != None:
+			self.latencies.append((received or time.time()) - self.lastTickTime)
+		base, quote = params['pair'].split("_")
+		rate = float(params['rate'])
+		amount = float(params['amount'])
+		fee = self.info['pairs'][params['pair']]['fee'] / 100.
+		if params['type'] == "sell":
+			if self.funds.get(base, 0.) < amount:
+				return {'success': 0, 'error': "It is not enough %s in the account for sale." % (base.upper())}
+			self.funds[base] = self.funds.get(base, 0.) - amount
+			self.funds[quote] = self.funds.get(quote, 0.) + amount * rate * (1. - fee)
+		elif params['type'] == "buy":
+			if self.funds.get(quote, 0.) < amount * rate:
+				return {'success': 0, 'error': "It is not enough %s in the account for purchase." % (quote.upper())}
+			self.funds[quote] = self.funds.get(quote, 0.) - amount * rate
+			self.funds[base] = self.funds.get(base, 0.) + amount * (1. - fee)
+		else:
+			return {'success': 0, 'error': "invalid type"}
+		self.orderId = self.orderId + 1
+		return {'success': 1, 'return': {'received': amount, 'remains': 0, 'order_id': self.orderId, 'funds': dict(self.funds)}}
+
+	def getStats(self):
+		"""
+		Returns the statistics gathered by the server
+		"""
+		with self.lock:
+			return {
+				'ticks': self.ticks,
+				'trades': self.orderId,
+				'nonceErrors': self.nonceErrors,
+				'latencies': list(self.latencies)
+			}
+
+if __name__ == "__main__":
+
+	parser = argparse.ArgumentParser(description = "Local mock of the BTC-e API.")
+	parser.add_argument("record", help = "Record replayed by the ticker")
+	parser.add_argument("info", help = "Saved response of the exchange info API")
+	parser.add_argument("--port", type = int, default = 8080, help = "Port to listen to")
+	parser.add_argument("--latency", type = float, default = 0., help = "Latency added to each response in seconds")
+	parser.add_argument("--jitter", type = float, default = 0., help = "Random latency added on top in seconds")
+	parser.add_argument("--nonce-error-rate", type = float, default = 0., help = "Probability of rejecting a valid nonce")
+	args = parser.parse_args()
+
+	server = BTCEServer({
+		'record': args.record,
+		'info': args.info,
+		'port': args.port,
+		'latency': args.latency,
+		'jitter': args.jitter,
+		'nonceErrorRate': args.nonce_error_rate
+	})
+	print "Mock BTC-e server listening on %s" % (server.getUrl())
+	server.server.serve_forever()
@@ -0,0 +1,240 @@
+#!/usr/bin/python
+# -*- coding: iso-8859-1 -*-
+
+from benchmarks.synthetic import *
+from exchanges.port.btce import *
+from exchanges.orderUtilz import *
+from strategies.triangularArbitrage import *
+from utilz.log import *
+
+import argparse
+import json
+import platform
+import sys
+import time
+
+class HotPath(object):
+	"""
+	Microbenchmarks of the functions called on every iteration of the main loop.
+
+	Each benchmark is measured on a market (synthetic or recorded) and the
+	results, in seconds per call, can be saved as a baseline and compared
+	with a later run.
+	"""
+
+	def __init__(self, config = {}):
+		self.config = {
+			# Minimal duration of a measurement in seconds
+			'minTime': 0.2,
+			# Number of measurements, the best one is kept
+			'repeat': 3,
+			# Only run the benchmarks which name contains this string
+			'filter': None
+		}
+		self.config.update(config)
+
+	def measure(self, function):
+		"""
+		Returns the best time in seconds of a single call of a function
+		"""
+		# Find a number of calls lasting at least the minimal duration
+		number = 1
+		while True:
+			start = time.time()
+			for i in xrange(number):
+				function()
+			duration = time.time() - start
+			if duration >= self.config['minTime'] or number >= 10000000:
+				break
+			number = number * 10
+		best = duration
+		for r in range(self.config['repeat'] - 1):
+			start = time.time()
+			for i in xrange(number):
+				function()
+			best = min(best, time.time() - start)
+		return best / number
+
+	def measureSteps(self, function, step):
+		"""
+		Returns the median time in seconds of a call of a function, the step
+		function is called (and not measured) before each call.
+		Returns None if the step function returns False before any call.
+		"""
+		durations = []
+		total = 0.
+		while total < self.config['minTime'] * self.config['repeat']:
+			if step() == False:
+				break
+			start = time.time()
+			function()
+			duration = time.time() - start
+			durations.append(duration)
+			total = total + duration
+		if len(durations) == 0:
+			return None
+		return sorted(durations)[len(durations) // 2]
+
+	def getBenchmarks(self, exchange):
+		"""
+		Returns the list of benchmarks for an exchange, as [name, function, step]
+		"""
+		# Make sure the market is set
+		exchange.updatePairs()
+		algorithm = triangularArbitrage(exchange)
+		# Pick the first pair and order chain
+		pair = exchange.getPair(Currency.BTC, Currency.USD)
+		order = pair.orderSell(pair.getBid(), 1.)
+		chain = None
+		for currency in sorted(algorithm.orderBook):
+			if len(algorithm.orderBook[currency]):
+				chain = algorithm.orderBook[currency][0]['order']
+				break
+		# Set the rates of the order chain
+		chain.updateChain()
+		transaction = order.getTransaction()
+		rate = pair.getBid()
+		market = {
+			'bid': pair.getBid(),
+			'ask': pair.getAsk(),
+			'avg': pair.getAvg(),
+			'volume': pair.getVolume(),
+			'timestamp': pair.getTimestamp()
+		}
+		# Convertion of the balance to the reference currency
+		currencyRates = OrderUtilz.identifyCurrencyRates(exchange, Currency.USD)
+		balance = dict([(currency, 1.) for currency in exchange.currencyList()])
+
+		def preprocessStep():
+			# Move the market forward, the algorithm re-evaluates the cycles affected
+			return exchange.updatePairs()
+
+		return [
+			["Order.estimate", lambda: order.estimate(1.), None],
+			["Order.estimateChain", lambda: chain.estimateChain(1.), None],
+			["Order.floor", lambda: order.floor(1.23456789), None],
+			["Order.getInfo", lambda: order.getInfo(), None],
+			["Transaction.getFee", lambda: transaction.getFee(1.), None],
+			["Transaction.withinLimits", lambda: transaction.withinLimits(rate, 1.), None],
+			["ExchangePair.updatePair", lambda: pair.updatePair(market), None],
+			["OrderUtilz.estimateValue", lambda: OrderUtilz.estimateValue(balance, currencyRates), None],
+			["triangularArbitrage.preprocess", lambda: algorithm.preprocess(), preprocessStep]
+		]
+
+	def run(self, exchange, label):
+		"""
+		Run the benchmarks on an exchange, returns a dictionary of the times per call by name
+		"""
+		results = {}
+		for name, function, step in self.getBenchmarks(exchange):
+			name = "%s:%s" % (label, name)
+			if self.config['filter'] != None and self.config['filter'] not in name:
+				continue
+			if step == None:
+				result = self.measure(function)
+			else:
+				result = self.measureSteps(function, step)
+			if result == None:
+				continue
+			results[name] = result
+			UtilzLog.info("%s: %.3fus" % (name, result * 1000000), 1)
+		return results
+
+	@staticmethod
+	def save(filename, results):
+		"""
+		Save the results as a baseline
+		"""
+		with open(filename, 'w') as f:
+			json.dump({
+				'python': platform.python_version(),
+				'platform': platform.platform(),
+				'timestamp': int(time.time()),
+				'results': results
+			}, f, indent = 4, sort_keys = True)
+
+	@staticmethod
+	def load(filename):
+		"""
+		Load a baseline, returns the results
+		"""
+		with open(filename) as f:
+			return json.load(f)['results']
+
+	@staticmethod
+	def compare(baseline, results, threshold = 10.):
+		"""
+		Compare the results with a baseline.
+		Returns the report and the list of benchmarks which are slower than the
+		baseline by more than the threshold (in percent).
+		"""
+		regressions = []
+		stringList = ["benchmark\tbaseline\tcurrent\tchange"]
+		for name in sorted(set(baseline.keys() + results.keys())):
+			if not results.has_key(name):
+				stringList.append("%s\t%.3fus\t-\tmissing" % (name, baseline[name] * 1000000))
+				continue
+			if not baseline.has_key(name):
+				stringList.append("%s\t-\t%.3fus\tnew" % (name, results[name] * 1000000))
+				continue
+			change = (results[name] / baseline[name] - 1.) * 100 if baseline[name] > 0 else 0.
+			status = ""
+			if change > threshold:
+				status = "\tREGRESSION"
+				regressions.append(name)
+			elif change < -threshold:
+				status = "\timproved"
+			stringList.append("%s\t%.3fus\t%.3fus\t%+.1f%%%s" % (name, baseline[name] * 1000000, results[name] * 1000000, change, status))
+		return "\n".join(stringList), regressions
+
+	@staticmethod
+	def printResults(results):
+		"""
+		Print the results as a table
+		"""
+		stringList = ["benchmark\ttime"]
+		for name in sorted(results):
+			stringList.append("%s\t%.3fus" % (name, results[name] * 1000000))
+		return "\n".join(stringList)
+
+if __name__ == "__main__":
+
+	parser = argparse.ArgumentParser(description = "Microbenchmarks of the order and estimate hot path.")
+	parser.add_argument("--record", default = None, help = "Also run the benchmarks on a recorded market (requires --info)")
+	parser.add_argument("--info", default = None, help = "Saved response of the exchange info API")
+	parser.add_argument("--save", default = None, help = "Save the results as a baseline into this file")
+	parser.add_argument("--compare", default = None, help = "Compare the results with this baseline")
+	parser.add_argument("--threshold", type = float, default = 10., help = "Slowdown in percent reported as a regression")
+	parser.add_argument("--min-time", type = float, default = 0.2, help = "Minimal duration of a measurement in seconds")
+	parser.add_argument("--filter", default = None, help = "Only run the benchmarks which name contains this string")
+	args = parser.parse_args()
+
+	UtilzLog.setVerbosity(0)
+	UtilzLog.addPreset("opportunity", {
+		'loggingType': "info",
+		'defaultLevel': 1
+	})
+
+	h = HotPath({
+		'minTime': args.min_time,
+		'filter': args.filter
+	})
+	results = h.run(ExchangeSynthetic(), "synthetic")
+	if args.record != None:
+		if args.info == None:
+			raise error("A recorded market requires the exchange info, please use --info.")
+		results.update(h.run(ExchangeBTCE({'recordRead': args.record, 'info': args.info}), "recorded"))
+
+	if args.compare != None:
+		baseline = HotPath.load(args.compare)
+		# Only compare the benchmarks which have been run
+		if args.filter != None:
+			baseline = dict([(name, baseline[name]) for name in baseline if args.filter in name])
+		report, regressions = HotPath.compare(baseline, results, args.threshold)
+		print report
+	else:
+		print HotPath.printResults(results)
+		regressions = []
+	if args.save != None:
+		HotPath.save(args.save, results)
+	sys.exit(1 if len(regressions) > 0 else 0)
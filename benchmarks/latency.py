@@ -0,0 +1,135 @@
+#!/usr/bin/python
+# -*- coding: iso-8859-1 -*-
+
+from benchmarks.btceServer import *
+from backtest import ALGORITHMS
+from bot import *
+
+import argparse
+import json
+import time
+
+def percentile(values, percent):
+	"""
+	Returns the percentile of a sorted list of values
+	"""
+	if len(values) == 0:
+		return 0.
+	return values[min(len(values) - 1, int(len(values) * percent / 100.))]
+
+def runLatency(config):
+	"""
+	Run the bot against the mock BTC-e server and returns the latency measurements
+	"""
+	server = BTCEServer({
+		'record': config['record'],
+		'info': config['info'],
+		'latency': config['latency'],
+		'jitter': config['jitter'],
+		'nonceErrorRate': config['nonceErrorRate']
+	}).start()
+	try:
+		# Set the parameters of the algorithms
+		for name in config['parameters']:
+			algorithm, attribute = name.split(".")
+			setattr(ALGORITHMS[algorithm], attribute, config['parameters'][name])
+		# By default replay the whole record, one tick is used to initialize the bot
+		ticks = config['ticks']
+		if ticks == None:
+			ticks = server.getRecordLength() - 1
+		# The orders are sent to the mock server
+		exchange = ExchangeBTCE({
+			'apiUrl': server.getUrl(),
+			'apiKey': server.config['apiKey'],
+			'apiSecret': server.config['apiSecret'],
+			'depth': config.get('depth', False),
+			'scheduler': config.get('scheduler', False),
+			'context': TradingContext(simulation = False)
+		})
+		b = Bot({
+			'exchanges': [exchange],
+			'algorithms': [ALGORITHMS[name] for name in config['algorithms']],
+			'debug': False,
+			'display': False,
+			'pipeline': config.get('pipeline', False),
+			'maxTicks': ticks
+		})
+		start = time.time()
+		b.run()
+		duration = time.time() - start
+	finally:
+		server.stop()
+
+	stats = server.getStats()
+	latencies = sorted(stats['latencies'])
+	timings = b.getTimings()[0]
+	return {
+		'ticks': stats['ticks'],
+		'trades': stats['trades'],
+		'nonceErrors': stats['nonceErrors'],
+		'duration': duration,
+		'tickToOrder': {
+			'min': latencies[0] if latencies else 0.,
+			'avg': sum(latencies) / len(latencies) if latencies else 0.,
+			'p50': percentile(latencies, 50),
+			'p90': percentile(latencies, 90),
+			'p99': percentile(latencies, 99),
+			'max': latencies[-1] if latencies else 0.
+		},
+		'updatePairs': timings.get('updatePairs'),
+		'tickToTrade': timings.get('tickToTrade')
+	}
+
+def printLatency(result):
+	"""
+	Print the latency measurements
+	"""
+	stringList = [
+		"Ticks: %i (%.1f ticks/s), trades: %i, nonce errors: %i" % (result['ticks'], result['ticks'] / result['duration'] if result['duration'] > 0 else 0., result['trades'], result['nonceErrors']),
+		"Tick-to-order latency: min:%.1fms avg:%.1fms p50:%.1fms p90:%.1fms p99:%.1fms max:%.1fms" % tuple([result['tickToOrder'][key] * 1000 for key in ['min', 'avg', 'p50', 'p90', 'p99', 'max']]),
+	]
+	for name, label in [['updatePairs', "Pair update time"], ['tickToTrade', "Tick-to-trade (bot side)"]]:
+		if result[name] != None and result[name]['count']:
+			stringList.append("%s: p50:%.1fms p90:%.1fms p99:%.1fms max:%.1fms" % tuple([label] + [result[name][key] * 1000 for key in ['p50', 'p90', 'p99', 'max']]))
+	return "\n".join(stringList)
+
+if __name__ == "__main__":
+
+	parser = argparse.ArgumentParser(description = "Measure the tick-to-order latency of the bot against a mock BTC-e server.")
+	parser.add_argument("record", help = "Record replayed by the mock server")
+	parser.add_argument("info", help = "Saved response of the exchange info API")
+	parser.add_argument("--ticks", type = int, default = None, help = "Maximum number of ticks, the whole record by default")
+	parser.add_argument("--latency", type = float, default = 0., help = "Latency added to each response in seconds")
+	parser.add_argument("--jitter", type = float, default = 0., help = "Random latency added on top in seconds")
+	parser.add_argument("--nonce-error-rate", type = float, default = 0., help = "Probability of rejecting a valid nonce")
+	parser.add_argument("--param", action = "append", default = [], help = "Algorithm parameter, formatted as `algorithm.ATTRIBUTE=value'")
+	parser.add_argument("--algorithms", default = "triangularArbitrage", help = "Comma separated list of algorithms")
+	parser.add_argument("--depth", action = "store_true", help = "Fetch the order books and size the trades from the depth")
+	parser.add_argument("--scheduler", action = "store_true", help = "Fetch the pairs with the adaptive scheduler")
+	parser.add_argument("--pipeline", action = "store_true", help = "Run the bot in pipeline mode")
+	parser.add_argument("--json", default = None, help = "Save the measurements into this file")
+	args = parser.parse_args()
+
+	UtilzLog.setVerbosity(0)
+	parameters = {}
+	for param in args.param:
+		name, value = param.split("=", 1)
+		parameters[name] = int(value) if value.isdigit() else float(value)
+
+	result = runLatency({
+		'record': args.record,
+		'info': args.info,
+		'ticks': args.ticks,
+		'latency': args.latency,
+		'jitter': args.jitter,
+		'nonceErrorRate': args.nonce_error_rate,
+		'parameters': parameters,
+		'algorithms': args.algorithms.split(","),
+		'depth': args.depth,
+		'scheduler': args.scheduler,
+		'pipeline': args.pipeline
+	})
+	print printLatency(result)
+	if args.json != None:
+		with open(args.json, 'w') as f:
+			json.dump(result, f, indent = 4)
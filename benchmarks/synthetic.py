@@ -0,0 +1,98 @@
+#!/usr/bin/python
+# -*- coding: iso-8859-1 -*-
+
+from exchanges.exchange import *
+from exchanges.exchangepair import *
+from exchanges.transaction import *
+from exchanges.currency import *
+from exchanges.port.btce import *
+
+import random
+
+class ExchangeSynthetic(Exchange):
+	"""
+	Exchange generating a synthetic market, used by the benchmarks.
+
+	It has the pairs of BTC-e, with the same kind of fees and limits. Each
+	update moves the mid price of the currencies with a seeded random walk,
+	so that the runs are reproducible without any network access.
+	"""
+	# Initial value of the currencies in USD
+	VALUES = {
+		Currency.BTC: 250.,
+		Currency.LTC: 2.,
+		Currency.NMC: 0.6,
+		Currency.NVC: 1.4,
+		Currency.PPC: 0.4,
+		Currency.USD: 1.,
+		Currency.EUR: 1.136,
+		Currency.RUR: 1. / 64,
+		Currency.CNH: 0.16,
+		Currency.GBP: 1.5
+	}
+
+	def initialize(self):
+		self.context["name"] = "Synthetic"
+		self.random = random.Random(self.config.get('seed', 0))
+		# Probability of a currency value to change at each update
+		self.changeRate = self.config.get('changeRate', 0.3)
+		self.values = dict(self.VALUES)
+		self.timestamp = 1000
+		self.pairKeys = []
+		for key in sorted(ExchangeBTCE.SUPPORTED_PAIRS):
+			baseCurrency, quoteCurrency = ExchangeBTCE.SUPPORTED_PAIRS[key]
+			if not self.values.has_key(baseCurrency) or not self.values.has_key(quoteCurrency):
+				continue
+			maxDecimal = 5 if self.values[baseCurrency] / self.values[quoteCurrency] < 10 else 3
+			self.pairAdd(ExchangePair({
+					'baseCurrency': baseCurrency,
+					'quoteCurrency': quoteCurrency,
+					'sell': Transaction({
+						'fees': [{'percentage': 0.2}],
+						'limits': {
+							'minRate': 0.00001,
+							'maxRate': 100000,
+							'minAmount': 0.01,
+							'maxDecimal': maxDecimal
+						},
+						'time': {
+							'effective': 1,
+							'completed': 2
+						}}),
+					'buy': Transaction({
+						'fees': [{'percentage': 0.2}],
+						'limits': {
+							'minRate': 1. / 100000,
+							'maxRate': 1. / 0.00001,
+							'minValue': 0.01,
+							'maxDecimal': maxDecimal
+						},
+						'time': {
+							'effective': 1,
+							'completed': 2
+						}})
+				}, key)
+			)
+			self.pairKeys.append([baseCurrency, quoteCurrency])
+
+	def updatePairsPort(self):
+		"""
+		Move the market one step forward
+		"""
+		self.timestamp = self.timestamp + 1
+		for currency in sorted(self.values):
+			if currency != Currency.USD and self.random.random() < self.changeRate:
+				self.values[currency] = self.values[currency] * (1 + self.random.gauss(0, 0.003))
+		for baseCurrency, quoteCurrency in self.pairKeys:
+			mid = self.values[baseCurrency] / self.values[quoteCurrency]
+			self.pairUpdate(baseCurrency, quoteCurrency, {
+				'bid': mid * 0.999,
+				'ask': mid * 1.001,
+				'avg': mid,
+				'volume': 10.,
+				'timestamp': self.timestamp
+			})
+		self.setTimestamp(self.timestamp)
+
+	def updateBalancePort(self):
+		pass
@@ -6,6 +6,7 @@ from exchanges.currency import *
 from exchanges.transaction import *
 from exchanges.orderUtilz import *
 from utilz.data import UtilzData
+from utilz.pool import UtilzConnectionPool
 from utilz.log import *
 from utilz.object import *
 from strategies.triangularArbitrage import *
@@ -92,6 +93,10 @@ if __name__ == "__main__":
 
 	# Set the proxy if needed
 	#UtilzData.setProxy({'http': 'http://squid.norway.atmel.com:3128', 'https': 'http://squid.norway.atmel.com:3128'})
+	# Configure the persistent connections used to fetch the data
+	#UtilzData.setPool(UtilzConnectionPool({'size': 4, 'timeout': 5, 'gzip': True}))
+	# Floor the rates and amounts on their decimal representation, as the exchange does
+	#Quantizer.setExact(True)
 	# Set the verbosity level
 	UtilzLog.setVerbosity(3)
 
@@ -104,10 +109,17 @@ if __name__ == "__main__":
 #	exit()
 
 	#config = {'recordWrite': ("records/%s-%s-btce.txt" % (time.strftime("%Y.%m.%d"), time.strftime("%H.%M.%S")))}
+	#config = {'recordWrite': ("records/%s-%s-btce.rec" % (time.strftime("%Y.%m.%d"), time.strftime("%H.%M.%S"))), 'recordFormat': "binary"}
 	#config = {'recordRead': "../bitcoin_arbitrage_records/2015.01.22-14.16.48-btce-+0.08%.txt"}
 	config = {}
 	config['apiKey'] = BTCE_APIKEY
 	config['apiSecret'] = BTCE_APISECRET
+	# Keep the balances and estimates in fixed point, free of floating point drift
+	#config['fixedPoint'] = True
+	# Fetch the order books to size the trades from the depth of the market
+	#config['depth'] = True
+	# Poll the pairs at an adaptive interval instead of fetching them all at each iteration
+	#config['scheduler'] = {'maxRequestRate': 5}
 
 	btce = ExchangeBTCE(config)
 
@@ -5,7 +5,11 @@ from utilz.log import *
 from exchanges.exchange import *
 from exchanges.currency import *
 from exchanges.orderUtilz import *
+from utilz.mailbox import *
+from utilz.metrics import *
 
+import Queue
+import json
 import sys
 import time
 import threading
@@ -14,8 +18,6 @@ class Bot(object):
 
 	# Initial identifier
 	ID = 0
-	# Default structure containing the different timings
-	time = []
 	# Default timestamp
 	initTimestamp = 0
 
@@ -38,7 +40,23 @@ class Bot(object):
 			'exchanges': [],
 			'algorithms': [],
 			# Debug flag, by default is true
-			'debug': True
+			'debug': True,
+			# Run the display thread
+			'display': True,
+			# Interval in seconds between the balance updates, and of the display
+			'displayInterval': 1.,
+			# Poll the exchanges concurrently, each exchange being handled by its own thread
+			'concurrent': False,
+			# Run each exchange as a pipeline of threads: market data ingestion,
+			# strategies and order execution, see runPipeline
+			'pipeline': False,
+			# Maximum number of order lists waiting for the execution stage
+			'executionQueueSize': 4,
+			# Stop after this number of iterations of the main loop, never if None
+			'maxTicks': None,
+			# Serve the metrics (/metrics) and the statistics (/stats) over HTTP,
+			# set to a dictionary with the `host' and `port' of the server to enable it
+			'metrics': None
 		}
 		self.config.update(config)
 		# Pimp the logging
@@ -61,6 +79,13 @@ class Bot(object):
 		# Set the Bot ID
 		Bot.ID = Bot.ID + 1
 		self.identifier = Bot.ID
+		# All the exchanges must share the same trading context
+		self.tradingContext = None
+		for ex in self.config['exchanges']:
+			if self.tradingContext == None:
+				self.tradingContext = ex.getTradingContext()
+			elif self.tradingContext != ex.getTradingContext():
+				raise error("The exchange `%s' does not share the trading context of the other exchanges." % (ex.getName()))
 		# Set the timestamp
 		self.initTimestamp = time.time()
 		# Initialize the bot
@@ -79,7 +104,11 @@ class Bot(object):
 		for ex in self.config['exchanges']:
 			exchange = {
 				'exchange': ex,
-				'algorithms': []
+				'algorithms': [],
+				# Number of iterations of the main loop
+				'ticks': 0,
+				# Number of iterations which did not bring any change
+				'skippedTicks': 0
 			}
 			self.context.append(exchange)
 
@@ -123,6 +152,10 @@ class Bot(object):
 					pair = pairList[quoteCurrency]
 					pair.getTransaction('sell').withinLimits(pair.getBid(), self.tradeAmount[baseCurrency]['amount'])
 
+		UtilzLog.info("Recover the orders from the journal (if any)", 1)
+		for ex in self.context:
+			ex['exchange'].journalRecover()
+
 		UtilzLog.info("Update the orders (if any)", 1)
 		for ex in self.context:
 			ex['exchange'].updateOrders()
@@ -136,6 +169,7 @@ class Bot(object):
 			value = OrderUtilz.estimateValue(ex['exchange'].getTotalBalance(), ex['orderBaseCurrency'])
 			# Store the initial value of the balance
 			ex['initialValue'] = value
+			self.publishSnapshot(ex)
 			stringList.append("`%s': %f %s" % (ex['exchange'].getName(), value, self.config['trade']['currency']))
 		UtilzLog.info(", ".join(stringList), 1)
 
@@ -145,47 +179,199 @@ class Bot(object):
 				UtilzLog.info("Initializing `%s' for `%s'" % (algorithm.__name__, exchange['exchange'].getName()), 1)
 				exchange['algorithms'].append(algorithm(exchange['exchange']))
 
+	def estimateValue(self, ex):
+		"""
+		Estimates the value of the balance of an exchange in the reference currency
+		"""
+		return OrderUtilz.estimateValue(ex['exchange'].getTotalBalance(), ex['orderBaseCurrency'])
+
+	def getResults(self):
+		"""
+		Return the results of the bot for each exchanges
+		"""
+		results = []
+		for ex in self.context:
+			value = self.estimateValue(ex)
+			results.append({
+				'exchange': ex['exchange'].getName(),
+				'initialValue': ex['initialValue'],
+				'value': value,
+				'gainPercent': (value * 1. / ex['initialValue'] - 1.) * 100 if ex['initialValue'] > 0 else 0.,
+				'trades': ex['exchange'].getTradeCount(),
+				'ticks': ex['ticks']
+			})
+		return results
+
+	def publishSnapshot(self, ex):
+		"""
+		Publish the snapshot of the balance, the rates and the active orders of
+		an exchange, read by the display and the metrics. It must be called by
+		the thread trading on this exchange: the value estimate updates the
+		conversion orders. A new snapshot is created each time, it is never
+		modified once published.
+		"""
+		exchange = ex['exchange']
+		orderList = []
+		for order in self.tradingContext.getActiveList(exchange):
+			orderList.append([order.getId(), order.getStatus(), order.printOrder()])
+		rates = {}
+		for currency in exchange.currencyList():
+			pairList = exchange.getPair(currency)
+			for quoteCurrency in pairList:
+				rates["%s/%s" % (currency, quoteCurrency)] = [pairList[quoteCurrency].getBid(), pairList[quoteCurrency].getAsk()]
+		ex['snapshot'] = {
+			'time': time.time(),
+			'name': exchange.getName(),
+			'timestamp': exchange.getTimestamp(),
+			'currencyList': exchange.currencyList(),
+			'balance': exchange.getBalance().copy(),
+			'placedBalance': exchange.getPlacedBalance(),
+			'totalBalance': exchange.getTotalBalance(),
+			'value': self.estimateValue(ex),
+			'rates': rates,
+			'orders': orderList
+		}
+
+	def refreshSnapshot(self, ex):
+		"""
+		Apply the balance fetched by taskUpdateBalance, if any, and publish a new
+		snapshot of an exchange if the previous one is older than the display
+		interval. Nothing is fetched from the exchange.
+		"""
+		if not self.config['display'] and self.config['metrics'] == None:
+			return
+		data = ex.pop('balanceData', None)
+		if data != None:
+			ex['exchange'].updateBalance(data)
+		if ex.has_key('snapshot') and time.time() - ex['snapshot']['time'] < self.config['displayInterval']:
+			return
+		self.publishSnapshot(ex)
+
 	def printBalance(self):
 		"""
-		Print the walet balance
+		Print the walet balance, from the snapshots
 		"""
 		string = ""
 		for ex in self.context:
-			value = OrderUtilz.estimateValue(ex['exchange'].getTotalBalance(), ex['orderBaseCurrency'])
+			if not ex.has_key('snapshot'):
+				continue
+			snapshot = ex['snapshot']
 			# Estimated balance
-			stringBalance = "%f %s" % (value, self.config['trade']['currency'])
+			stringBalance = "%f %s" % (snapshot['value'], self.config['trade']['currency'])
 			# Progress only if the initial balance is greater than 0
 			if ex['initialValue'] > 0:
-				stringBalance = "%s (%+.2f%%)" % (stringBalance, (value * 1. / ex['initialValue'] - 1.) * 100)
+				stringBalance = "%s (%+.2f%%)" % (stringBalance, (snapshot['value'] * 1. / ex['initialValue'] - 1.) * 100)
 			# Print the Balance
-			string = string + "`%s' at t=%i - Total estimated value %s\n%s\n" % (ex['exchange'].getName(), ex['exchange'].getTimestamp(), stringBalance, ex['exchange'].printBalance())
+			string = string + "`%s' at t=%i (%.1fs ago) - Total estimated value %s\n%s\n" % (snapshot['name'], snapshot['timestamp'], time.time() - snapshot['time'], stringBalance,
+					Exchange.printBalanceList(snapshot['currencyList'], snapshot['balance'], snapshot['placedBalance']))
 		return string
 
+	def getTimings(self):
+		"""
+		Returns the snapshot of the timing histograms of each exchange
+		"""
+		return [ex['exchange'].getStats().getSnapshot() for ex in self.context]
+
 	def printTimings(self):
 		"""
 		Print the timings of the different entities monitored
 		"""
 		string = ""
-		for iEx, t in enumerate(self.time):
-			ex = self.context[iEx]
+		for ex in self.context:
 			name = ex['exchange'].getName()
-			string = string + "`%s' Total execution time: %.1fms (min:%.1fms; max:%.1fms)\n" % (name, t['loop']['current'] * 1000, t['loop']['min'] * 1000, t['loop']['max'] * 1000)
-			string = string + "`%s' Pair update execution time: %.1fms (min:%.1fms; max:%.1fms)\n" % (name, t['updatePairs']['current'] * 1000, t['updatePairs']['min'] * 1000, t['updatePairs']['max'] * 1000)
-			for i in range(0, len(t['algorithms'])):
-				string = string + "`%s' Algorithm `%s' execution time: %.1fms (min:%.1fms; max:%.1fms)\n" % (name, ex['algorithms'][i].__class__.__name__, t['algorithms'][i]['current'] * 1000, t['algorithms'][i]['min'] * 1000, t['algorithms'][i]['max'] * 1000)
+			report = ex['exchange'].getStats().printReport("`%s' " % (name))
+			if report:
+				string = string + report + "\n"
+			if ex.has_key('pipeline'):
+				count, coalesced = ex['pipeline']['snapshots'].getCount()
+				string = string + "`%s' Snapshots: %i (%i coalesced); orders waiting for execution: %i\n" % (name, count, coalesced, ex['pipeline']['orders'].qsize())
+			scheduler = ex['exchange'].getScheduler()
+			if scheduler != None:
+				string = string + "`%s' %s; skipped ticks: %i/%i\n" % (name, scheduler.printFreshness(), ex['skippedTicks'], ex['ticks'])
 		return string
 
+	def getMetrics(self):
+		"""
+		Returns the statistics of the bot for each exchange: counters, balance,
+		estimated value and latency histograms. The balance and the value are
+		the ones of the last snapshot published.
+		"""
+		exchangeList = []
+		for ex in self.context:
+			exchange = ex['exchange']
+			snapshot = ex.get('snapshot', {})
+			exchangeList.append({
+				'name': exchange.getName(),
+				'ticks': ex['ticks'],
+				'skippedTicks': ex['skippedTicks'],
+				'trades': exchange.getTradeCount(),
+				'activeOrders': len(snapshot.get('orders', [])),
+				'counters': exchange.getStats().getCounters(),
+				'balance': snapshot.get('totalBalance', {}),
+				'currency': self.config['trade']['currency'],
+				'initialValue': ex.get('initialValue'),
+				'value': snapshot.get('value'),
+				'snapshotAge': time.time() - snapshot['time'] if snapshot else None,
+				'latencies': exchange.getStats().getSnapshot()
+			})
+		return {
+			'bot': self.identifier,
+			'uptime': time.time() - self.initTimestamp,
+			'exchanges': exchangeList
+		}
+
+	def printMetrics(self):
+		"""
+		Print the metrics of the bot in the Prometheus text format
+		"""
+		data = self.getMetrics()
+		metrics = UtilzMetrics("bot_")
+		metrics.declare("uptime_seconds", UtilzMetrics.GAUGE, "Time since the bot started")
+		metrics.add("uptime_seconds", [], data['uptime'])
+		for ex in data['exchanges']:
+			labels = [["exchange", ex['name']]]
+			for key in ['ticks', 'skippedTicks', 'trades']:
+				name = UtilzMetrics.toName(key) + "_total"
+				metrics.declare(name, UtilzMetrics.COUNTER, "Number of %s" % (UtilzMetrics.toName(key).replace("_", " ")))
+				metrics.add(name, labels, ex[key])
+			# Counters of the exchange, `orders.placed' being bot_orders_total{type="placed"}
+			for key in sorted(ex['counters']):
+				family = key.split(".", 1)
+				name = UtilzMetrics.toName(family[0]) + "_total"
+				metrics.declare(name, UtilzMetrics.COUNTER, "Number of %s" % (UtilzMetrics.toName(family[0]).replace("_", " ")))
+				metrics.add(name, labels + ([["type", family[1]]] if len(family) > 1 else []), ex['counters'][key])
+			metrics.declare("active_orders", UtilzMetrics.GAUGE, "Number of active orders")
+			metrics.add("active_orders", labels, ex['activeOrders'])
+			metrics.declare("balance", UtilzMetrics.GAUGE, "Balance of each currency, including the amounts in the orders")
+			for currency in sorted(ex['balance']):
+				metrics.add("balance", labels + [["currency", currency]], ex['balance'][currency])
+			for key in ['initialValue', 'value']:
+				name = "estimated_" + UtilzMetrics.toName(key)
+				metrics.declare(name, UtilzMetrics.GAUGE, "Estimated %s of the balance in the reference currency" % (UtilzMetrics.toName(key).replace("_", " ")))
+				metrics.add(name, labels + [["currency", ex['currency']]], ex[key])
+			metrics.declare("latency_seconds", UtilzMetrics.SUMMARY, "Wall clock duration of each stage")
+			for stage in sorted(ex['latencies']):
+				snapshot = ex['latencies'][stage]
+				stageLabels = labels + [["stage", stage]]
+				for key, percent in UtilzStats.PERCENTILES:
+					metrics.add("latency_seconds", stageLabels + [["quantile", str(percent / 100.)]], snapshot[key])
+				metrics.add("latency_seconds", stageLabels, snapshot['sum'], "_sum")
+				metrics.add("latency_seconds", stageLabels, snapshot['count'], "_count")
+		return metrics.toText()
+
 	def printOrders(self):
 		"""
-		Display the current active orders
+		Display the current active orders, from the snapshots
 		"""
 		def cap(s, l):
 			return s if len(s) <= l else s[0:l]
 
 		stringList = []
-		for order in Order.getActiveList():
-			exchange = order.pair.getExchange()
-			stringList.append("`%s'\tid:%s\t%s\t\t%s" % (exchange.getName(), str(order.getId()), cap(str(order.getStatus()), 7), order.printOrder()))
+		for ex in self.context:
+			if not ex.has_key('snapshot'):
+				continue
+			for orderId, status, description in ex['snapshot']['orders']:
+				stringList.append("`%s'\tid:%s\t%s\t\t%s" % (ex['snapshot']['name'], str(orderId), cap(str(status), 7), description))
 		if len(stringList) > 0:
 			return "Active Orders:\n%s\n" % ("\n".join(stringList))
 		else:
@@ -193,162 +379,431 @@ class Bot(object):
 
 	def taskBalance(self):
 		"""
-		This tasks takes care of the balance and print it
+		This tasks prints the balance, the timings and the active orders.
+		It only reads the snapshots published by the trading threads.
 		"""
 		while True:
-
-			# Update the exchanges
-			try:
-				for ex in self.context:
-					ex['exchange'].updateBalance()
-			except:
-				UtilzLog.display("Error while fetching the balance")
-
-			# Guards if the display has an issue due to some concurent data access
-			try:
-				# Print info about the bot
-				m, s = divmod(time.time() - self.initTimestamp, 60)
-				h, m = divmod(m, 60)
-				string = "Bot Id: %i (%d:%02d:%02d)\n" % (self.identifier, h, m, s)
-				# Print the execution time
-				string = string + self.printTimings()
-				# Print the balance
-				string = string + self.printBalance()
-				# Print the actie orders
-				string = string + self.printOrders()
-			except:
-				UtilzLog.display("Error while printing the display")
+			# Print info about the bot
+			m, s = divmod(time.time() - self.initTimestamp, 60)
+			h, m = divmod(m, 60)
+			string = "Bot Id: %i (%d:%02d:%02d)\n" % (self.identifier, h, m, s)
+			# Print the execution time
+			string = string + self.printTimings()
+			# Print the balance
+			string = string + self.printBalance()
+			# Print the actie orders
+			string = string + self.printOrders()
 
 			# Print the displayed info
 			UtilzLog.display(string)
 
-			# Sleep time to update the balance only from time to time
-			time.sleep(1)
-
-	def run(self):
-
-		# Start the balance thread
-		t = threading.Thread(target = self.taskBalance)
-		t.daemon = True
-		t.start()
-
-		# Initialize the timing reports
-		self.time = []
+			time.sleep(self.config['displayInterval'])
 
-		# Forever loop
+	def taskUpdateBalance(self):
+		"""
+		This task fetches the balance of the exchanges at the display interval,
+		so that the trading threads never wait for it. The data are applied by
+		the thread trading on each exchange, see refreshSnapshot, and dropped
+		if the balance has changed in the meantime.
+		"""
 		while True:
+			for ex in self.context:
+				try:
+					data = ex['exchange'].fetchBalance()
+				except Exception as e:
+					UtilzLog.warning("`%s' Error while fetching the balance: %s" % (ex['exchange'].getName(), str(e)))
+					continue
+				if data != None:
+					ex['balanceData'] = data
+			time.sleep(self.config['displayInterval'])
 
-			#self.printBalance()
-
-
-			# Update the exchanges
-			for iEx, ex in enumerate(self.context):
+	def getAmountList(self, ex, reserved = {}):
+		"""
+		Build the list of amounts available for trading on an exchange
+		This depends on the minimal balance and recommanded amount
+		\param reserved Amounts of each currency used by orders which are not executed yet
+		"""
+		balance = ex['exchange'].getBalance()
+		amountList = {}
+		for currency in balance:
+			# Ignore if this curreny is not handled in the exchanged (this happens if a pair has stopped)
+			if currency not in ex['exchange'].currencyList():
+				continue
+			totalAmount = balance[currency] - reserved.get(currency, 0.)
+			# Ignore if there is not enough balance on this pair
+			if totalAmount < self.tradeAmount[currency]['minBalance']:
+				continue
+			# Get the amount we want to trade
+			amount = min(totalAmount, self.tradeAmount[currency]['amount'])
+			# If the amount left is bellow the minimal amount, use everything
+			if totalAmount <= amount + self.tradeAmount[currency]['minBalance']:
+				amount = totalAmount
+			amountList[currency] = amount
+		return amountList
+
+	def reserveAmounts(self, ex, orderList, release = False):
+		"""
+		Reserve the amounts of an order list waiting for the execution stage of
+		the pipeline, so that they are not used again by the strategies, or
+		release them once the orders are executed. The lock of the exchange
+		must be held.
+		"""
+		reserved = ex['pipeline']['reserved']
+		for order in orderList:
+			currency = order.getAmountCurrency()
+			reserved[currency] = reserved.get(currency, 0.) + (-order.getAmount() if release else order.getAmount())
 
-				# If this is the first time
-				if len(self.time) == 0:
-					timings = {
-						'algorithms': [],
-						'updatePairs': {
-							'min': sys.maxint,
-							'max': 0.,
-							'current': 0.
-						},
-						'loop': {
-							'min': sys.maxint,
-							'max': 0.,
-							'current': 0.
+	def tick(self, iEx, ex):
+		"""
+		Run one iteration of the main loop for an exchange: refresh the orders and the pairs,
+		then run the algorithms and execute the orders of the first opportunity found.
+		Returns False if the exchange has no more pairs to update or has reached the maximum
+		number of iterations, True otherwise.
+		"""
+		stats = ex['exchange'].getStats()
+		timeLoop = time.time()
+
+		# Default value for the order
+		order = None
+
+		# Stop if the maximum number of iterations is reached
+		if self.config['maxTicks'] != None and ex['ticks'] >= self.config['maxTicks']:
+			return False
+
+		# Fetch data from the outer space
+		try:
+			# If there are pending orders
+			if self.tradingContext.getActiveCount(ex['exchange']) > 0:
+				# Update the orders
+				ex['exchange'].updateOrders()
+			# Update the exchange pairs (rates)
+			timePairs = time.time()
+			# Check if this is the last update available, this should only happens when
+			if ex['exchange'].updatePairs() == False:
+				return False
+			stats.record("updatePairs", time.time() - timePairs)
+			ex['ticks'] = ex['ticks'] + 1
+
+			# With a fetch scheduler, nothing to do if the pairs have not changed
+			if ex['exchange'].getScheduler() != None and len(ex['exchange'].getChangedPairs()) == 0:
+				ex['skippedTicks'] = ex['skippedTicks'] + 1
+				return True
+
+			# Build the list of amounts available for trading
+			amountList = self.getAmountList(ex)
+
+			# Run the algorithm
+			for algo in ex['algorithms']:
+
+				start = time.time()
+				orderList = algo.process(amountList)
+				stats.record("algorithm.%s" % (algo.__class__.__name__), time.time() - start)
+
+				# Check if there is an opportunity
+				if orderList != None:
+					stats.increment("opportunities")
+					# Execute the orders
+					for order in orderList:
+						result = order.execute()
+					break
+
+		except Exception as e:
+			UtilzLog.error(str(e))
+			if self.config['debug'] == True:
+				raise
+			return True
+
+		# Total loop time
+		stats.record("loop", time.time() - timeLoop)
+
+		return True
+
+	def taskExchange(self, iEx, ex, state):
+		"""
+		This task runs the main loop of a single exchange, used in concurrent mode.
+		It stops as soon as one of the exchanges has no more pairs to update or an error occured.
+		"""
+		try:
+			while not state['stop'].is_set():
+				if self.tick(iEx, ex) == False:
+					state['finished'].append(ex)
+					break
+				self.refreshSnapshot(ex)
+		except:
+			state['errors'].append(sys.exc_info())
+		finally:
+			state['stop'].set()
+
+	def taskIngestion(self, iEx, ex, state):
+		"""
+		Market data ingestion stage of the pipeline.
+		The data are fetched without holding the lock of the exchange, then
+		applied to the pairs and published as a snapshot to the strategy stage.
+		"""
+		exchange = ex['exchange']
+		pipeline = ex['pipeline']
+		try:
+			while not state['stop'].is_set():
+				# Stop if the maximum number of iterations is reached
+				if self.config['maxTicks'] != None and ex['ticks'] >= self.config['maxTicks']:
+					state['finished'].append(ex)
+					break
+				start = time.time()
+				try:
+					data = exchange.fetchPairs()
+					with exchange.getLock():
+						timePairs = time.time()
+						result = exchange.updatePairs() if data == None else exchange.updatePairs(data)
+						timePairs = time.time() - timePairs
+						snapshot = {
+							'updateId': exchange.getUpdateId(),
+							'timestamp': exchange.getTimestamp(),
+							'changed': len(exchange.getChangedPairs()),
+							'time': time.time()
 						}
-					}
-					for algo in ex['algorithms']:
-						timings['algorithms'].append({
-							'min': sys.maxint,
-							'max': 0.,
-							'current': 0.
-						})
-					self.time.append(timings)
-
-				# Variable to generate the algorithm timings
-				timeAlgo = []
-				timeLoop = time.clock()
-
-				# Default value for the order
-				order = None
-
-				# Fetch data from the outer space
+				except Exception as e:
+					UtilzLog.error(str(e))
+					if self.config['debug'] == True:
+						raise
+					continue
+				if result == False:
+					state['finished'].append(ex)
+					break
+				ex['ticks'] = ex['ticks'] + 1
+				exchange.getStats().record("updatePairs", timePairs)
+				# Publish the snapshot, an unprocessed one is replaced
+				if snapshot['changed'] > 0 or exchange.getScheduler() == None:
+					pipeline['snapshots'].put(snapshot)
+				else:
+					ex['skippedTicks'] = ex['skippedTicks'] + 1
+				# The watched orders are processed with the new data
+				pipeline['wakeup'].set()
+				exchange.getStats().record("stage.ingestion", time.time() - start)
+		except:
+			state['errors'].append(sys.exc_info())
+		finally:
+			state['stop'].set()
+
+	def taskStrategy(self, iEx, ex, state):
+		"""
+		Strategy stage of the pipeline.
+		It runs the algorithms on the latest snapshot and pushes the orders of
+		the first opportunity found to the execution stage, their amounts being
+		reserved until they are executed. It waits if the
+		execution stage is late (back-pressure), the snapshots published in
+		the meantime being coalesced.
+		"""
+		exchange = ex['exchange']
+		pipeline = ex['pipeline']
+		try:
+			while not state['stop'].is_set():
+				snapshot = pipeline['snapshots'].get(1)
+				if snapshot == None:
+					continue
+				start = time.time()
+				exchange.getStats().record("stage.snapshotAge", start - snapshot['time'])
+				orderList = None
 				try:
-					# If there are pending orders
-					if len(Order.getActiveList()) > 0:
-						# Update the orders
-						ex['exchange'].updateOrders()
-					# Update the exchange pairs (rates)
-					timePairs = time.clock()
-					# Check if this is the last update available, this should only happens when
-					if ex['exchange'].updatePairs() == False:
-						UtilzLog.p("Final balance:", 1)
-						# Update the balance and print it one last time
-						ex['exchange'].updateBalance()
-						self.printBalance()
-						exit()
-					timePairs = time.clock() - timePairs
-
-					# Build the list of amounts available for trading
-					# This depends on the minimal balance and recommanded amount
-					balance = ex['exchange'].getBalance()
-					amountList = {}
-					for currency in balance:
-						# Ignore if this curreny is not handled in the exchanged (this happens if a pair has stopped)
-						if currency not in ex['exchange'].currencyList():
-							continue
-						# Ignore if there is not enough balance on this pair
-						if balance[currency] < self.tradeAmount[currency]['minBalance']:
-							continue
-						# Get the amount we want to trade
-						totalAmount = balance[currency]
-						amount = min(totalAmount, self.tradeAmount[currency]['amount'])
-						# If the amount left is bellow the minimal amount, use everything
-						if totalAmount <= amount + self.tradeAmount[currency]['minBalance']:
-							amount = totalAmount
-						amountList[currency] = amount
-
-					# Run the algorithm
-					for algo in ex['algorithms']:
-
-						start = time.clock()
-						orderList = algo.process(amountList)
-						timeAlgo.append(time.clock() - start)
-
-						# Check if there is an opportunity
-						if orderList != None:
-							# Execute the orders
-							for order in orderList:
-								result = order.execute()
-							break
-
+					with exchange.getLock():
+						amountList = self.getAmountList(ex, pipeline['reserved'])
+						for i, algo in enumerate(ex['algorithms']):
+							startAlgo = time.time()
+							orderList = algo.process(amountList)
+							exchange.getStats().record("algorithm.%s" % (algo.__class__.__name__), time.time() - startAlgo)
+							# Check if there is an opportunity
+							if orderList != None:
+								self.reserveAmounts(ex, orderList)
+								break
+				except Exception as e:
+					UtilzLog.error(str(e))
+					if self.config['debug'] == True:
+						raise
+					continue
+				if orderList != None:
+					exchange.getStats().increment("opportunities")
+					queued = False
+					try:
+						while not state['stop'].is_set():
+							try:
+								pipeline['orders'].put(orderList, True, 1)
+								queued = True
+								break
+							except Queue.Full:
+								pass
+					finally:
+						# The orders will not be executed, release their amounts
+						if not queued:
+							with exchange.getLock():
+								self.reserveAmounts(ex, orderList, True)
+					pipeline['wakeup'].set()
+				exchange.getStats().record("stage.strategy", time.time() - start)
+		except:
+			state['errors'].append(sys.exc_info())
+		finally:
+			state['stop'].set()
+
+	def taskExecution(self, iEx, ex, state):
+		"""
+		Order execution stage of the pipeline.
+		It executes the orders pushed by the strategy stage, updates the status
+		of the active orders and processes the watched orders, which places
+		them on the exchange. The lock of the exchange is released during the
+		requests to the exchange, so that the other stages are not blocked.
+		"""
+		exchange = ex['exchange']
+		pipeline = ex['pipeline']
+		try:
+			while not state['stop'].is_set():
+				pipeline['wakeup'].wait(1)
+				pipeline['wakeup'].clear()
+				start = time.time()
+				try:
+					with exchange.getLock():
+						while True:
+							try:
+								orderList = pipeline['orders'].get_nowait()
+							except Queue.Empty:
+								break
+							try:
+								for order in orderList:
+									order.execute()
+							finally:
+								self.reserveAmounts(ex, orderList, True)
+						# If there are pending orders
+						if self.tradingContext.getActiveCount(exchange) > 0:
+							exchange.updateOrders()
+						exchange.processOrders()
+						self.refreshSnapshot(ex)
 				except Exception as e:
 					UtilzLog.error(str(e))
 					if self.config['debug'] == True:
 						raise
 					continue
+				exchange.getStats().record("stage.execution", time.time() - start)
+		except:
+			state['errors'].append(sys.exc_info())
+		finally:
+			state['stop'].set()
+
+	def runPipeline(self):
+		"""
+		Run each exchange as a pipeline of 3 threads, connected by a mailbox
+		and a bounded queue:
+		ingestion -> (latest snapshot) -> strategy -> (orders) -> execution
+		A slow trade does not delay the fetch of the next market data, and
+		the strategies always process the freshest snapshot.
+		It stops as soon as one of the exchanges has no more pairs to update or an error occured.
+		Returns the results of the bot.
+		"""
+		state = {
+			'stop': threading.Event(),
+			'finished': [],
+			'errors': []
+		}
+		threadList = []
+		for iEx, ex in enumerate(self.context):
+			ex['pipeline'] = {
+				'snapshots': UtilzMailbox(),
+				'orders': Queue.Queue(self.config['executionQueueSize']),
+				# Amounts of each currency used by the orders waiting for execution
+				'reserved': {},
+				'wakeup': threading.Event()
+			}
+			# The watched orders are processed by the execution stage
+			ex['exchange'].setDeferOrders(True)
+			for task in [self.taskIngestion, self.taskStrategy, self.taskExecution]:
+				t = threading.Thread(target = task, args = (iEx, ex, state))
+				t.daemon = True
+				t.start()
+				threadList.append(t)
+		# Wait with a timeout, so that the main thread can still be interrupted
+		while not state['stop'].is_set():
+			state['stop'].wait(1)
+		for ex in self.context:
+			ex['pipeline']['snapshots'].close()
+			ex['pipeline']['wakeup'].set()
+		for t in threadList:
+			t.join()
+		for ex in self.context:
+			ex['exchange'].setDeferOrders(False)
+		# Forward the error to the caller
+		if len(state['errors']) > 0:
+			errorInfo = state['errors'][0]
+			raise errorInfo[0], errorInfo[1], errorInfo[2]
+		self.finalize(state['finished'][0])
+		return self.getResults()
+
+	def finalize(self, ex):
+		"""
+		Print the final balance once an exchange has no more pairs to update
+		"""
+		UtilzLog.p("Final balance:", 1)
+		# Update the balance and print it one last time
+		ex['exchange'].updateBalance()
+		self.publishSnapshot(ex)
+		UtilzLog.p(self.printBalance(), 1)
+		for e in self.context:
+			e['exchange'].journalSync()
+
+	def run(self):
+		"""
+		Run the bot until one of the exchanges has no more pairs to update.
+		Returns the results of the bot.
+		"""
+
+		# Start the metrics server
+		if self.config['metrics'] != None:
+			UtilzMetricsServer({
+				"/metrics": ["text/plain; version=0.0.4", self.printMetrics],
+				"/stats": ["application/json", lambda: json.dumps(self.getMetrics())]
+			}, self.config['metrics']).start()
+
+		# Start the balance thread
+		if self.config['display']:
+			t = threading.Thread(target = self.taskBalance)
+			t.daemon = True
+			t.start()
+
+		# Start the thread fetching the balance of the exchanges not simulated
+		if (self.config['display'] or self.config['metrics'] != None) and len([ex for ex in self.context if not ex['exchange'].isSimulation()]) > 0:
+			t = threading.Thread(target = self.taskUpdateBalance)
+			t.daemon = True
+			t.start()
+
+		if self.config['pipeline']:
+			return self.runPipeline()
+
+		# Each exchange is polled by its own thread, the algorithms of an exchange
+		# are run as soon as its pairs are updated, independently of the other exchanges.
+		if self.config['concurrent']:
+			state = {
+				'stop': threading.Event(),
+				'finished': [],
+				'errors': []
+			}
+			threadList = []
+			for iEx, ex in enumerate(self.context):
+				t = threading.Thread(target = self.taskExchange, args = (iEx, ex, state))
+				t.daemon = True
+				t.start()
+				threadList.append(t)
+			# Wait with a timeout, so that the main thread can still be interrupted
+			while not state['stop'].is_set():
+				state['stop'].wait(1)
+			for t in threadList:
+				t.join()
+			# Forward the error to the caller
+			if len(state['errors']) > 0:
+				errorInfo = state['errors'][0]
+				raise errorInfo[0], errorInfo[1], errorInfo[2]
+			self.finalize(state['finished'][0])
+			return self.getResults()
 
-				# Calculate the total loop time
-				timeLoop = time.clock() - timeLoop
-
-				# Update the timings
-				for i, algo in enumerate(ex['algorithms']):
-					# Make sure this algorithm has been measured
-					if i >= len(timeAlgo):
-						break
-					t = self.time[iEx]['algorithms'][i]
-					t['min'] = min(t['min'], timeAlgo[i])
-					t['max'] = max(t['max'], timeAlgo[i])
-					t['current'] = timeAlgo[i]
-					self.time[iEx]['algorithms'][i] = t
-
-				# Update the full loop timings
-				self.time[iEx]['loop']['min'] = min(self.time[iEx]['loop']['min'], timeLoop)
-				self.time[iEx]['loop']['max'] = max(self.time[iEx]['loop']['max'], timeLoop)
-				self.time[iEx]['loop']['current'] = timeLoop
-				# Update the full loop timings
-				self.time[iEx]['updatePairs']['min'] = min(self.time[iEx]['updatePairs']['min'], timePairs)
-				self.time[iEx]['updatePairs']['max'] = max(self.time[iEx]['updatePairs']['max'], timePairs)
-				self.time[iEx]['updatePairs']['current'] = timePairs
+		# Forever loop
+		while True:
+			# Update the exchanges
+			for iEx, ex in enumerate(self.context):
+				if self.tick(iEx, ex) == False:
+					self.finalize(ex)
+					return self.getResults()
+				self.refreshSnapshot(ex)
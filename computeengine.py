@@ -22,6 +22,8 @@ if __name__ == "__main__":
 
 	# Set the verbosity level
 	UtilzLog.setVerbosity(1)
+	# Write the logs from a background thread
+	UtilzLog.setAsync()
 
 	# Disble simulation mode
 	# !! Warning !! This will deal with the real money
@@ -33,12 +35,16 @@ if __name__ == "__main__":
 	config = {}
 	config['apiKey'] = BTCE_APIKEY
 	config['apiSecret'] = BTCE_APISECRET
+	# Recover the orders and their chain after a restart
+	config['journal'] = "btce.journal"
 
 	btce = ExchangeBTCE(config)
 
 	b = Bot({
 		'exchanges': [btce],
 		'algorithms': [triangularArbitrage, stableCurrency],
-		'debug': False
+		'debug': False,
+		# Metrics scraped at http://127.0.0.1:9108/metrics
+		'metrics': {'port': 9108}
 	})
 	b.run()
@@ -1,48 +1,113 @@
 #!/usr/bin/python
 # -*- coding: iso-8859-1 -*-
 
+from exchanges.fixedpoint import *
 from exchanges.transaction import *
 from exchanges.order import *
 from exchanges.exchangepair import *
+from exchanges.marketstate import *
+from exchanges.record import *
+from exchanges.tradingcontext import *
+from exchanges.journal import *
+from utilz.lock import *
 from utilz.log import *
 from utilz.object import *
+from utilz.stats import *
 
 import json
+import os
+import time
 
 class Exchange(object):
 	"""
 	This is a generic class to handle bitcoin stock exchanges
 	"""
-	# By default simulation is on
-	simulation = True
 
 	def __init__(self, config = {}):
 		# Initialize the context
 		self.context = {
 			'name': None,
 			'balance': {},
+			# Identifier of the last change of the balance
+			'balanceId': 0,
+			# Balance in units of each currency, in fixed point mode
+			'balanceUnits': {},
+			# Number of decimals of each currency
+			'decimals': {},
 			'pairs': {},
+			# Market data of all the pairs
+			'market': MarketState(),
 			'orders': {},
-			'timestamp': 0
+			# Number of orders placed
+			'trades': 0,
+			'timestamp': 0,
+			# Identifier of the current pair update
+			'updateId': 0,
+			# Pairs which bid/ask changed during the current pair update
+			'changedPairs': set(),
+			# Identifier of the last update which changed the bid/ask of each pair
+			'pairChangeId': {},
+			# Scheduler of the fetches, if the exchange port uses one
+			'scheduler': None,
+			# Do not process the watched orders when the pairs are updated, see processOrders
+			'deferOrders': False,
+			# Lock guarding the market data, the balance and the orders when several threads use the exchange,
+			# it is released during the requests to the exchange
+			'lock': UtilzLock(),
+			# Time at which the market data have last been updated
+			'updateTime': None,
+			# Latency histograms of the exchange and of the bots using it
+			'stats': UtilzStats(),
+			# Writer of the event journal and state recovered from it, if any
+			'journal': None,
+			'journalState': None
 		}
 		# initialize the configuration
 		self.config = {
 			'recordWrite': None,
-			'recordRead': None
+			'recordRead': None,
+			# Format of the records written, "json" or "binary"
+			'recordFormat': "json",
+			# Trading context, the default one if not set
+			'context': None,
+			# Keep the balances as integer units and estimate the orders with
+			# exact arithmetic, the amounts do not drift over the trades
+			'fixedPoint': False,
+			# Journal of the orders, trades and balance updates, to recover them after a restart
+			'journal': None
 		}
 		self.config.update(config)
+		if self.config['context'] == None:
+			self.config['context'] = TradingContext.default
 		# Initialize the exchange
 		self.initialize()
 		UtilzLog.info("Initialized exchange `%s' with currencies: %s." % (str(self.context['name']), ", ".join(self.currencyList())) , 1)
 		# If record read is set, open the target file
 		if isinstance(self.config['recordRead'], str):
-			self.context['recordFile'] = open(self.config['recordRead'])
-			if self.simulation == False:
+			if RecordBinary.isBinary(self.config['recordRead']):
+				self.context['recordReader'] = RecordBinaryReader(self.config['recordRead'])
+			else:
+				self.context['recordFile'] = open(self.config['recordRead'])
+			if self.isSimulation() == False:
 				raise error("This exchange `%s' cannot be in non-simulation mode while reading records" % (str(self.context['name'])))
 		# If record write is set, clear the file if it exists
 		if isinstance(self.config['recordWrite'], str):
-			open(self.config['recordWrite'], 'w').close()
+			if self.config['recordFormat'] == "binary":
+				self.context['recordWriter'] = RecordBinaryWriter(self.config['recordWrite'], [[pair.getBaseCurrency(), pair.getQuoteCurrency()] for pair in self.getRecordPairs()])
+			elif self.config['recordFormat'] == "json":
+				open(self.config['recordWrite'], 'w').close()
+			else:
+				raise error("Unknown record format `%s'." % (str(self.config['recordFormat'])))
 			UtilzLog.info("Recording exchange `%s' to `%s'." % (str(self.context['name']), self.config['recordWrite']) , 1)
+		# Read the journal if it exists and append the new events to it
+		if isinstance(self.config['journal'], str):
+			length = None
+			if os.path.isfile(self.config['journal']):
+				reader = JournalReader(self.config['journal'])
+				self.context['journalState'] = reader.recover()
+				length = reader.getLength()
+			self.context['journal'] = JournalWriter(self.config['journal'], length)
+			UtilzLog.info("Journaling exchange `%s' to `%s'." % (str(self.context['name']), self.config['journal']) , 1)
 
 	def __str__(self):
 		string_list = []
@@ -55,12 +120,48 @@ class Exchange(object):
 	@staticmethod
 	def disableSimulationMode():
 		"""
-		This function sets the simulation mode to all sub identities
+		This function disables the simulation mode of the default trading context
+		"""
+		TradingContext.default.setSimulation(False)
+
+	def getTradingContext(self):
+		"""
+		Returns the trading context of this exchange
+		"""
+		return self.config['context']
+
+	def isSimulation(self):
+		"""
+		Returns True if this exchange is in simulation mode
+		"""
+		return self.config['context'].isSimulation()
+
+	def isFixedPoint(self):
+		"""
+		Returns True if the amounts of this exchange are in fixed point
+		"""
+		return self.config['fixedPoint']
+
+	def setCurrencyDecimals(self, currency, decimals):
+		"""
+		Set the number of decimals of a currency, the amounts of this currency
+		are rounded to this number of decimals in fixed point mode.
+		"""
+		self.context['decimals'][currency] = decimals
+
+	def getCurrencyDecimals(self, currency):
+		"""
+		Returns the number of decimals of a currency
+		"""
+		if self.context['decimals'].has_key(currency):
+			return self.context['decimals'][currency]
+		return FixedPoint.DEFAULT_DECIMALS
+
+	def getFixedPoint(self, currency):
+		"""
+		Returns the fixed point representation of the amounts of a currency
 		"""
-		Exchange.simulation = False
-		ExchangePair.simulation = False
-		Order.simulation = False
-		Transaction.simulation = False
+		return FixedPoint.get(self.getCurrencyDecimals(currency))
 
 	def createOrder(self, pair, transactionType, rate, amount):
 		"""
@@ -87,10 +188,14 @@ class Exchange(object):
 		"""
 		Print the view of the current balance
 		"""
-		balance = self.getBalance()
-		currencyList = self.currencyList()
+		return Exchange.printBalanceList(self.currencyList(), self.getBalance(), self.getPlacedBalance())
+
+	@staticmethod
+	def printBalanceList(currencyList, balance, balancePlaced):
+		"""
+		Print the view of a balance
+		"""
 		stringList = []
-		balancePlaced = self.getPlacedBalance()
 		for currency in currencyList:
 			amount = 0.
 			if balance.has_key(currency):
@@ -121,30 +226,233 @@ class Exchange(object):
 		"""
 		raise error("The `updateBalancePort' function is missing for this exchange.")
 
-	def updateBalance(self):
+	def fetchBalancePort(self):
+		"""
+		Fetch the balance without updating it, returns the data to pass to
+		updateBalancePort. This function is optional, None means that the
+		port does not separate the fetch from the update.
+		"""
+		return None
+
+	def fetchBalance(self):
+		"""
+		Fetch the balance without updating it, so that it can be done by another
+		thread than the one trading. Returns the data to pass to updateBalance,
+		None if there is nothing to fetch.
+		"""
+		if self.isSimulation() == True:
+			return None
+		balanceId = self.context['balanceId']
+		data = self.fetchBalancePort()
+		if data == None:
+			return None
+		return [balanceId, data]
+
+	def updateBalance(self, data = None):
 		"""
 		Updates the balance
+		Returns False if the data are outdated, the balance having changed since
+		they have been fetched, True otherwise.
+		\param data The data returned by fetchBalance, if any
 		"""
-		if self.simulation == False:
+		if self.isSimulation() == True:
+			return True
+		if data == None:
 			self.updateBalancePort()
+		elif data[0] != self.context['balanceId']:
+			return False
+		else:
+			self.updateBalancePort(data[1])
+		return True
+
+	def getLock(self):
+		"""
+		Returns the lock of this exchange
+		"""
+		return self.context['lock']
+
+	def setDeferOrders(self, deferOrders):
+		"""
+		If set, the watched orders are not processed when the pairs are updated
+		but only when processOrders is called.
+		"""
+		self.context['deferOrders'] = deferOrders
+
+	def processOrders(self):
+		"""
+		Process the orders watched by all the pairs
+		"""
+		# The inverted pairs share the watch list of their original pair
+		for pair in self.getRecordPairs():
+			pair.processOrders()
+
+	def fetchPairsPort(self):
+		"""
+		Fetch the data of the pairs without updating them, returns the data to
+		pass to applyPairsPort. This function is optional, None means that the
+		port does not separate the fetch from the update.
+		"""
+		return None
+
+	def applyPairsPort(self, data):
+		"""
+		Update the pairs with the data returned by fetchPairsPort
+		This function must be implemenent by the exchange port if fetchPairsPort is
+		"""
+		raise error("The `applyPairsPort' function is missing for this exchange.")
+
+	def fetchPairs(self):
+		"""
+		Fetch the data of the pairs without updating them, so that it can be done
+		without holding the lock of the exchange. Returns the data to pass to
+		updatePairs, None if there is nothing to fetch beforehand.
+		"""
+		if isinstance(self.config['recordRead'], str):
+			return None
+		return self.fetchPairsPort()
 
-	def updatePairs(self):
+	def updatePairs(self, data = None):
 		"""
 		Update the rates of the exchange
 		Return True if there is more pairs to update.
 		False if nothing left.
-		"""
+		\param data The data returned by fetchPairs, if any
+		"""
+		# Start a new update
+		self.context['updateId'] = self.context['updateId'] + 1
+		self.context['changedPairs'] = set()
+		# The data have already been fetched
+		if data != None:
+			result = self.applyPairsPort(data)
 		# To read the records from a file
-		if isinstance(self.config['recordRead'], str):
-			result = self.recordReadPairs()
+		elif isinstance(self.config['recordRead'], str):
+			if self.context.has_key('recordReader'):
+				result = self.recordReadPairsBinary()
+			else:
+				result = self.recordReadPairs()
 		else:
 			result = self.updatePairsPort()
+		self.context['updateTime'] = time.time()
 		# To write the records
 		if isinstance(self.config['recordWrite'], str):
-			self.recordWritePairs()
+			if self.context.has_key('recordWriter'):
+				self.recordWritePairsBinary()
+			else:
+				self.recordWritePairs()
 		# Return the result
 		return False if result == False else True
 
+	def getScheduler(self):
+		"""
+		Returns the scheduler of the fetches of this exchange, None if it has none
+		"""
+		return self.context['scheduler']
+
+	def journal(self, eventType, data, sync = False):
+		"""
+		Append an event to the journal, if any
+		"""
+		if self.context['journal'] != None:
+			self.context['journal'].write(eventType, data, sync)
+
+	def journalOrder(self, order):
+		"""
+		Record the current state of an order
+		"""
+		if self.context['journal'] != None:
+			self.context['journal'].write(Journal.ORDER, Journal.orderToData(order))
+
+	def journalBalance(self):
+		"""
+		Record the current balance
+		"""
+		if self.context['journal'] != None:
+			self.context['journal'].write(Journal.BALANCE, {'balance': self.getBalance()})
+
+	def journalSync(self):
+		"""
+		Write the events journaled to the disk
+		"""
+		if self.context['journal'] != None:
+			self.context['journal'].sync()
+
+	def journalRecover(self):
+		"""
+		Restore the orders which were not finished according to the journal:
+		the placed orders are watched again with their chain, the pending ones
+		are put back in the watch list of their pair and the chained orders
+		which have not been executed are executed. The balance is also restored in
+		simulation mode. Returns the number of orders restored.
+		"""
+		state = self.context['journalState']
+		if state == None:
+			return 0
+		self.context['journalState'] = None
+		if self.isSimulation() and state['balance'] != None:
+			self.setBalance(state['balance'])
+		# The new orders must not reuse the identifiers of the journal
+		self.getTradingContext().reserveId(state['lastId'])
+		count = 0
+		for entry in state['orders']:
+			data = entry['order']
+			if data['status'] == Order.STATUS_COMPLETED:
+				# Execute the next orders of the chain
+				for childData in data['chain']:
+					if childData['id'] in state['sources']:
+						continue
+					order = Journal.orderFromData(self, childData)
+					UtilzLog.info("`%s' Executing the chained order `%s' of the completed order `%s'" % (self.getName(), str(order.getId()), str(data['id'])), 1)
+					order.execute(data['final'])
+					count = count + 1
+				continue
+			order = Journal.orderFromData(self, data)
+			status = str(data['status'])
+			if status == Order.STATUS_PENDING:
+				order.status = status
+				order.active()
+				order.getPair().orderWatch(order)
+			elif status in [Order.STATUS_PLACED, Order.STATUS_EFFECTIVE]:
+				if entry['orderId'] == None:
+					UtilzLog.warning("`%s' The order `%s' may have been placed, its response is missing from the journal: %s" % (self.getName(), str(data['id']), str(order)))
+					continue
+				order.status = status
+				order.active()
+				self.orderWatch(entry['orderId'], order)
+			else:
+				continue
+			UtilzLog.info("`%s' Restored the %s order `%s': %s" % (self.getName(), status, str(data['id']), str(order)), 1)
+			count = count + 1
+		return count
+
+	def getStats(self):
+		"""
+		Returns the latency histograms of this exchange
+		"""
+		return self.context['stats']
+
+	def getUpdateTime(self):
+		"""
+		Returns the time at which the market data have last been updated
+		"""
+		return self.context['updateTime']
+
+	def getUpdateId(self):
+		"""
+		Return the identifier of the current pair update
+		"""
+		return self.context['updateId']
+
+	def getChangedPairs(self, updateId = None):
+		"""
+		Return the set of pairs which bid or ask have changed during the last update.
+		If updateId is set, return the pairs which have changed after this update.
+		Only non-inverted pairs are returned.
+		"""
+		if updateId == None:
+			return self.context['changedPairs']
+		pairChangeId = self.context['pairChangeId']
+		return set([pair for pair in pairChangeId if pairChangeId[pair] > updateId])
+
 	def recordWritePairs(self):
 		"""
 		This function will record the exchange data
@@ -198,6 +506,54 @@ class Exchange(object):
 			f.write(dataPairs + "\n")
 			f.close()
 
+	def getRecordPairs(self):
+		"""
+		Return the list of pairs to be recorded, inverted pairs are discarded
+		"""
+		pairList = []
+		for baseCurrency in sorted(self.context['pairs']):
+			for quoteCurrency in sorted(self.context['pairs'][baseCurrency]):
+				pair = self.context['pairs'][baseCurrency][quoteCurrency]
+				if not isinstance(pair, ExchangePairInverse):
+					pairList.append(pair)
+		return pairList
+
+	def recordWritePairsBinary(self):
+		"""
+		This function will record the exchange data in the binary format
+		"""
+		# The pair list is the one used to create the record
+		if not self.context.has_key('recordPairs'):
+			self.context['recordPairs'] = self.getRecordPairs()
+		self.context['recordWriter'].write([[pair.getBid(), pair.getAsk(), pair.getAvg(), pair.getVolume(), pair.getTimestamp()] for pair in self.context['recordPairs']])
+
+	def recordReadPairsBinary(self):
+		"""
+		This function will read the binary records and updates the pairs
+		"""
+		reader = self.context['recordReader']
+		values = reader.next()
+		# If this is the end of the file
+		if values == None:
+			UtilzLog.error("You have reached the end of the record.")
+			return False
+		timestamp = None
+		for pair, data in zip(reader.getPairs(), values):
+			# Ignore the pairs that have not been recorded yet
+			if data[4] != data[4]:
+				continue
+			self.pairUpdate(pair[0], pair[1], {
+				'bid': data[0],
+				'ask': data[1],
+				'avg': data[2],
+				'volume': data[3],
+				'timestamp': data[4]
+			})
+			timestamp = data[4]
+		# Update the timestamp of the exchange
+		if timestamp != None:
+			self.setTimestamp(int(timestamp) if timestamp.is_integer() else timestamp)
+
 	def recordReadPairs(self):
 		"""
 		This function will read the records and updates the paris
@@ -254,7 +610,7 @@ class Exchange(object):
 		"""
 		This function updates the orders
 		"""
-		if self.simulation == True:
+		if self.isSimulation() == True:
 
 			timestamp = self.getTimestamp()
 			# Get the order ID list
@@ -287,7 +643,8 @@ class Exchange(object):
 						self.orderCompleted(identifier)
 
 		else:
-			result = self.updateOrdersPort()
+			with self.getLock().released():
+				result = self.updateOrdersPort()
 			if result[0] == True:
 				# Retrieve the active order list
 				activeOrders = result[1]
@@ -296,8 +653,8 @@ class Exchange(object):
 				if not isinstance(activeOrders, dict):
 					raise error("This function must return the current active order list, it returned instead `%s'" % (activeOrders))
 
-				# Loop through all the known orders
-				for identifier in self.context['orders']:
+				# Loop through all the known orders (completed orders are removed from the list)
+				for identifier in self.context['orders'].keys():
 					# The current order
 					o = self.context['orders'][identifier]
 					# This order is also part of the active order list
@@ -349,32 +706,57 @@ class Exchange(object):
 		info = order.getInfo()
 		# Get the orginal currency
 		amountCurrency = order.getAmountCurrency()
+		start = time.time()
+		# The request is on the disk before being sent
+		self.journal(Journal.TRADE_REQUEST, {
+			'id': order.getId(),
+			'type': order.getType(),
+			'pair': [order.getBaseCurrency(), order.getQuoteCurrency()],
+			'rate': info['rate'],
+			'amount': info['amount']
+		}, True)
 
-		if self.simulation == True:
+		if self.isSimulation() == True:
 			# Make sure there is enough money in the balance
 			balance = self.getBalance(amountCurrency)
 			if info['amount'] > balance:
-				return [False, "Un-sufficient balance (available: %f %s, needed: %f %s)" % (balance, amountCurrency, info['amount'], amountCurrency)]
-			# Make sure the order is within the limits
-			result = info['transaction'].withinLimits(info['rate'], info['amount'])
-			if result[0] == False:
-				return [False, result[1]]
-			# Create an ID for this transaction
-			orderId = order.getId()
+				result = [False, "Un-sufficient balance (available: %f %s, needed: %f %s)" % (balance, amountCurrency, info['amount'], amountCurrency)]
+			else:
+				# Make sure the order is within the limits
+				result = info['transaction'].withinLimits(info['rate'], info['amount'])
+			if result[0] != False:
+				# Create an ID for this transaction
+				result = [True, order.getId()]
 
 		# Process the order
 		else:
-			result = self.tradePort(order)
+			# The money is subtracted from the balance before the request, as the
+			# other threads can use the exchange while it is sent
+			self.addBalance(-info['amount'], amountCurrency)
+			with self.getLock().released():
+				result = self.tradePort(order)
+			self.context['stats'].record("trade", time.time() - start)
 			if result[0] == False:
-				return result
-			orderId = result[1]
+				self.addBalance(info['amount'], amountCurrency)
+
+		if result[0] == False:
+			self.journal(Journal.TRADE_RESPONSE, {'id': order.getId(), 'success': False, 'message': result[1]}, True)
+			return [False, result[1]]
+		orderId = result[1]
+		self.journal(Journal.TRADE_RESPONSE, {'id': order.getId(), 'success': True, 'orderId': orderId}, True)
 
 		# Subtract the money from the balance
-		self.addBalance(-info['amount'], amountCurrency)
+		if self.isSimulation() == True:
+			self.addBalance(-info['amount'], amountCurrency)
 
 		# Set the order into the exchange watchlist
 		self.orderWatch(orderId, order)
 
+		# Count the orders placed
+		self.context['trades'] = self.context['trades'] + 1
+		if order.marketTime != None:
+			self.context['stats'].record("tickToTrade", time.time() - order.marketTime)
+
 		# Success
 		return [True]
 
@@ -394,13 +776,25 @@ class Exchange(object):
 		"""
 		return self.context['name']
 
+	def getTradeCount(self):
+		"""
+		Return the number of orders placed on this exchange
+		"""
+		return self.context['trades']
+
 	def addBalance(self, balance, currency = None):
 		"""
 		Update the current balance on the wallet of this exchange.
 		This should not be used unless it is for simulation.
 		If currency is set, update only the balance of this specific currency
 		"""
-		if currency == None:
+		if self.isFixedPoint():
+			if currency == None:
+				for c in balance:
+					self.addBalanceUnits(c, self.getFixedPoint(c).toUnits(balance[c]))
+			else:
+				self.addBalanceUnits(currency, self.getFixedPoint(currency).toUnits(balance))
+		elif currency == None:
 			for c in balance:
 				if not self.context['balance'].has_key(c):
 					self.context['balance'][c] = 0.
@@ -409,6 +803,18 @@ class Exchange(object):
 			if not self.context['balance'].has_key(currency):
 				self.context['balance'][currency] = 0.
 			self.context['balance'][currency] = self.context['balance'][currency] + balance
+		self.context['balanceId'] = self.context['balanceId'] + 1
+		self.journalBalance()
+
+	def addBalanceUnits(self, currency, units):
+		"""
+		Add units to the balance of a currency, in fixed point mode
+		"""
+		fixedPoint = self.getFixedPoint(currency)
+		if self.context['balanceUnits'].has_key(currency):
+			units = units + self.context['balanceUnits'][currency]
+		self.context['balanceUnits'][currency] = units
+		self.context['balance'][currency] = fixedPoint.fromUnits(units)
 
 	def setBalance(self, balance, currency = None):
 		"""
@@ -417,10 +823,21 @@ class Exchange(object):
 		If currency is set, set only the balance of this specific currency
 		"""
 		# The assignment is atomic with python, so this function is thread safe
-		if currency == None:
+		if self.isFixedPoint():
+			if currency == None:
+				balanceUnits = dict([(c, self.getFixedPoint(c).toUnits(balance[c])) for c in balance])
+				self.context['balance'] = dict([(c, self.getFixedPoint(c).fromUnits(balanceUnits[c])) for c in balanceUnits])
+				self.context['balanceUnits'] = balanceUnits
+			else:
+				units = self.getFixedPoint(currency).toUnits(balance)
+				self.context['balanceUnits'][currency] = units
+				self.context['balance'][currency] = self.getFixedPoint(currency).fromUnits(units)
+		elif currency == None:
 			self.context['balance'] = balance
 		else:
 			self.context['balance'][currency] = balance
+		self.context['balanceId'] = self.context['balanceId'] + 1
+		self.journalBalance()
 
 	def getBalance(self, currency = None):
 		"""
@@ -480,6 +897,12 @@ class Exchange(object):
 		"""
 		return list(set([x for x in self.context['pairs']]))
 
+	def getMarketState(self):
+		"""
+		Returns the market state containing the data of all the pairs
+		"""
+		return self.context['market']
+
 	def getPair(self, baseCurrency, quoteCurrency = None):
 		"""
 		Returns the pair(s) based on the specified currency(ies)
@@ -512,6 +935,15 @@ class Exchange(object):
 		self.context['pairs'][baseCurrency][quoteCurrency] = pair
 		# Associate this pari with this exchange
 		pair.setExchange(self)
+		# The currencies have at least the decimals of the transactions of the pair
+		for transactionType in ["sell", "buy"]:
+			transaction = pair.getTransaction(transactionType)
+			if transaction != None:
+				for currency in [baseCurrency, quoteCurrency]:
+					if transaction.getMaxDecimal() > self.context['decimals'].get(currency, 0):
+						self.context['decimals'][currency] = transaction.getMaxDecimal()
+		# Store its market data with the ones of this exchange
+		pair.setMarketState(self.context['market'])
 		# Add the inverse pair if none is existing
 		if not self.context['pairs'].has_key(quoteCurrency):
 			self.context['pairs'][quoteCurrency] = {}
@@ -525,7 +957,26 @@ class Exchange(object):
 		# Make sure the pair exists
 		if not self.context['pairs'].has_key(baseCurrency) or not self.context['pairs'][baseCurrency].has_key(quoteCurrency) or not isinstance(self.context['pairs'][baseCurrency][quoteCurrency], ExchangePair):
 			raise error("This exchange does not have the following pair `%s/%s'." % (str(baseCurrency), str(quoteCurrency)))
-		self.context['pairs'][baseCurrency][quoteCurrency].updatePair(data)
+		pair = self.context['pairs'][baseCurrency][quoteCurrency]
+		bid = pair.getBid()
+		ask = pair.getAsk()
+		pair.updatePair(data, not self.context['deferOrders'])
+		# Keep track of the pairs that have changed
+		if pair.getBid() != bid or pair.getAsk() != ask:
+			self.context['changedPairs'].add(pair)
+			self.context['pairChangeId'][pair] = self.context['updateId']
+
+	def pairUpdateDepth(self, baseCurrency, quoteCurrency, bids, asks, timestamp = None):
+		"""
+		This function replaces the depth of a specific exchange pair.
+		Returns True if the depth has changed.
+		\param bids List of [rate, amount] bid levels
+		\param asks List of [rate, amount] ask levels
+		"""
+		# Make sure the pair exists
+		if not self.context['pairs'].has_key(baseCurrency) or not self.context['pairs'][baseCurrency].has_key(quoteCurrency) or not isinstance(self.context['pairs'][baseCurrency][quoteCurrency], ExchangePair):
+			raise error("This exchange does not have the following pair `%s/%s'." % (str(baseCurrency), str(quoteCurrency)))
+		return self.context['pairs'][baseCurrency][quoteCurrency].updateDepth(bids, asks, timestamp)
 
 	def orderWatch(self, identifier, order):
 		"""
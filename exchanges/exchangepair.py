@@ -3,6 +3,8 @@
 
 from exchanges.transaction import *
 from exchanges.order import *
+from exchanges.marketstate import *
+from exchanges.orderbook import *
 from utilz.log import *
 from utilz.object import *
 
@@ -21,7 +23,12 @@ class ExchangePair(object):
 		BUY: 1.4746 USD => 1 EUR
 		SELL: 1 EUR => 1.4745 USD
 		SPREAD = 1.4746 - 1.4745 = 0.0001
+
+	The market data of the pair are stored in a market state, at the slot
+	index of this pair. Its depth, when available, is kept in an order book.
 	"""
+	__slots__ = ('config', 'exchange', 'orders', 'market', 'slot', 'depth', 'args')
+
 	DEFAULT_CONFIG = {
 		# Initial Currency
 		'baseCurrency': None,
@@ -38,9 +45,6 @@ class ExchangePair(object):
 		# Money deposit
 		'deposit': None
 	}
-	# By default simulation is on
-	simulation = True
-
 	def __init__(self, config, args = None):
 		self.config = self.DEFAULT_CONFIG.copy()
 		# Set the configuration
@@ -49,9 +53,10 @@ class ExchangePair(object):
 		self.exchange = None
 		# Set the order watchlist
 		self.clearOrderList()
-		# Clear the data
-		self.data = {}
-		self.updatePair({})
+		# Use its own market state until it is associated with an exchange
+		self.setMarketState(MarketState())
+		# Depth of the market
+		self.depth = OrderBook()
 		# Set extra arguments if needed
 		self.args = args
 
@@ -84,6 +89,35 @@ class ExchangePair(object):
 		"""
 		return self.exchange
 
+	def setMarketState(self, market):
+		"""
+		Allocate a slot for this pair in a market state, current data are preserved
+		"""
+		slot = market.addSlot()
+		if hasattr(self, 'market'):
+			market.copy(slot, self.market, self.slot)
+		self.market = market
+		self.slot = slot
+
+	def getMarketState(self):
+		"""
+		Returns the market state and the slot index of this pair
+		"""
+		return [self.market, self.slot]
+
+	def getOrderBook(self):
+		"""
+		Returns the order book holding the depth of this pair
+		"""
+		return self.depth
+
+	def updateDepth(self, bids, asks, timestamp = None):
+		"""
+		Replace the depth of this pair with a snapshot of the order book,
+		returns True if it has changed
+		"""
+		return self.depth.set(bids, asks, timestamp)
+
 	def getOrderList(self):
 		"""
 		Returns the order list
@@ -135,31 +169,37 @@ class ExchangePair(object):
 		"""
 		Returns the ask price
 		"""
-		return self.data['ask']
+		value = self.market.ask[self.slot]
+		return None if value != value else value
 
 	def getBid(self):
 		"""
 		Returns the bid price
 		"""
-		return self.data['bid']
+		value = self.market.bid[self.slot]
+		return None if value != value else value
 
 	def getAvg(self):
 		"""
 		Returns the average price
 		"""
-		return self.data['avg']
+		value = self.market.avg[self.slot]
+		return None if value != value else value
 
 	def getVolume(self):
-		return self.data['volume']
+		return self.market.read(self.slot, 'volume')
 
 	def getVolumeCurrency(self):
-		return self.data['volumeCurrency']
+		return self.market.read(self.slot, 'volumeCurrency')
 
 	def getTimestamp(self):
 		"""
 		Return the timestamp of the last updated data
 		"""
-		return self.data['timestamp']
+		value = self.market.timestamp[self.slot]
+		if value != value:
+			return None
+		return int(value) if value.is_integer() else value
 
 	def orderBuy(self, rate = None, amount = None):
 		"""
@@ -173,35 +213,22 @@ class ExchangePair(object):
 		"""
 		return OrderSell(self, rate, amount)
 
-	def updatePair(self, config):
+	def updatePair(self, config, processOrders = True):
 		"""
 		This function updates this exchange pair
+		\param processOrders Process the watched orders with the new data
 		"""
-		# Data from the stock exchange
-		DEFAULT = {
-			# Maximum Price
-			'high': None,
-			# Minimum Price
-			'low': None,
-			# Average Price
-			'avg': None,
-			# Trade Volume
-			'volume': None,
-			# Trade Volume in Currency
-			'volumeCurrency': None,
-			# Price of the last trade
-			'last': None,
-			# Bid Price
-			'bid': None,
-			# Ask Price
-			'ask': None,
-			# Timestamp
-			'timestamp': None
-		}
-		self.data = DEFAULT.copy()
-		self.data.update(config)
+		self.market.write(self.slot, config)
 
 		# Process the orders if any
+		if processOrders:
+			self.processOrders()
+
+	def processOrders(self):
+		"""
+		Process the watched orders, the ones which conditions are not fulfilled
+		are put back into the watch list
+		"""
 		orderList = self.getOrderList()
 		self.clearOrderList()
 		while orderList:
@@ -211,7 +238,10 @@ class ExchangePair(object):
 class ExchangePairInverse(ExchangePair):
 	"""
 	An invert exchange pair is based on an existing pair
+	Its quotes are read from the pre-computed inverse fields of the market state.
 	"""
+	__slots__ = ('pair',)
+
 	def __init__(self, pair):
 		self.pair = pair
 		# Create a new config
@@ -271,42 +301,60 @@ class ExchangePairInverse(ExchangePair):
 		"""
 		return self.pair.exchange
 
+	def setMarketState(self, market):
+		"""
+		The market state is the one of the original pair
+		"""
+		self.pair.setMarketState(market)
+
+	def getMarketState(self):
+		"""
+		Returns the market state and the slot index of the original pair
+		"""
+		return self.pair.getMarketState()
+
+	def getOrderBook(self):
+		"""
+		Returns the order book of the original pair
+		"""
+		return self.pair.depth
+
+	def updateDepth(self, bids, asks, timestamp = None):
+		"""
+		The depth is the one of the original pair
+		"""
+		return self.pair.updateDepth(bids, asks, timestamp)
+
 	def getAsk(self):
 		"""
 		Returns the ask price
 		"""
-		data = self.pair.data
-		if data['bid'] == None:
-			return None
-		return 1. / data['bid']
+		value = self.pair.market.inverseAsk[self.pair.slot]
+		return None if value != value else value
 
 	def getBid(self):
 		"""
 		Returns the bid price
 		"""
-		data = self.pair.data
-		if data['ask'] == None:
-			return None
-		return 1. / data['ask']
+		value = self.pair.market.inverseBid[self.pair.slot]
+		return None if value != value else value
 
 	def getAvg(self):
 		"""
 		Returns the average price
 		"""
-		data = self.pair.data
-		if data['avg'] == None:
-			return None
-		return 1. / self.pair.data['avg']
+		value = self.pair.market.inverseAvg[self.pair.slot]
+		return None if value != value else value
 
 	def getTimestamp(self):
 		"""
 		Return the timestamp of the last updated data
 		"""
-		return self.pair.data['timestamp']
+		return self.pair.getTimestamp()
 
 	def getVolume(self):
-		return self.pair.data['volume']
+		return self.pair.getVolume()
 
 	def getVolumeCurrency(self):
-		return self.pair.data['volumeCurrency']
+		return self.pair.getVolumeCurrency()
 
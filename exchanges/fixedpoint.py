@@ -0,0 +1,63 @@
+#!/usr/bin/python
+# -*- coding: iso-8859-1 -*-
+
+from utilz.log import *
+
+import fractions
+
+class FixedPoint(object):
+	"""
+	Integer representation of the amounts of a currency.
+
+	An amount is stored as an integer number of units, a unit being the
+	smallest fraction allowed by the number of decimals of the currency (the
+	satoshi for 8 decimals). Additions of units are exact, the balances
+	therefore do not accumulate the rounding errors of the floating point
+	arithmetic.
+	"""
+	# Fixed point representations by number of decimals
+	cache = {}
+	# Number of decimals used for currencies with no pair information
+	DEFAULT_DECIMALS = 8
+
+	def __init__(self, decimals):
+		self.decimals = decimals
+		self.scale = 10 ** decimals
+
+	@staticmethod
+	def get(decimals):
+		"""
+		Returns the fixed point representation for a specific number of decimals
+		"""
+		if not FixedPoint.cache.has_key(decimals):
+			FixedPoint.cache[decimals] = FixedPoint(decimals)
+		return FixedPoint.cache[decimals]
+
+	@staticmethod
+	def toFraction(n):
+		"""
+		Returns the exact value of a number as written in decimal, 0.1 being 1/10
+		"""
+		if isinstance(n, fractions.Fraction):
+			return n
+		if isinstance(n, float):
+			return fractions.Fraction(repr(n))
+		return fractions.Fraction(n)
+
+	def toUnits(self, amount):
+		"""
+		Converts an amount into units, rounded to the nearest unit
+		"""
+		return int(round(amount * self.scale))
+
+	def floorUnits(self, value):
+		"""
+		Converts an exact value (a fraction) into units, rounded toward zero
+		"""
+		return int(value * self.scale)
+
+	def fromUnits(self, units):
+		"""
+		Converts units into an amount
+		"""
+		return units / float(self.scale)
@@ -0,0 +1,230 @@
+#!/usr/bin/python
+# -*- coding: iso-8859-1 -*-
+
+from exchanges.order import *
+from utilz.log import *
+
+import json
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+
+class Journal(object):
+	"""
+	Append-only journal of the trading events of an exchange: the order
+	status changes, the trade requests and responses, and the balance updates.
+
+	The file starts with a header:
+		- magic (4 bytes) and version (uint16)
+	Then each event is stored as a record:
+		- length of the payload (uint32) and CRC32 of the payload (uint32)
+		- payload: event type (uint8), time (float64) and the event data in JSON
+	All the values are little-endian. A record which has been partially
+	written, or which does not match its CRC, ends the journal.
+	"""
+	MAGIC = "BTCJ"
+	VERSION = 1
+	# Event types
+	ORDER = 1
+	TRADE_REQUEST = 2
+	TRADE_RESPONSE = 3
+	BALANCE = 4
+	# Format of the record header and of the start of the payload
+	RECORD = "<II"
+	EVENT = "<Bd"
+
+	@staticmethod
+	def orderToData(order):
+		"""
+		Returns the data describing an order and its chain
+		"""
+		data = {
+			'id': order.getId(),
+			'source': order.sourceId,
+			'type': order.getType(),
+			'pair': [order.getBaseCurrency(), order.getQuoteCurrency()],
+			'rate': order.getRate(),
+			'amount': order.getAmount(),
+			'status': order.getStatus(),
+			'message': order.getMessage(),
+			'conditions': order.getConditions(),
+			'chain': [Journal.orderToData(o) for o in order.chain]
+		}
+		# The amount to pass to the next orders
+		if order.getStatus() == Order.STATUS_COMPLETED:
+			data['final'] = order.estimate()
+		return data
+
+	@staticmethod
+	def orderFromData(exchange, data):
+		"""
+		Re-create an order and its chain, keeping their identifiers
+		"""
+		pair = exchange.getPair(str(data['pair'][0]), str(data['pair'][1]))
+		if pair == None:
+			raise error("This exchange `%s' does not have the pair `%s/%s' of the order `%s'." % (exchange.getName(), data['pair'][0], data['pair'][1], str(data['id'])))
+		if data['type'] == "sell":
+			order = OrderSell(pair, data['rate'], data['amount'])
+		else:
+			order = OrderBuy(pair, data['rate'], data['amount'])
+		order.orderId = data['id']
+		order.sourceId = data['source']
+		order.tradingContext.reserveId(data['id'])
+		order.setConditions(dict([(str(key), value) for key, value in data['conditions'].items()]))
+		for o in data['chain']:
+			order.chain.append(Journal.orderFromData(exchange, o))
+		return order
+
+class JournalWriter(object):
+	"""
+	Append events to a journal. The data are written at once and synced to
+	the disk by batches: after a number of records or a delay, or right away
+	for the events that must not be lost.
+	"""
+	# Number of records and delay (in seconds) after which the file is synced
+	SYNC_RECORDS = 64
+	SYNC_DELAY = 1.
+
+	def __init__(self, filename, length = None):
+		"""
+		\param length Length of the valid part of an existing journal, the rest is dropped
+		"""
+		self.lock = threading.Lock()
+		self.pending = 0
+		self.syncTime = time.time()
+		if length == None:
+			self.file = open(filename, 'wb')
+			self.file.write(Journal.MAGIC + struct.pack("<H", Journal.VERSION))
+			self.syncFile()
+		else:
+			self.file = open(filename, 'r+b')
+			self.file.truncate(length)
+			self.file.seek(length)
+
+	def write(self, eventType, data, sync = False):
+		"""
+		Append an event
+		\param sync Sync the file right away
+		"""
+		payload = struct.pack(Journal.EVENT, eventType, time.time()) + json.dumps(data)
+		record = struct.pack(Journal.RECORD, len(payload), zlib.crc32(payload) & 0xffffffff) + payload
+		with self.lock:
+			self.file.write(record)
+			self.pending = self.pending + 1
+			if sync or self.pending >= self.SYNC_RECORDS or time.time() - self.syncTime >= self.SYNC_DELAY:
+				self.syncFile()
+
+	def sync(self):
+		"""
+		Write the data to the disk
+		"""
+		with self.lock:
+			self.syncFile()
+
+	def syncFile(self):
+		self.file.flush()
+		os.fsync(self.file.fileno())
+		self.pending = 0
+		self.syncTime = time.time()
+
+	def close(self):
+		with self.lock:
+			self.syncFile()
+			self.file.close()
+
+class JournalReader(object):
+	"""
+	Read the events of a journal
+	"""
+
+	def __init__(self, filename):
+		with open(filename, 'rb') as f:
+			self.data = f.read()
+		header = len(Journal.MAGIC) + struct.calcsize("<H")
+		if len(self.data) < header or self.data[0:len(Journal.MAGIC)] != Journal.MAGIC:
+			raise error("The file `%s' is not a journal." % (str(filename)))
+		version = struct.unpack_from("<H", self.data, len(Journal.MAGIC))[0]
+		if version != Journal.VERSION:
+			raise error("Unsupported journal version `%i'." % (version))
+		# End of the last valid record read
+		self.offset = header
+
+	def __iter__(self):
+		"""
+		Iterate through the events, as [type, time, data]
+		"""
+		size = struct.calcsize(Journal.RECORD)
+		eventSize = struct.calcsize(Journal.EVENT)
+		data = self.data
+		offset = self.offset
+		while offset + size <= len(data):
+			length, crc = struct.unpack_from(Journal.RECORD, data, offset)
+			payload = data[offset + size:offset + size + length]
+			if len(payload) != length or length < eventSize or zlib.crc32(payload) & 0xffffffff != crc:
+				break
+			eventType, eventTime = struct.unpack_from(Journal.EVENT, payload)
+			offset = offset + size + length
+			self.offset = offset
+			yield [eventType, eventTime, json.loads(payload[eventSize:])]
+
+	def getLength(self):
+		"""
+		Returns the length of the valid part of the journal read so far
+		"""
+		return self.offset
+
+	def recover(self):
+		"""
+		Rebuild the state of the trading from the events. Returns the last
+		balance, the orders not finished (the last data of each order, with
+		its identifier on the exchange if it has been placed), the
+		identifiers of the chained orders which have been executed and the
+		greatest order identifier used.
+		"""
+		def getLastId(data):
+			return max([data['id']] + [getLastId(o) for o in data['chain']])
+
+		orders = {}
+		sources = set()
+		balance = None
+		lastId = 0
+		for eventType, eventTime, data in self:
+			if eventType == Journal.ORDER:
+				entry = orders.setdefault(data['id'], {'orderId': None})
+				entry['order'] = data
+				if data['source'] != None:
+					sources.add(data['source'])
+				lastId = max(lastId, getLastId(data))
+			elif eventType == Journal.TRADE_RESPONSE:
+				if data['success'] and orders.has_key(data['id']):
+					orders[data['id']]['orderId'] = data['orderId']
+			elif eventType == Journal.BALANCE:
+				balance = dict([(str(currency), amount) for currency, amount in data['balance'].items()])
+		# Ignore the orders which are finished, and their chain executed
+		orderList = []
+		for identifier in sorted(orders):
+			entry = orders[identifier]
+			status = entry['order']['status']
+			if status == Order.STATUS_CANCELED:
+				continue
+			if status == Order.STATUS_COMPLETED and len([o for o in entry['order']['chain'] if o['id'] not in sources]) == 0:
+				continue
+			orderList.append(entry)
+		return {
+			'balance': balance,
+			'orders': orderList,
+			'sources': sources,
+			'lastId': lastId
+		}
+
+if __name__ == "__main__":
+
+	if len(sys.argv) != 2:
+		print "Usage: %s <journal>" % (sys.argv[0])
+		sys.exit(1)
+	names = {Journal.ORDER: "ORDER", Journal.TRADE_REQUEST: "TRADE_REQUEST", Journal.TRADE_RESPONSE: "TRADE_RESPONSE", Journal.BALANCE: "BALANCE"}
+	for eventType, eventTime, data in JournalReader(sys.argv[1]):
+		print "%f %s %s" % (eventTime, names.get(eventType, str(eventType)), json.dumps(data))
@@ -0,0 +1,103 @@
+#!/usr/bin/python
+# -*- coding: iso-8859-1 -*-
+
+from utilz.log import *
+
+import array
+
+# Value used to represent an undefined value
+NAN = float("nan")
+
+class MarketState(object):
+	"""
+	Store the market data of all the pairs of an exchange.
+
+	The data are stored in contiguous typed arrays (one per field), each pair
+	being identified by a slot index. Undefined values are stored as NaN.
+	The quotes of the inverse pairs are pre-computed on write.
+	"""
+	# Data from the stock exchange
+	FIELDS = [
+		# Maximum Price
+		'high',
+		# Minimum Price
+		'low',
+		# Average Price
+		'avg',
+		# Trade Volume
+		'volume',
+		# Trade Volume in Currency
+		'volumeCurrency',
+		# Price of the last trade
+		'last',
+		# Bid Price
+		'bid',
+		# Ask Price
+		'ask',
+		# Timestamp
+		'timestamp'
+	]
+	# Pre-computed fields for the inverse pairs
+	INVERSE_FIELDS = [
+		# Bid Price of the inverse pair (1 / ask)
+		'inverseBid',
+		# Ask Price of the inverse pair (1 / bid)
+		'inverseAsk',
+		# Average Price of the inverse pair (1 / avg)
+		'inverseAvg'
+	]
+
+	def __init__(self):
+		for field in self.FIELDS + self.INVERSE_FIELDS:
+			setattr(self, field, array.array('d'))
+		self.size = 0
+
+	def __len__(self):
+		return self.size
+
+	def addSlot(self):
+		"""
+		Allocate a new slot and returns its index
+		"""
+		for field in self.FIELDS + self.INVERSE_FIELDS:
+			getattr(self, field).append(NAN)
+		self.size = self.size + 1
+		return self.size - 1
+
+	def getColumn(self, field):
+		"""
+		Return the array containing the values of a field for all slots.
+		The array is not copied, it can be used with numpy.frombuffer.
+		"""
+		if field not in self.FIELDS and field not in self.INVERSE_FIELDS:
+			raise error("Unknown market field `%s'." % (str(field)))
+		return getattr(self, field)
+
+	def write(self, slot, data):
+		"""
+		Set the data of a slot, missing fields are undefined
+		"""
+		for field in self.FIELDS:
+			value = data.get(field)
+			getattr(self, field)[slot] = NAN if value == None else value
+		# Pre-compute the inverse quotes
+		value = self.ask[slot]
+		self.inverseBid[slot] = 1. / value if value else NAN
+		value = self.bid[slot]
+		self.inverseAsk[slot] = 1. / value if value else NAN
+		value = self.avg[slot]
+		self.inverseAvg[slot] = 1. / value if value else NAN
+
+	def read(self, slot, field):
+		"""
+		Return the value of a field for a specific slot, None if undefined
+		"""
+		value = self.getColumn(field)[slot]
+		return None if value != value else value
+
+	def copy(self, slot, market, marketSlot):
+		"""
+		Copy the data of a slot from another market state
+		"""
+		for field in self.FIELDS + self.INVERSE_FIELDS:
+			getattr(self, field)[slot] = getattr(market, field)[marketSlot]
@@ -1,12 +1,14 @@
 #!/usr/bin/python
 # -*- coding: iso-8859-1 -*-
 
+from exchanges.fixedpoint import *
+from exchanges.orderbook import *
 from exchanges.transaction import *
+from exchanges.tradingcontext import *
 from utilz.log import *
 from utilz.object import *
 
 import sys
-import math
 
 class Order(object):
 	"""
@@ -20,14 +22,10 @@ class Order(object):
 	Here is the definition of the various terms used:
 		- rate: this is the rate of the transaction.
 		- amount: the number of the initial currency to trade
-	"""
-	# By default simulation is on
-	simulation = True
-	# List of active orders
-	activeList = []
-	# Uinque ID seed
-	uniqueIdSeed = 0
 
+	The active order list, the order identifiers and the simulation mode are
+	taken from the trading context of the exchange of the pair.
+	"""
 	ESTIMATE_FEE = 0
 	ESTIMATE_NO_FEE = 1
 	ESTIMATE_INVERSE = 2
@@ -48,6 +46,12 @@ class Order(object):
 		"""
 		self.pair = pair
 		self.transactionType = transactionType
+		# The transaction of an order never changes, keep it for the rate and amount arithmetic
+		self.transaction = pair.getTransaction(transactionType)
+		self.tradingContext = Order.getPairTradingContext(pair)
+		# Estimates computed with exact arithmetic if the exchange is in fixed point mode
+		exchange = pair.getExchange() if pair != None else None
+		self.fixedPoint = exchange.isFixedPoint() if exchange != None else False
 		if rate == None:
 			self.rate = None
 		else:
@@ -59,7 +63,11 @@ class Order(object):
 		self.status = Order.STATUS_IDLE
 		self.chain = []
 		self.statusMessage = ""
-		self.orderId = Order.getUniqueId()
+		self.orderId = self.tradingContext.getUniqueId()
+		# Time of the market data this order has been decided on, for the tick-to-trade latency
+		self.marketTime = None
+		# Identifier of the order this one has been executed from, if any
+		self.sourceId = None
 		# Add the conditions
 		defaultConditions = {
 			'minTimestamp': -1,
@@ -84,28 +92,21 @@ class Order(object):
 		return " -> ".join(stringList)
 
 	@staticmethod
-	def getUniqueId():
+	def getPairTradingContext(pair):
 		"""
-		This function generates a unique ID and returns it
+		Returns the trading context of the exchange of a pair, the default
+		context if the pair is not associated with an exchange
 		"""
-		Order.uniqueIdSeed = Order.uniqueIdSeed + 1
-		return Order.uniqueIdSeed
+		exchange = pair.getExchange() if pair != None else None
+		if exchange == None:
+			return TradingContext.default
+		return exchange.getTradingContext()
 
-	@staticmethod
-	def getActiveList():
+	def getTradingContext(self):
 		"""
-		Returns the list of active orders.
-		Active orders are otherders that are processing.
+		Returns the trading context of this order
 		"""
-		return Order.activeList
-
-	@staticmethod
-	def getPlacedList():
-		"""
-		Returns the list of placed orders.
-		it can be either placed orders, effective orders or completed orders.
-		"""
-		return [o for o in Order.activeList if o.getStatus() == STATUS_PLACED or o.getStatus() == STATUS_EFFECTIVE  or o.getStatus() == STATUS_COMPLETED]
+		return self.tradingContext
 
 	def printOrder(self):
 		"""
@@ -153,7 +154,7 @@ class Order(object):
 		# Copy the conditions
 		order.conditions = self.conditions.copy()
 		# Create a new ID
-		order.orderId = Order.getUniqueId()
+		order.orderId = order.tradingContext.getUniqueId()
 		# Do not clone the chaine
 		order.chain = []
 		return order
@@ -243,9 +244,7 @@ class Order(object):
 		"""
 		Retruns the transaction associated with this order
 		"""
-		pair = self.getPair()
-		transactionType = self.getType()
-		return pair.getTransaction(transactionType)
+		return self.transaction
 
 	def getMaxDecimal(self):
 		"""
@@ -257,9 +256,7 @@ class Order(object):
 		"""
 		Floor a number down to the number of digits allowed by this transaction
 		"""
-		d = self.getMaxDecimal()
-		powd = math.pow(10, d)
-		return int(n * powd) * 1. / powd
+		return self.transaction.quantizer.floor(n)
 
 	def setAmount(self, amount):
 		"""
@@ -312,8 +309,16 @@ class Order(object):
 		"""
 		Set the current status of the order
 		"""
+		previousStatus = self.status
 		self.status = status
 		self.statusMessage = message
+		# Update the active order indexes
+		self.tradingContext.orderStatusChanged(self, previousStatus)
+		# Count the orders by status and record the change
+		exchange = self.pair.getExchange()
+		if exchange != None:
+			exchange.getStats().increment("orders.%s" % (status))
+			exchange.journalOrder(self)
 		# Process with the new status
 		self.process()
 
@@ -354,7 +359,7 @@ class Order(object):
 		else:
 			amount = self.floor(amount)
 		transactionType = self.getType()
-		transaction = pair.getTransaction(transactionType)
+		transaction = self.transaction
 		# Make sure none of these are undefined
 		if pair == None or rate == None or amount == None or transactionType == None or transaction == None:
 			if strict:
@@ -415,6 +420,8 @@ class Order(object):
 		"""
 		# Get the order info
 		info = self.getInfo(amount)
+		if self.fixedPoint:
+			return self.estimateFixedPoint(info, mode)
 		# Calculate the final amount of curency2 after the order
 		if mode & Order.ESTIMATE_INVERSE:
 			finalAmount = (1. / info['rate']) * info['amount']
@@ -429,6 +436,25 @@ class Order(object):
 		finalAmount = finalAmount - transactionFee
 		return self.floor(finalAmount)
 
+	def estimateFixedPoint(self, info, mode = ESTIMATE_FEE):
+		"""
+		Estimates the final cost of an order with exact arithmetic, the result
+		is floored from the exact value and not from its floating point
+		approximation.
+		"""
+		rate = FixedPoint.toFraction(info['rate'])
+		amount = FixedPoint.toFraction(info['amount'])
+		# Calculate the final amount of curency2 after the order
+		if mode & Order.ESTIMATE_INVERSE:
+			finalAmount = amount / rate
+		else:
+			finalAmount = rate * amount
+		# Calculate the transaction fee if any
+		if not (mode & Order.ESTIMATE_NO_FEE):
+			finalAmount = finalAmount - info['transaction'].getFeeExact(finalAmount)
+		fixedPoint = info['transaction'].getFixedPoint()
+		return fixedPoint.fromUnits(fixedPoint.floorUnits(finalAmount))
+
 	def estimateChain(self, amount = None, mode = ESTIMATE_FEE):
 		"""
 		Estimates the final cost of an order chain
@@ -458,9 +484,11 @@ class Order(object):
 
 		# Set an amount to this order
 		order.setAmount(info['amount'])
+		order.marketTime = exchange.getUpdateTime()
+		order.sourceId = self.getId()
 
 		# Simulation, adds some specific conditions
-		if self.simulation:
+		if self.tradingContext.isSimulation():
 			# Add a timeout of 10s
 			#timeout = order.getConditions('timeout')
 			#timeout = max(timeout, 10)
@@ -479,7 +507,7 @@ class Order(object):
 		order.active()
 
 		# This order is in pending state
-		UtilzLog.order("[PENDING] [ID=%i] t=`%s' %s" % (order.getId(), str(info['pair'].getTimestamp()), str(order)))
+		UtilzLog.order(UtilzLog.defer("[PENDING] [ID=%i] t=`%s' %s", order.getId(), info['pair'].getTimestamp(), order))
 
 		# Set this order as pending
 		order.setStatus(Order.STATUS_PENDING)
@@ -514,7 +542,7 @@ class Order(object):
 			self.setStatus(Order.STATUS_PLACED)
 
 		elif info['status'] == Order.STATUS_PLACED:
-			UtilzLog.order("[PLACED] [ID=%i] t=`%s' %s" % (self.getId(), str(info['pair'].getTimestamp()), str(self)))
+			UtilzLog.order(UtilzLog.defer("[PLACED] [ID=%i] t=`%s' %s", self.getId(), info['pair'].getTimestamp(), self))
 
 			# Identify the exchange
 			exchange = info['pair'].getExchange()
@@ -532,18 +560,18 @@ class Order(object):
 				return
 
 		elif info['status'] == Order.STATUS_EFFECTIVE:
-			UtilzLog.order("[EFFECTIVE] [ID=%i] t=`%s' %s" % (self.getId(), str(info['pair'].getTimestamp()), str(self)))
+			UtilzLog.order(UtilzLog.defer("[EFFECTIVE] [ID=%i] t=`%s' %s", self.getId(), info['pair'].getTimestamp(), self))
 
 		elif info['status'] == Order.STATUS_CANCELED:
 			# Cancel message
-			UtilzLog.error("[CANCELED] [ID=%i] t=`%s' %s (%s)" % (self.getId(), str(info['pair'].getTimestamp()), str(self), self.getMessage()))
+			UtilzLog.error(UtilzLog.defer("[CANCELED] [ID=%i] t=`%s' %s (%s)", self.getId(), info['pair'].getTimestamp(), self, self.getMessage()))
 			# Set this order as unactive
 			self.unactive()
 			return
 
 		elif info['status'] == Order.STATUS_COMPLETED:
 			# Completed message
-			UtilzLog.order("[COMPLETED] [ID=%i] t=`%s' %s" % (self.getId(), str(info['pair'].getTimestamp()), str(self)))
+			UtilzLog.order(UtilzLog.defer("[COMPLETED] [ID=%i] t=`%s' %s", self.getId(), info['pair'].getTimestamp(), self))
 			# Set this order as unactive
 			self.unactive()
 			# Execute the next chained orders if any
@@ -560,15 +588,14 @@ class Order(object):
 		"""
 		Set the order to the active order list.
 		"""
-		Order.activeList.append(self)
+		self.tradingContext.orderActive(self)
 
 	def unactive(self):
 		"""
 		Remove the order to the active order list.
 		"""
 		# Remove it from the active order list
-		while self in Order.activeList:
-			Order.activeList.remove(self)
+		self.tradingContext.orderUnactive(self)
 
 class OrderBuy(Order):
 	"""
@@ -601,6 +628,16 @@ class OrderBuy(Order):
 			return 1. / pair.getAvg()
 		return 1. / pair.getAsk()
 
+	def getDepthLevels(self):
+		"""
+		Returns the levels of the order book this order would consume, best
+		first, as a list of [rate, amount] in the terms of this order: the
+		base currency received per quote currency and the quote currency
+		that can be spent at this rate.
+		"""
+		rates, amounts = self.getPair().getOrderBook().getLevels(OrderBook.ASKS)
+		return [[1. / rate, rate * amount] for rate, amount in zip(rates, amounts)]
+
 	def getAmountCurrency(self):
 		"""
 		Get the currency of the amount of this order
@@ -651,6 +688,14 @@ class OrderSell(Order):
 		if mode == Order.UPDATE_FROM_AVERAGE:
 			return pair.getAvg()
 		return pair.getBid()
+
+	def getDepthLevels(self):
+		"""
+		Returns the levels of the order book this order would consume, best
+		first, as a list of [rate, amount] with the amount in base currency.
+		"""
+		rates, amounts = self.getPair().getOrderBook().getLevels(OrderBook.BIDS)
+		return [[rate, amount] for rate, amount in zip(rates, amounts)]
 			
 
 	def getAmountCurrency(self):
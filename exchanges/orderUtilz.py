@@ -68,3 +68,59 @@ class OrderUtilz(object):
 			else:
 				value = value + balance[currency]
 		return value
+
+	@staticmethod
+	def sizeChain(order, maxAmount = None, minRate = 1.):
+		"""
+		Identify the amount maximizing the gain of an order chain, by walking
+		the order books of all its orders at once.
+		The amount is increased level by level as long as the marginal rate of
+		the whole chain, fees included, is above the minimal rate. Only the proportional part
+		of the fees is considered.
+		\param order The first order of the chain
+		\param maxAmount The maximum amount available, unlimited if None
+		\param minRate The minimal marginal rate of the chain
+		\return [amount, finalAmount], the amount being 0 if no amount is
+		profitable, or None if the depth of one of the orders is unknown
+		"""
+		# The state of each order: its levels, the current level and the
+		# amount already consumed from it, the total amounts in and out
+		legs = []
+		o = order
+		while o:
+			levels = o.getDepthLevels()
+			if len(levels) == 0:
+				return None
+			legs.append([levels, 0, 0., 0., o.getTransaction()])
+			o = o.next()
+		amount = 0.
+		finalAmount = 0.
+		while True:
+			# Marginal rate of the chain and the amount it is valid for
+			marginal = 1.
+			step = (maxAmount - amount) if maxAmount != None else float("inf")
+			rateList = []
+			for levels, i, used, output, transaction in legs:
+				# One of the books is exhausted
+				if i >= len(levels):
+					return [amount, finalAmount]
+				rate = levels[i][0] * (1. - transaction.getFeeRate(output))
+				step = min(step, (levels[i][1] - used) / marginal)
+				marginal = marginal * rate
+				rateList.append(rate)
+			# Stop as soon as an extra amount is not profitable anymore
+			if marginal <= minRate or step <= 0.:
+				return [amount, finalAmount]
+			# Consume the step on each order
+			consumed = step
+			for leg, rate in zip(legs, rateList):
+				levels, i = leg[0], leg[1]
+				leg[2] = leg[2] + consumed
+				leg[3] = leg[3] + consumed * rate
+				# Move to the next level once this one is exhausted (with some tolerance for the rounding)
+				if leg[2] >= levels[i][1] * (1. - 1e-9):
+					leg[1] = i + 1
+					leg[2] = 0.
+				consumed = consumed * rate
+			amount = amount + step
+			finalAmount = finalAmount + step * marginal
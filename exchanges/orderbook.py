@@ -0,0 +1,99 @@
+#!/usr/bin/python
+# -*- coding: iso-8859-1 -*-
+
+from utilz.log import *
+
+import array
+
+class OrderBook(object):
+	"""
+	Depth of the market of a pair, the price levels of the bids and asks.
+
+	Each side is stored in two contiguous typed arrays, the rates and the
+	amounts (in base currency) of the levels, sorted from the best rate:
+	decreasing for the bids and increasing for the asks.
+	A snapshot replaces the whole book, a level can also be updated on its own.
+	"""
+	BIDS = "bids"
+	ASKS = "asks"
+
+	def __init__(self):
+		self.clear()
+
+	def __len__(self):
+		return len(self.bidRates) + len(self.askRates)
+
+	def clear(self):
+		"""
+		Remove all the levels
+		"""
+		self.bidRates = array.array('d')
+		self.bidAmounts = array.array('d')
+		self.askRates = array.array('d')
+		self.askAmounts = array.array('d')
+		self.timestamp = None
+
+	def set(self, bids, asks, timestamp = None):
+		"""
+		Replace the book with a snapshot, returns True if the levels have changed
+		\param bids List of [rate, amount] levels, in any order
+		\param asks List of [rate, amount] levels, in any order
+		"""
+		bids = sorted([level for level in bids if level[1] > 0], key = lambda level: -level[0])
+		asks = sorted([level for level in asks if level[1] > 0], key = lambda level: level[0])
+		levels = [array.array('d', [level[0] for level in bids]),
+				array.array('d', [level[1] for level in bids]),
+				array.array('d', [level[0] for level in asks]),
+				array.array('d', [level[1] for level in asks])]
+		changed = levels != [self.bidRates, self.bidAmounts, self.askRates, self.askAmounts]
+		self.bidRates, self.bidAmounts, self.askRates, self.askAmounts = levels
+		self.timestamp = timestamp
+		return changed
+
+	def update(self, side, rate, amount, timestamp = None):
+		"""
+		Set the amount of a single level, a zero amount removes the level
+		"""
+		if side == OrderBook.BIDS:
+			rates, amounts, direction = self.bidRates, self.bidAmounts, -1
+		elif side == OrderBook.ASKS:
+			rates, amounts, direction = self.askRates, self.askAmounts, 1
+		else:
+			raise error("Unknown order book side `%s'." % (str(side)))
+		# Look for the position of this rate, the rates are sorted from the best one
+		low = 0
+		high = len(rates)
+		while low < high:
+			middle = (low + high) // 2
+			if (rates[middle] - rate) * direction < 0:
+				low = middle + 1
+			else:
+				high = middle
+		if low < len(rates) and rates[low] == rate:
+			if amount > 0:
+				amounts[low] = amount
+			else:
+				del rates[low]
+				del amounts[low]
+		elif amount > 0:
+			rates.insert(low, rate)
+			amounts.insert(low, amount)
+		if timestamp != None:
+			self.timestamp = timestamp
+
+	def getLevels(self, side):
+		"""
+		Returns the rates and the amounts of the levels of a side.
+		The arrays are not copied.
+		"""
+		if side == OrderBook.BIDS:
+			return [self.bidRates, self.bidAmounts]
+		if side == OrderBook.ASKS:
+			return [self.askRates, self.askAmounts]
+		raise error("Unknown order book side `%s'." % (str(side)))
+
+	def getTimestamp(self):
+		"""
+		Returns the timestamp of the last update, None if the book has never been set
+		"""
+		return self.timestamp
@@ -0,0 +1,139 @@
+#!/usr/bin/python
+# -*- coding: iso-8859-1 -*-
+
+from utilz.log import *
+
+class OrderRegistry(object):
+	"""
+	Registry of the active orders.
+
+	Orders are keyed by their identifier and indexed by status, exchange and
+	pair, so that adding, removing, updating and querying orders do not need
+	to scan the whole list. The indexes must be updated through updateStatus
+	whenever the status of a registered order changes.
+	"""
+
+	def __init__(self):
+		# Orders by identifier
+		self.orders = {}
+		# Indexes, each one maps a key to a dictionary of orders by identifier
+		self.byStatus = {}
+		self.byExchange = {}
+		self.byPair = {}
+
+	def __len__(self):
+		return len(self.orders)
+
+	def __contains__(self, order):
+		return self.orders.get(order.getId()) is order
+
+	@staticmethod
+	def indexAdd(index, key, order):
+		if not index.has_key(key):
+			index[key] = {}
+		index[key][order.getId()] = order
+
+	@staticmethod
+	def indexRemove(index, key, order):
+		if index.has_key(key):
+			index[key].pop(order.getId(), None)
+			if len(index[key]) == 0:
+				del index[key]
+
+	def add(self, order):
+		"""
+		Add an order to the registry
+		"""
+		identifier = order.getId()
+		if self.orders.has_key(identifier):
+			if self.orders[identifier] is order:
+				return
+			raise error("An order with the identifier `%s' is already registered." % (str(identifier)))
+		self.orders[identifier] = order
+		pair = order.getPair()
+		self.indexAdd(self.byStatus, order.getStatus(), order)
+		self.indexAdd(self.byExchange, pair.getExchange(), order)
+		self.indexAdd(self.byPair, pair, order)
+
+	def remove(self, order):
+		"""
+		Remove an order from the registry, does nothing if it is not registered
+		"""
+		if not order in self:
+			return
+		del self.orders[order.getId()]
+		pair = order.getPair()
+		self.indexRemove(self.byStatus, order.getStatus(), order)
+		self.indexRemove(self.byExchange, pair.getExchange(), order)
+		self.indexRemove(self.byPair, pair, order)
+
+	def updateStatus(self, order, previousStatus):
+		"""
+		Move an order to the index of its current status
+		"""
+		if not order in self:
+			return
+		self.indexRemove(self.byStatus, previousStatus, order)
+		self.indexAdd(self.byStatus, order.getStatus(), order)
+
+	def get(self, identifier):
+		"""
+		Return an order from its identifier, None if not registered
+		"""
+		return self.orders.get(identifier)
+
+	def getList(self, statusList = None, exchange = None, pair = None):
+		"""
+		Returns the list of orders matching all the criteria set, sorted by identifier
+		\param statusList List of statuses allowed
+		\param exchange The exchange of the orders
+		\param pair The pair of the orders
+		"""
+		# Start from the smallest index available
+		candidates = []
+		if exchange != None:
+			candidates.append(self.byExchange.get(exchange, {}))
+		if pair != None:
+			candidates.append(self.byPair.get(pair, {}))
+		if statusList != None:
+			orders = {}
+			for status in statusList:
+				orders.update(self.byStatus.get(status, {}))
+			candidates.append(orders)
+		if len(candidates) == 0:
+			orders = self.orders
+		else:
+			orders = min(candidates, key = len)
+		# Filter the orders
+		orderList = []
+		for identifier in orders:
+			order = orders[identifier]
+			if exchange != None and not self.byExchange.get(exchange, {}).has_key(identifier):
+				continue
+			if pair != None and not self.byPair.get(pair, {}).has_key(identifier):
+				continue
+			if statusList != None and order.getStatus() not in statusList:
+				continue
+			orderList.append(order)
+		return sorted(orderList, key = lambda o: o.getId())
+
+	def count(self, statusList = None, exchange = None):
+		"""
+		Returns the number of orders matching the criteria set
+		"""
+		if exchange == None:
+			if statusList == None:
+				return len(self.orders)
+			return sum([len(self.byStatus.get(status, {})) for status in set(statusList)])
+		orders = self.byExchange.get(exchange, {})
+		if statusList == None:
+			return len(orders)
+		# Intersect the indexes, iterating through the smallest one of each pair
+		count = 0
+		for status in set(statusList):
+			statusOrders = self.byStatus.get(status, {})
+			if len(statusOrders) < len(orders):
+				count = count + len([identifier for identifier in statusOrders if orders.has_key(identifier)])
+			else:
+				count = count + len([identifier for identifier in orders if statusOrders.has_key(identifier)])
+		return count
@@ -5,14 +5,12 @@ from exchanges.exchange import *
 from exchanges.currency import *
 from exchanges.transaction import *
 from exchanges.order import *
+from exchanges.port.btceapi import *
+from exchanges.scheduler import *
 from utilz.log import *
 from utilz.data import *
 
-import hashlib
-import hmac
-import urllib
 import re
-import threading
 
 class ExchangeBTCE(Exchange):
 	"""
@@ -47,13 +45,22 @@ class ExchangeBTCE(Exchange):
 		#"xpm_btc": [Currency.XPM, Currency.BTC]
 	}
 
-	nonce = 1
+	# Default base URL of the API
+	API_URL = "https://btc-e.com"
+	# Default number of levels of the order books, when the depth is fetched
+	DEPTH_LIMIT = 20
 
 	def initialize(self):
 		# Set the name of the exchange
 		self.context["name"] = "BTC-e"
-		# Fetch info from the exchange
-		info = UtilzData().fetch({'url': "https://btc-e.com/api/3/info"}).fromJSON().get()
+		# Base URL of the API, can be changed to use a local server
+		if not self.config.has_key('apiUrl') or self.config['apiUrl'] == None:
+			self.config['apiUrl'] = self.API_URL
+		# Fetch info from the exchange, or from a saved copy if any (useful to replay records offline)
+		if self.config.has_key('info') and self.config['info'] != None:
+			info = UtilzData().fetchJSON({'file': self.config['info']}).get()
+		else:
+			info = UtilzData().fetchJSON({'url': self.config['apiUrl'] + "/api/3/info"}).get()
 		# Make sure there is no error
 		if not info.has_key("pairs"):
 			raise error("The response is malformed `%s'." % (str(data)))
@@ -104,10 +111,23 @@ class ExchangeBTCE(Exchange):
 					'withdraw': Transaction({'time': { 'completed': 2 * 3600 * 24 }})
 				}, key)
 			)
+		# Fetch only the pairs due, at an adaptive interval
+		if self.config.get('scheduler'):
+			schedulerConfig = {'depth': self.config.get('depth', False)}
+			if isinstance(self.config['scheduler'], dict):
+				schedulerConfig.update(self.config['scheduler'])
+			self.context['scheduler'] = FetchScheduler(sorted(self.SUPPORTED_PAIRS.keys()), schedulerConfig)
 		# Initialize the account if simulation is False only
-		if self.simulation == False:
-			# Set the semaphore for accessing the API
-			self.semaphore = threading.Semaphore()
+		if self.isSimulation() == False:
+			# Client of the private API
+			self.api = BTCEPrivateAPI({
+				'name': self.getName(),
+				'url': self.config['apiUrl'] + "/tapi",
+				'apiKey': self.config['apiKey'],
+				'apiSecret': self.config['apiSecret'],
+				'workers': self.config.get('apiWorkers', 2),
+				'stats': self.getStats()
+			})
 			# Update the nonce number if needed
 			self.syncNonce()
 			self.updateBalancePort()
@@ -115,15 +135,21 @@ class ExchangeBTCE(Exchange):
 	def syncNonce(self):
 		self.btceAPI("getInfo", retry = False)
 
+	def fetchBalancePort(self):
+		"""
+		Fetch the account information, the balance being updated by updateBalancePort
+		"""
+		info = self.btceAPI("getInfo")
+		if info[0] == False:
+			raise error("`%s' error: %s" % (self.getName(), info[1]))
+		return info[1]
+
 	def updateBalancePort(self, info = None):
 		"""
 		Updates the balance
 		"""
 		if info == None:
-			info = self.btceAPI("getInfo")
-			if info[0] == False:
-				raise error("`%s' error: %s" % (self.getName(), info[1]))
-			info = info[1]
+			info = self.fetchBalancePort()
 		balance = {}
 		if not info.has_key("funds") or not isinstance(info['funds'], dict):
 			raise error("Invalid getInfo response.")
@@ -156,77 +182,12 @@ class ExchangeBTCE(Exchange):
 		# Update the balance
 		self.setBalance(balance)
 
-	def btceAPI(self, method, args = {}, retry = True):
+	def btceAPI(self, method, args = {}, retry = True, priority = None):
 		"""
-		Generic function to get info from the private API
+		Generic function to get info from the private API.
+		Requests are sent concurrently, trades being served before the other requests.
 		"""
-		# Acquire the sempahore
-		self.semaphore.acquire()
-
-		params = {
-			"method": method,
-			"nonce": self.nonce
-		}
-		# Add the parameters if any
-		params.update(args)
-		# Update the nonce request
-		self.nonce = self.nonce + 1
-		# Update the params
-		params = urllib.urlencode(params)
-		# Hash the params string to produce the Sign header value
-		h = hmac.new(self.config['apiSecret'], digestmod = hashlib.sha512)
-		h.update(params)
-		sign = h.hexdigest()
-		# Generate the headers
-		headers = {
-			"Key": self.config['apiKey'],
-			"Sign": sign
-		}
-		# Fetch the result
-		try:
-			result = UtilzData().fetch({
-				'url': "https://btc-e.com/tapi",
-				'post': params,
-				'headers': headers
-			}).fromJSON().get()
-		except:
-			# Release the sempahore
-			self.semaphore.release()
-			return [False, "Error while fetching `https://btc-e.com/tapi'"]
-
-		# Release the sempahore
-		self.semaphore.release()
-
-		# If there is an error
-		isError = False
-		if not result.has_key("success") or result["success"] != 1:
-			isError = True
-			if result.has_key("error"):
-				message = str(result['error'])
-			else:
-				message = str(result['result'])
-		elif not result.has_key("return") or not isinstance(result['return'], dict):
-			isError = True
-			message = str(result)
-
-		# Handle error
-		if isError == True:
-
-			# Check if the nonce number is not in sync
-			m = re.match(".*you should send:([0-9]+).*", message)
-			if m:
-				self.nonce = int(m.group(1))
-				if retry:
-					UtilzLog.info("`%s' Adjusting nonce to `%i' and retrying command `%s'" % (self.getName(), self.nonce, method), 1)
-					# Retry with the new nonce
-					return self.btceAPI(method, args)
-				else:
-					UtilzLog.info("`%s' Adjusting nonce to `%i'" % (self.getName(), self.nonce), 1)
-
-			return [False, message]
-
-		# Return the result only if successfull
-		return [True, result['return']]
+		return self.api.request(method, args, retry, priority)
 
 	def tradePort(self, order):
 		"""
@@ -255,7 +216,7 @@ class ExchangeBTCE(Exchange):
 			return [False, "Unsupported transaction type `%s'" % (info['type'])]
 
 		# Processing order
-		UtilzLog.order("`%s' Trading `%s' `%s' rate:%f amount:%f" % (self.getName(), pair, info['type'], rate, amount))
+		UtilzLog.order(UtilzLog.defer("`%s' Trading `%s' `%s' rate:%f amount:%f", self.getName(), pair, info['type'], rate, amount))
 
 		info = self.btceAPI("Trade", {
 			'pair': pair,
@@ -311,28 +272,90 @@ class ExchangeBTCE(Exchange):
 		"""
 		This function updates the exchange pairs
 		"""
-		keys = [key for key in self.SUPPORTED_PAIRS]
-		# Fetch info from the exchange
-		info = UtilzData().fetch({'url': "https://btc-e.com/api/3/ticker/" + "-".join(keys)}).fromJSON().get()
+		self.applyPairsPort(self.fetchPairsPort())
 
-		# Loop through the pairs and update the values
-		for key in self.SUPPORTED_PAIRS:
-			currencyPair = self.SUPPORTED_PAIRS[key]
-			# Make sure the info exists
-			if not info.has_key(key):
-				raise error("The info for the the key `%s' is missing." % (str(key)))
-			# Read the info for this specific pair
-			infoKey = info[key]
-			self.pairUpdate(currencyPair[0], currencyPair[1], {
-				'high': infoKey["high"],
-				'low': infoKey["low"],
-				'avg': infoKey["avg"],
-				'volume': infoKey["vol"],
-				'volumeCurrency': infoKey["vol_cur"],
-				'last': infoKey["last"],
-				'ask': infoKey["buy"],
-				'bid': infoKey["sell"],
-				'timestamp': infoKey["updated"]
-			})
+	def fetchEndpoint(self, endpoint, keys):
+		"""
+		Fetch the ticker or the depth of some pairs
+		"""
+		if endpoint == FetchScheduler.DEPTH:
+			return UtilzData().fetchJSON({'url': "%s/api/3/depth/%s?limit=%i" % (self.config['apiUrl'], "-".join(keys), self.config.get('depthLimit', self.DEPTH_LIMIT)), 'stats': self.getStats()}).get()
+		return UtilzData().fetchJSON({'url': self.config['apiUrl'] + "/api/3/ticker/" + "-".join(keys), 'stats': self.getStats()}).get()
+
+	def fetchPairsPort(self):
+		"""
+		Fetch the data of the pairs, returns a list of [endpoint, keys, response].
+		With a scheduler, it waits until the next request is due and only fetches
+		the pairs which are due, with as few requests as possible.
+		"""
+		scheduler = self.getScheduler()
+		if scheduler == None:
+			keys = [key for key in self.SUPPORTED_PAIRS]
+			responses = [[FetchScheduler.TICKER, keys, self.fetchEndpoint(FetchScheduler.TICKER, keys)]]
+			if self.config.get('depth', False):
+				responses.append([FetchScheduler.DEPTH, keys, self.fetchEndpoint(FetchScheduler.DEPTH, keys)])
+			return responses
+		scheduler.wait()
+		responses = []
+		for endpoint, keys in scheduler.getBatches():
+			scheduler.requestSent()
+			try:
+				responses.append([endpoint, keys, self.fetchEndpoint(endpoint, keys)])
+			except Exception as e:
+				# Back off and retry these pairs later
+				UtilzLog.warning("`%s' Failed to fetch the %s of %i pair(s): %s" % (self.getName(), endpoint, len(keys), str(e)))
+				self.getStats().increment("apiErrors")
+				scheduler.requestFailed(endpoint, keys)
+		return responses
+
+	def applyPairsPort(self, responses):
+		"""
+		Update the pairs with the responses returned by fetchPairsPort
+		"""
+		scheduler = self.getScheduler()
+		# Timestamps of the tickers, to date the order books
+		ticker = {}
+		for endpoint, keys, info in responses:
+			if endpoint == FetchScheduler.TICKER:
+				ticker.update(info)
+		timestamp = None
+		# Update the order books first, the orders processed with the new rates see the new depth
+		for endpoint, keys, info in sorted(responses, key = lambda response: response[0] != FetchScheduler.DEPTH):
+			for key in keys:
+				# Make sure the info exists
+				if not info.has_key(key):
+					if scheduler == None:
+						raise error("The %s for the the key `%s' is missing." % (endpoint, str(key)))
+					UtilzLog.warning("`%s' The %s for the the key `%s' is missing." % (self.getName(), endpoint, str(key)))
+					scheduler.requestFailed(endpoint, [key])
+					continue
+				currencyPair = self.SUPPORTED_PAIRS[key]
+				pair = self.getPair(currencyPair[0], currencyPair[1])
+				if endpoint == FetchScheduler.DEPTH:
+					changed = self.pairUpdateDepth(currencyPair[0], currencyPair[1], info[key].get("bids", []), info[key].get("asks", []), ticker[key]["updated"] if ticker.has_key(key) else pair.getTimestamp())
+				else:
+					changed = pair.getBid() != info[key]["sell"] or pair.getAsk() != info[key]["buy"]
+					# The pair is updated even if unchanged, to process its orders
+					self.pairUpdate(currencyPair[0], currencyPair[1], self.parseTicker(info[key]))
+					timestamp = max(timestamp, info[key]["updated"])
+				if scheduler != None:
+					scheduler.update(endpoint, key, changed)
 		# Update the timestamp of the exchange
-		self.setTimestamp(infoKey["updated"])
+		if timestamp != None:
+			self.setTimestamp(timestamp)
+
+	def parseTicker(self, infoKey):
+		"""
+		Convert the ticker of a pair into the pair data
+		"""
+		return {
+			'high': infoKey["high"],
+			'low': infoKey["low"],
+			'avg': infoKey["avg"],
+			'volume': infoKey["vol"],
+			'volumeCurrency': infoKey["vol_cur"],
+			'last': infoKey["last"],
+			'ask': infoKey["buy"],
+			'bid': infoKey["sell"],
+			'timestamp': infoKey["updated"]
+		}
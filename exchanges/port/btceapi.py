@@ -0,0 +1,220 @@
+#!/usr/bin/python
+# -*- coding: iso-8859-1 -*-
+
+from utilz.log import *
+from utilz.data import *
+
+import hashlib
+import hmac
+import Queue
+import re
+import threading
+import urllib
+
+class BTCEPrivateAPIRequest(object):
+	"""
+	A request to the private API, waiting to be processed by a worker
+	"""
+
+	def __init__(self, method, args, priority, retry):
+		self.method = method
+		self.args = args
+		self.priority = priority
+		self.retry = retry
+		# Number of times the nonce has been adjusted for this request
+		self.attempt = 0
+		self.result = None
+		self.event = threading.Event()
+
+	def done(self, result):
+		self.result = result
+		self.event.set()
+
+	def wait(self):
+		"""
+		Wait for the request to be processed and returns its result
+		"""
+		# Wait with a timeout, so that the thread can still be interrupted
+		while not self.event.is_set():
+			self.event.wait(1)
+		return self.result
+
+class BTCEPrivateAPI(object):
+	"""
+	Client of the BTC-e private API.
+
+	Requests are sent concurrently by a set of workers, the nonces being
+	reserved atomically just before signing. As the requests may then reach
+	the server out of order, a request rejected because of its nonce is
+	re-queued with the nonce expected by the server ("you should send:").
+	Requests are served by priority, so that a trade does not wait behind a
+	background balance request.
+	"""
+	# Request priorities, the lowest is served first
+	PRIORITY_TRADE = 0
+	PRIORITY_ORDERS = 1
+	PRIORITY_BALANCE = 2
+	# Default priority of the methods
+	METHOD_PRIORITY = {
+		"Trade": PRIORITY_TRADE,
+		"CancelOrder": PRIORITY_TRADE,
+		"ActiveOrders": PRIORITY_ORDERS,
+		"OrderInfo": PRIORITY_ORDERS,
+		"getInfo": PRIORITY_BALANCE
+	}
+	# Maximum number of nonce adjustments of a request
+	MAX_RETRY = 5
+
+	def __init__(self, config = {}):
+		self.config = {
+			'name': "BTC-e",
+			'url': "https://btc-e.com/tapi",
+			'apiKey': None,
+			'apiSecret': None,
+			# Initial nonce
+			'nonce': 1,
+			# Number of requests sent concurrently
+			'workers': 2,
+			# Statistics counting the errors and the nonce adjustments, if any
+			'stats': None
+		}
+		self.config.update(config)
+		self.nonce = self.config['nonce']
+		self.nonceLock = threading.Lock()
+		# Sequence number, to keep the order of the requests with the same priority
+		self.sequence = 0
+		self.queue = Queue.PriorityQueue()
+		# Start the workers
+		for i in range(self.config['workers']):
+			t = threading.Thread(target = self.taskWorker)
+			t.daemon = True
+			t.start()
+
+	def increment(self, name):
+		"""
+		Increment a counter of the statistics, if any
+		"""
+		if self.config['stats'] != None:
+			self.config['stats'].increment(name)
+
+	def reserveNonce(self):
+		"""
+		Atomically reserve the next nonce
+		"""
+		with self.nonceLock:
+			nonce = self.nonce
+			self.nonce = self.nonce + 1
+			return nonce
+
+	def adjustNonce(self, nonce):
+		"""
+		Set the next nonce to the one expected by the server, it never goes backward
+		"""
+		with self.nonceLock:
+			self.nonce = max(self.nonce, nonce)
+			return self.nonce
+
+	def push(self, request):
+		with self.nonceLock:
+			self.sequence = self.sequence + 1
+			sequence = self.sequence
+		self.queue.put((request.priority, sequence, request))
+
+	def submit(self, method, args = {}, retry = True, priority = None):
+		"""
+		Queue a request and returns it without waiting for its result
+		"""
+		if priority == None:
+			priority = self.METHOD_PRIORITY.get(method, self.PRIORITY_ORDERS)
+		request = BTCEPrivateAPIRequest(method, args, priority, retry)
+		self.push(request)
+		return request
+
+	def request(self, method, args = {}, retry = True, priority = None):
+		"""
+		Send a request and wait for its result
+		"""
+		return self.submit(method, args, retry, priority).wait()
+
+	def taskWorker(self):
+		"""
+		Process the queued requests
+		"""
+		while True:
+			priority, sequence, request = self.queue.get()
+			try:
+				result = self.send(request)
+			except Exception as e:
+				result = [False, str(e)]
+			# The request has been re-queued
+			if result == None:
+				continue
+			request.done(result)
+
+	def send(self, request):
+		"""
+		Send a request, returns its result or None if it has been re-queued
+		"""
+		params = {
+			"method": request.method,
+			"nonce": self.reserveNonce()
+		}
+		# Add the parameters if any
+		params.update(request.args)
+		# Update the params
+		params = urllib.urlencode(params)
+		# Hash the params string to produce the Sign header value
+		h = hmac.new(self.config['apiSecret'], digestmod = hashlib.sha512)
+		h.update(params)
+		sign = h.hexdigest()
+		# Generate the headers
+		headers = {
+			"Key": self.config['apiKey'],
+			"Sign": sign
+		}
+		# Fetch the result
+		try:
+			result = UtilzData().fetchJSON({
+				'url': self.config['url'],
+				'post': params,
+				'headers': headers
+			}).get()
+		except:
+			self.increment("apiErrors")
+			return [False, "Error while fetching `%s'" % (self.config['url'])]
+
+		# If there is an error
+		isError = False
+		if not result.has_key("success") or result["success"] != 1:
+			isError = True
+			if result.has_key("error"):
+				message = str(result['error'])
+			else:
+				message = str(result['result'])
+		elif not result.has_key("return") or not isinstance(result['return'], dict):
+			isError = True
+			message = str(result)
+
+		# Handle error
+		if isError == True:
+
+			# Check if the nonce number is not in sync
+			m = re.match(".*you should send:([0-9]+).*", message)
+			if m:
+				self.increment("nonceResyncs")
+				nonce = self.adjustNonce(int(m.group(1)))
+				if request.retry and request.attempt < self.MAX_RETRY:
+					request.attempt = request.attempt + 1
+					UtilzLog.info("`%s' Adjusting nonce to `%i' and retrying command `%s'" % (self.config['name'], nonce, request.method), 1)
+					# Retry with the new nonce
+					self.push(request)
+					return None
+				else:
+					UtilzLog.info("`%s' Adjusting nonce to `%i'" % (self.config['name'], nonce), 1)
+			else:
+				self.increment("apiErrors")
+
+			return [False, message]
+
+		# Return the result only if successfull
+		return [True, result['return']]
@@ -0,0 +1,64 @@
+#!/usr/bin/python
+# -*- coding: iso-8859-1 -*-
+
+from utilz.log import *
+
+import decimal
+import math
+
+class Quantizer(object):
+	"""
+	Floor numbers down to a fixed number of decimals.
+
+	Quantizers are shared by all the transactions with the same number of
+	decimals, the scale factor being computed only once.
+	By default the numbers are scaled with a floating point multiplication,
+	which might floor a number such as 0.29 down to 0.28. The exact mode
+	works on the decimal representation of the numbers instead, it is slower
+	but the result is the one expected by the exchange.
+	"""
+	# Quantizers by number of decimals
+	cache = {}
+	# Exact mode
+	exact = False
+
+	def __init__(self, maxDecimal):
+		self.maxDecimal = maxDecimal
+		self.scale = math.pow(10, maxDecimal)
+		self.quantum = decimal.Decimal(1).scaleb(-maxDecimal)
+		# Enough precision to quantize any float
+		self.context = decimal.Context(prec = 400)
+		self.setExactMode(Quantizer.exact)
+
+	@staticmethod
+	def get(maxDecimal):
+		"""
+		Returns the quantizer for a specific number of decimals
+		"""
+		if not Quantizer.cache.has_key(maxDecimal):
+			Quantizer.cache[maxDecimal] = Quantizer(maxDecimal)
+		return Quantizer.cache[maxDecimal]
+
+	@staticmethod
+	def setExact(exact):
+		"""
+		Enable or disable the exact mode of all the quantizers
+		"""
+		Quantizer.exact = exact
+		for maxDecimal in Quantizer.cache:
+			Quantizer.cache[maxDecimal].setExactMode(exact)
+
+	def setExactMode(self, exact):
+		self.floor = self.floorExact if exact else self.floorFast
+
+	def floorFast(self, n):
+		"""
+		Floor a number using a floating point scaling
+		"""
+		return int(n * self.scale) / self.scale
+
+	def floorExact(self, n):
+		"""
+		Floor a number using its decimal representation
+		"""
+		return float(decimal.Decimal(repr(n)).quantize(self.quantum, rounding = decimal.ROUND_DOWN, context = self.context))
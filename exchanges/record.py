@@ -0,0 +1,213 @@
+#!/usr/bin/python
+# -*- coding: iso-8859-1 -*-
+
+from utilz.log import *
+
+import json
+import mmap
+import struct
+import sys
+
+class RecordBinary(object):
+	"""
+	Binary record format of the exchange pairs.
+
+	The file starts with a header describing the pair set:
+		- magic (4 bytes) and version (uint16)
+		- number of pairs (uint16) and number of columns (uint8)
+		- for each pair, the base and quote currencies (uint8 length + string)
+	Then each tick is stored as:
+		- a bit mask of the cells (pair x column) which have changed since the previous tick
+		- the new value of each changed cell, as a float64
+	All the values are little-endian, undefined values are stored as NaN.
+	"""
+	MAGIC = "BTCR"
+	VERSION = 1
+	# Columns stored for each pair, same names as the JSON records
+	COLUMNS = ['bid', 'ask', 'avg', 'v', 't']
+
+	@staticmethod
+	def isBinary(filename):
+		"""
+		Returns True if the file is a binary record
+		"""
+		with open(filename, 'rb') as f:
+			return f.read(len(RecordBinary.MAGIC)) == RecordBinary.MAGIC
+
+	@staticmethod
+	def maskSize(nbPairs):
+		"""
+		Returns the size in bytes of the change mask of a tick
+		"""
+		return (nbPairs * len(RecordBinary.COLUMNS) + 7) // 8
+
+	@staticmethod
+	def convert(jsonFilename, binaryFilename):
+		"""
+		Convert a JSON-lines record into a binary record.
+		Returns the number of ticks converted.
+		"""
+		# Identify the pair set
+		pairs = []
+		keys = {}
+		with open(jsonFilename) as f:
+			for line in f:
+				for pairData in json.loads(line):
+					key = str(pairData['b']) + str(pairData['q'])
+					if not keys.has_key(key):
+						keys[key] = len(pairs)
+						pairs.append([pairData['b'], pairData['q']])
+		# Convert the ticks
+		writer = RecordBinaryWriter(binaryFilename, pairs)
+		values = [[None] * len(RecordBinary.COLUMNS) for pair in pairs]
+		nbTicks = 0
+		with open(jsonFilename) as f:
+			for line in f:
+				for pairData in json.loads(line):
+					data = values[keys[str(pairData['b']) + str(pairData['q'])]]
+					for i, column in enumerate(RecordBinary.COLUMNS):
+						if pairData.has_key(column):
+							data[i] = pairData[column]
+				writer.write(values)
+				nbTicks = nbTicks + 1
+		writer.close()
+		return nbTicks
+
+class RecordBinaryWriter(object):
+	"""
+	Write ticks into a binary record through a persistent buffered handle
+	"""
+	# Number of ticks after which the data are flushed to the file
+	FLUSH_TICKS = 100
+	# Size of the write buffer
+	BUFFER_SIZE = 65536
+
+	def __init__(self, filename, pairs):
+		"""
+		\param pairs List of [baseCurrency, quoteCurrency]
+		"""
+		self.pairs = pairs
+		self.nbCells = len(pairs) * len(RecordBinary.COLUMNS)
+		self.maskSize = RecordBinary.maskSize(len(pairs))
+		self.previous = [float("nan")] * self.nbCells
+		self.nbTicks = 0
+		self.file = open(filename, 'wb', self.BUFFER_SIZE)
+		# Write the header
+		header = [RecordBinary.MAGIC, struct.pack("<HHB", RecordBinary.VERSION, len(pairs), len(RecordBinary.COLUMNS))]
+		for pair in pairs:
+			for currency in pair:
+				currency = str(currency)
+				header.append(struct.pack("<B", len(currency)) + currency)
+		self.file.write("".join(header))
+
+	def write(self, values):
+		"""
+		Write a tick
+		\param values List containing for each pair the list of values of the columns
+		"""
+		mask = bytearray(self.maskSize)
+		changes = []
+		previous = self.previous
+		cell = 0
+		for data in values:
+			for value in data:
+				value = float("nan") if value == None else float(value)
+				p = previous[cell]
+				# Only store the cells which have changed (NaN compares unequal to itself)
+				if value != p and (value == value or p == p):
+					mask[cell >> 3] |= 1 << (cell & 7)
+					changes.append(value)
+					previous[cell] = value
+				cell = cell + 1
+		self.file.write(str(mask))
+		if changes:
+			self.file.write(struct.pack("<%id" % (len(changes)), *changes))
+		# Flush from time to time
+		self.nbTicks = self.nbTicks + 1
+		if self.nbTicks % self.FLUSH_TICKS == 0:
+			self.file.flush()
+
+	def close(self):
+		"""
+		Flush and close the file
+		"""
+		self.file.close()
+
+class RecordBinaryReader(object):
+	"""
+	Replay a binary record, the file is memory-mapped
+	"""
+	# Index of the bits set for each possible byte value
+	BITS = [[bit for bit in range(8) if byte & (1 << bit)] for byte in range(256)]
+
+	def __init__(self, filename):
+		self.file = open(filename, 'rb')
+		self.data = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+		# Read the header
+		if self.data[0:len(RecordBinary.MAGIC)] != RecordBinary.MAGIC:
+			raise error("The file `%s' is not a binary record." % (str(filename)))
+		offset = len(RecordBinary.MAGIC)
+		version, nbPairs, nbColumns = struct.unpack_from("<HHB", self.data, offset)
+		offset = offset + struct.calcsize("<HHB")
+		if version != RecordBinary.VERSION or nbColumns != len(RecordBinary.COLUMNS):
+			raise error("Unsupported binary record version `%i' with `%i' columns." % (version, nbColumns))
+		self.pairs = []
+		for i in range(nbPairs):
+			pair = []
+			for j in range(2):
+				length = ord(self.data[offset])
+				pair.append(self.data[offset + 1:offset + 1 + length])
+				offset = offset + 1 + length
+			self.pairs.append(pair)
+		self.offset = offset
+		self.maskSize = RecordBinary.maskSize(nbPairs)
+		self.values = [[float("nan")] * nbColumns for pair in self.pairs]
+
+	def getPairs(self):
+		"""
+		Returns the list of [baseCurrency, quoteCurrency] of the record
+		"""
+		return self.pairs
+
+	def next(self):
+		"""
+		Read the next tick and returns the values of all the pairs, None at the end of the record.
+		The list returned is updated in place by the next calls.
+		"""
+		data = self.data
+		offset = self.offset
+		if offset + self.maskSize > len(data):
+			return None
+		mask = data[offset:offset + self.maskSize]
+		offset = offset + self.maskSize
+		# Identify the cells that have changed
+		cells = []
+		for i, byte in enumerate(mask):
+			byte = ord(byte)
+			if byte:
+				for bit in self.BITS[byte]:
+					cells.append((i << 3) + bit)
+		if cells:
+			# Ignore a tick which has been partially written
+			if offset + len(cells) * 8 > len(data):
+				return None
+			changes = struct.unpack_from("<%id" % (len(cells)), data, offset)
+			offset = offset + len(cells) * 8
+			nbColumns = len(RecordBinary.COLUMNS)
+			values = self.values
+			for cell, value in zip(cells, changes):
+				values[cell // nbColumns][cell % nbColumns] = value
+		self.offset = offset
+		return self.values
+
+	def close(self):
+		self.data.close()
+		self.file.close()
+
+if __name__ == "__main__":
+
+	if len(sys.argv) != 3:
+		print "Usage: %s <JSON record> <binary record>" % (sys.argv[0])
+		sys.exit(1)
+	nbTicks = RecordBinary.convert(sys.argv[1], sys.argv[2])
+	print "Converted %i ticks from `%s' to `%s'" % (nbTicks, sys.argv[1], sys.argv[2])
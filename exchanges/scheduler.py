@@ -0,0 +1,199 @@
+#!/usr/bin/python
+# -*- coding: iso-8859-1 -*-
+
+from utilz.log import *
+
+import time
+
+class FetchScheduler(object):
+	"""
+	Decide which pairs of an exchange to fetch, from which endpoint and when.
+
+	Each pair has its own polling interval per endpoint (ticker, depth). The
+	interval shrinks when a fetch brings a change and grows when it does not,
+	so that the hot pairs are polled more often than the cold ones.
+	The pairs due at about the same time are merged into the same request,
+	and split if there are too many of them. The number of requests per
+	second is limited, and all the intervals back off when the exchange
+	refuses or fails a request.
+	"""
+	TICKER = "ticker"
+	DEPTH = "depth"
+
+	def __init__(self, keys, config = {}):
+		self.config = {
+			# Bounds and initial value of the polling interval of a pair, in seconds
+			'minInterval': 0.5,
+			'maxInterval': 10.,
+			'initialInterval': 1.,
+			# Factor applied to the interval of a pair which changed, or did not
+			'speedUp': 0.5,
+			'slowDown': 1.5,
+			# Maximum number of requests per second, as allowed by the API
+			'maxRequestRate': 5.,
+			# The pairs due within this delay are fetched with the same request
+			'mergeWindow': 0.25,
+			# Maximum number of pairs per request
+			'maxBatch': 30,
+			# Also schedule the depth endpoint
+			'depth': False,
+			# Factor applied to the bounds of the depth intervals, the depth being heavier to fetch
+			'depthIntervalFactor': 2.,
+			# Factor applied to all the intervals after a failed request, and its maximum
+			'backoff': 2.,
+			'maxBackoff': 60.
+		}
+		self.config.update(config)
+		self.endpoints = [FetchScheduler.TICKER]
+		if self.config['depth']:
+			self.endpoints.append(FetchScheduler.DEPTH)
+		now = time.time()
+		# State of each pair for each endpoint
+		self.states = {}
+		for endpoint in self.endpoints:
+			self.states[endpoint] = {}
+			for key in keys:
+				self.states[endpoint][key] = {
+					'interval': self.config['initialInterval'] * self.getIntervalFactor(endpoint),
+					# Everything is due at the start
+					'next': now,
+					# Time of the last fetch and of the last change
+					'fetched': None,
+					'changed': None,
+					'fetches': 0,
+					'changes': 0
+				}
+		# Current backoff factor
+		self.penalty = 1.
+		# Time of the requests sent, for the rate limit
+		self.requests = []
+		self.requestCount = 0
+		self.failureCount = 0
+
+	def getIntervalFactor(self, endpoint):
+		"""
+		Returns the factor applied to the interval bounds of an endpoint
+		"""
+		return self.config['depthIntervalFactor'] if endpoint == FetchScheduler.DEPTH else 1.
+
+	def getNextRequestTime(self, now):
+		"""
+		Returns the earliest time a request can be sent without exceeding the rate limit
+		"""
+		# Only the requests of the last second matter
+		self.requests = [t for t in self.requests if t > now - 1.]
+		if len(self.requests) < self.config['maxRequestRate']:
+			return now
+		return self.requests[-int(self.config['maxRequestRate'])] + 1.
+
+	def getNextTime(self, now = None):
+		"""
+		Returns the time at which the next request is due
+		"""
+		if now == None:
+			now = time.time()
+		due = min([state['next'] for endpoint in self.states for state in self.states[endpoint].values()])
+		return max(due, self.getNextRequestTime(now))
+
+	def wait(self):
+		"""
+		Sleep until the next request is due
+		"""
+		delay = self.getNextTime() - time.time()
+		if delay > 0:
+			time.sleep(delay)
+
+	def getBatches(self, now = None):
+		"""
+		Returns the requests to send now, as a list of [endpoint, keys]. The
+		requests must then be reported with requestSent.
+		"""
+		if now == None:
+			now = time.time()
+		# Number of requests allowed by the rate limit
+		available = int(self.config['maxRequestRate']) - len([t for t in self.requests if t > now - 1.])
+		batches = []
+		for endpoint in self.endpoints:
+			states = self.states[endpoint]
+			keys = sorted([key for key in states if states[key]['next'] <= now + self.config['mergeWindow']], key = lambda key: states[key]['next'])
+			while len(keys) and len(batches) < available:
+				batches.append([endpoint, keys[:self.config['maxBatch']]])
+				keys = keys[self.config['maxBatch']:]
+		return batches
+
+	def requestSent(self, now = None):
+		"""
+		Report a request sent to the exchange
+		"""
+		self.requests.append(time.time() if now == None else now)
+		self.requestCount = self.requestCount + 1
+
+	def requestFailed(self, endpoint, keys, now = None):
+		"""
+		Report a failed request, all the intervals back off
+		"""
+		if now == None:
+			now = time.time()
+		self.failureCount = self.failureCount + 1
+		self.penalty = min(self.penalty * self.config['backoff'], self.config['maxBackoff'])
+		for key in keys:
+			state = self.states[endpoint][key]
+			state['next'] = now + state['interval'] * self.penalty
+
+	def update(self, endpoint, key, changed, now = None):
+		"""
+		Report the result of the fetch of a pair and schedule its next fetch
+		\param changed True if the data of the pair have changed
+		"""
+		if now == None:
+			now = time.time()
+		state = self.states[endpoint][key]
+		factor = self.getIntervalFactor(endpoint)
+		if changed:
+			state['interval'] = max(self.config['minInterval'] * factor, state['interval'] * self.config['speedUp'])
+			state['changed'] = now
+			state['changes'] = state['changes'] + 1
+		else:
+			state['interval'] = min(self.config['maxInterval'] * factor, state['interval'] * self.config['slowDown'])
+		state['fetched'] = now
+		state['fetches'] = state['fetches'] + 1
+		state['next'] = now + state['interval'] * self.penalty
+		# A successful fetch recovers from the backoff
+		self.penalty = max(1., self.penalty / self.config['backoff'])
+
+	def getHotList(self, endpoint = TICKER):
+		"""
+		Returns the keys of the pairs polled at the minimal interval
+		"""
+		limit = self.config['minInterval'] * self.getIntervalFactor(endpoint)
+		return sorted([key for key in self.states[endpoint] if self.states[endpoint][key]['interval'] <= limit])
+
+	def getFreshness(self, now = None):
+		"""
+		Returns the effective freshness of the data: the average and maximum
+		age (in seconds) of the last fetch of the pairs, the number of requests
+		and the ratio of fetches that did not bring any change.
+		"""
+		if now == None:
+			now = time.time()
+		states = self.states[FetchScheduler.TICKER].values()
+		ages = [now - state['fetched'] for state in states if state['fetched'] != None]
+		fetches = sum([state['fetches'] for state in states])
+		changes = sum([state['changes'] for state in states])
+		return {
+			'averageAge': sum(ages) / len(ages) if len(ages) else None,
+			'maxAge': max(ages) if len(ages) else None,
+			'requests': self.requestCount,
+			'failures': self.failureCount,
+			'unchangedRatio': (fetches - changes) / float(fetches) if fetches else 0.,
+			'hot': len(self.getHotList())
+		}
+
+	def printFreshness(self):
+		"""
+		Print the freshness of the data
+		"""
+		freshness = self.getFreshness()
+		if freshness['averageAge'] == None:
+			return "No data fetched yet"
+		return "Data age: %.2fs (max:%.2fs); requests: %i (%i failed); unchanged fetches: %.0f%%; hot pairs: %i" % (freshness['averageAge'], freshness['maxAge'], freshness['requests'], freshness['failures'], freshness['unchangedRatio'] * 100, freshness['hot'])
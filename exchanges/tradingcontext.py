@@ -0,0 +1,112 @@
+#!/usr/bin/python
+# -*- coding: iso-8859-1 -*-
+
+from exchanges.orderregistry import *
+from utilz.log import *
+
+import threading
+
+class TradingContext(object):
+	"""
+	This class holds the trading state shared by the exchanges, the orders and
+	the strategies of a bot: the active orders, the order identifier generator
+	and the simulation mode.
+
+	Each bot can use its own context, so that several bots can run in the same
+	process without interfering with each other.
+	"""
+	# Context used when none is specified
+	default = None
+
+	def __init__(self, simulation = True):
+		# Simulation mode
+		self.simulation = simulation
+		# Registry of the active orders
+		self.registry = OrderRegistry()
+		# Unique ID seed
+		self.uniqueIdSeed = 0
+		# Protects the state from concurrent accesses
+		self.lock = threading.RLock()
+
+	def isSimulation(self):
+		"""
+		Returns True if this context is in simulation mode
+		"""
+		return self.simulation
+
+	def setSimulation(self, simulation):
+		"""
+		Set the simulation mode
+		"""
+		self.simulation = simulation
+
+	def getUniqueId(self):
+		"""
+		This function generates a unique ID and returns it
+		"""
+		with self.lock:
+			self.uniqueIdSeed = self.uniqueIdSeed + 1
+			return self.uniqueIdSeed
+
+	def reserveId(self, identifier):
+		"""
+		Make sure the identifiers generated from now on are greater than an
+		existing one, used when orders are restored
+		"""
+		with self.lock:
+			self.uniqueIdSeed = max(self.uniqueIdSeed, identifier)
+
+	def getActiveList(self, exchange = None, pair = None):
+		"""
+		Returns the list of active orders, optionally only the ones of an exchange or a pair.
+		Active orders are otherders that are processing.
+		"""
+		with self.lock:
+			return self.registry.getList(exchange = exchange, pair = pair)
+
+	def getActiveCount(self, exchange = None):
+		"""
+		Returns the number of active orders
+		"""
+		with self.lock:
+			return self.registry.count(exchange = exchange)
+
+	def getPlacedList(self, exchange = None):
+		"""
+		Returns the list of placed orders, optionally only the ones of an exchange.
+		it can be either placed orders, effective orders or completed orders.
+		"""
+		from exchanges.order import Order
+		with self.lock:
+			return self.registry.getList([Order.STATUS_PLACED, Order.STATUS_EFFECTIVE, Order.STATUS_COMPLETED], exchange)
+
+	def getOrder(self, identifier):
+		"""
+		Returns an active order from its identifier, None if not active
+		"""
+		with self.lock:
+			return self.registry.get(identifier)
+
+	def orderActive(self, order):
+		"""
+		Add an order to the active order list
+		"""
+		with self.lock:
+			self.registry.add(order)
+
+	def orderUnactive(self, order):
+		"""
+		Remove an order from the active order list
+		"""
+		with self.lock:
+			self.registry.remove(order)
+
+	def orderStatusChanged(self, order, previousStatus):
+		"""
+		Must be called when the status of an order has changed
+		"""
+		with self.lock:
+			self.registry.updateStatus(order, previousStatus)
+
+# Create the default context
+TradingContext.default = TradingContext()
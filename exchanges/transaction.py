@@ -1,18 +1,22 @@
 #!/usr/bin/python
 # -*- coding: iso-8859-1 -*-
 
+from exchanges.fixedpoint import *
+from exchanges.quantizer import *
 from utilz.log import *
 from utilz.object import *
 
+import bisect
+
 class Transaction(object):
 	"""
 	This class offer a way to manage transactions
 
 	A transaction is an convertion from an amount of currency1 to a value of currency2
-	"""
-	# By default simulation is on
-	simulation = True
 
+	The configuration is compiled into fee tiers and limit bounds when the
+	transaction is created, it must not be modified afterwards.
+	"""
 	def __init__(self, config = {}):
 		defaults = {
 			# List of fee ordered from the maximum minAmount to the minimum
@@ -62,17 +66,48 @@ class Transaction(object):
 			if not isinstance(fees, list):
 				fees = [fees]
 			# Loop through each elements
-			for i, fee in enumerate(fees):
-				fees[i] = defaults["fees"][0].copy()
-				fees[i].update(fee)
+			feeList = []
+			for fee in fees:
+				feeList.append(defaults["fees"][0].copy())
+				feeList[-1].update(fee)
 			# Sort and store the fees
-			self.config["fees"] = sorted(fees, key=lambda x: -x['minAmount'])
+			self.config["fees"] = sorted(feeList, key=lambda x: -x['minAmount'])
+		# Pre-compute the fees and the limits
+		self.compile()
+
+	def compile(self):
+		"""
+		Pre-compute the fee tiers and the limits from the configuration
+		"""
+		# Fee tiers sorted by increasing minimal amount, for equal minimal amounts
+		# the first fee of the configuration takes precedence
+		fees = list(reversed(self.config['fees']))
+		self.feeMinAmounts = [fee['minAmount'] for fee in fees]
+		self.feeTiers = [(fee['fixed'], fee['percentage']) for fee in fees]
+		# Exact fee tiers, used in fixed point mode
+		self.feeTiersExact = [(FixedPoint.toFraction(fee['fixed']), FixedPoint.toFraction(fee['percentage']) / 100) for fee in fees]
+		# Single tier, the most common case
+		self.feeSingle = self.feeTiers[0] + (self.feeMinAmounts[0], ) if len(fees) == 1 else None
+		# Limits, None if not set
+		limits = self.config['limits']
+		bounds = []
+		for key in ['minRate', 'maxRate', 'minAmount', 'maxAmount', 'minValue', 'maxValue']:
+			bounds.append(limits[key] if limits.has_key(key) and limits[key] != 0 else None)
+		self.limits = tuple(bounds)
+		# Number of decimals and its scale
+		if limits.has_key('maxDecimal') and limits['maxDecimal'] != 0:
+			self.maxDecimal = limits['maxDecimal']
+		else:
+			self.maxDecimal = 9
+		self.quantizer = Quantizer.get(self.maxDecimal)
+		self.scale = self.quantizer.scale
+		self.fixedPoint = FixedPoint.get(self.maxDecimal)
 
 	def clone(self):
 		"""
 		Returns a clone transaction of this one
 		"""
-		return Transaction(self.config.copy())
+		return Transaction(UtilzObject.clone(self.config))
 
 	def inverse(self):
 		"""
@@ -104,6 +139,8 @@ class Transaction(object):
 		self.config['limits']['maxAmount'] = maxAmount
 		self.config['limits']['minValue'] = minValue
 		self.config['limits']['maxValue'] = maxValue
+		# Update the pre-computed limits
+		self.compile()
 		# For chainability
 		return self
 
@@ -142,9 +179,25 @@ class Transaction(object):
 		Returns the maximum number of decimal for the transaction
 		By default use up to 9 decimals
 		"""
-		if self.config.has_key('limits') and self.config['limits'].has_key('maxDecimal') and self.config['limits']['maxDecimal'] != 0:
-			return self.config['limits']['maxDecimal']
-		return 9
+		return self.maxDecimal
+
+	def getScale(self):
+		"""
+		Returns 10 to the power of the maximum number of decimal
+		"""
+		return self.scale
+
+	def getQuantizer(self):
+		"""
+		Returns the quantizer flooring the rates and amounts of the transaction
+		"""
+		return self.quantizer
+
+	def getFixedPoint(self):
+		"""
+		Returns the fixed point representation of the amounts of the transaction
+		"""
+		return self.fixedPoint
 
 	def getTimeEffective(self):
 		"""
@@ -166,34 +219,92 @@ class Transaction(object):
 		"""
 		Return True if the order is within the limits, False otherwise
 		"""
-		if self.config['limits'].has_key('minRate') and self.config['limits']['minRate'] != 0:
-			if rate < self.config['limits']['minRate']:
-				return [False, "Rate `%f' is below the limit (`%f') allowed by the transaction" % (rate, self.config['limits']['minRate'])]
-		if self.config['limits'].has_key('maxRate') and self.config['limits']['maxRate'] != 0:
-			if rate > self.config['limits']['maxRate']:
-				return [False, "Rate `%f' is above the limit (`%f') allowed by the transaction" % (rate, self.config['limits']['maxRate'])]
-		if self.config['limits'].has_key('minAmount') and self.config['limits']['minAmount'] != 0:
-			if amount < self.config['limits']['minAmount']:
-				return [False, "Amount `%f' is below the limit (`%f') allowed by the transaction" % (amount, self.config['limits']['minAmount'])]
-		if self.config['limits'].has_key('maxAmount') and self.config['limits']['maxAmount'] != 0:
-			if amount > self.config['limits']['maxAmount']:
-				return [False, "Amount `%f' is above the limit (`%f') allowed by the transaction" % (amount, self.config['limits']['maxAmount'])]
-		if self.config['limits'].has_key('minValue') and self.config['limits']['minValue'] != 0:
-			if amount * rate < self.config['limits']['minValue']:
-				return [False, "Value `%f' of the transaction is below the limit (`%f')" % (amount * rate, self.config['limits']['minValue'])]
-		if self.config['limits'].has_key('maxValue') and self.config['limits']['maxValue'] != 0:
-			if amount * rate > self.config['limits']['maxValue']:
-				return [False, "Amount `%f' is above the limit (`%f') allowed by the transaction" % (amount * rate, self.config['limits']['maxValue'])]
+		minRate, maxRate, minAmount, maxAmount, minValue, maxValue = self.limits
+		if minRate != None and rate < minRate:
+			return [False, "Rate `%f' is below the limit (`%f') allowed by the transaction" % (rate, minRate)]
+		if maxRate != None and rate > maxRate:
+			return [False, "Rate `%f' is above the limit (`%f') allowed by the transaction" % (rate, maxRate)]
+		if minAmount != None and amount < minAmount:
+			return [False, "Amount `%f' is below the limit (`%f') allowed by the transaction" % (amount, minAmount)]
+		if maxAmount != None and amount > maxAmount:
+			return [False, "Amount `%f' is above the limit (`%f') allowed by the transaction" % (amount, maxAmount)]
+		if minValue != None and amount * rate < minValue:
+			return [False, "Value `%f' of the transaction is below the limit (`%f')" % (amount * rate, minValue)]
+		if maxValue != None and amount * rate > maxValue:
+			return [False, "Amount `%f' is above the limit (`%f') allowed by the transaction" % (amount * rate, maxValue)]
 		return [True]
 
+	def withinLimitsList(self, rateList, amountList):
+		"""
+		Check the limits of several orders at once.
+		Returns a list of booleans, True for the orders within the limits.
+		"""
+		minRate, maxRate, minAmount, maxAmount, minValue, maxValue = self.limits
+		result = []
+		for rate, amount in zip(rateList, amountList):
+			result.append(not ((minRate != None and rate < minRate)
+					or (maxRate != None and rate > maxRate)
+					or (minAmount != None and amount < minAmount)
+					or (maxAmount != None and amount > maxAmount)
+					or (minValue != None and amount * rate < minValue)
+					or (maxValue != None and amount * rate > maxValue)))
+		return result
+
 	def getFee(self, amount):
 		"""
 		This function will calculate the fee based on the amount
 		Returns -1 in case of error
 		"""
+		if self.feeSingle != None:
+			fixed, percentage, minAmount = self.feeSingle
+			if amount >= minAmount:
+				return fixed + amount * percentage / 100.
 		# Look for the fee for this amount
-		for fee in self.config['fees']:
-			if amount >= fee['minAmount']:
-				return fee['fixed'] + amount * fee['percentage'] / 100.
-		# No fee has been found, raise an error
-		raise error("No fee has been found for this amount.")
+		i = bisect.bisect_right(self.feeMinAmounts, amount) - 1
+		if i < 0:
+			# No fee has been found, raise an error
+			raise error("No fee has been found for this amount.")
+		fixed, percentage = self.feeTiers[i]
+		return fixed + amount * percentage / 100.
+
+	def getFeeRate(self, amount):
+		"""
+		Returns the proportional part of the fee (the percentage divided by 100)
+		applied to an amount, the fixed part is ignored.
+		"""
+		i = bisect.bisect_right(self.feeMinAmounts, amount) - 1
+		if i < 0:
+			# No fee has been found, raise an error
+			raise error("No fee has been found for this amount.")
+		return self.feeTiers[i][1] / 100.
+
+	def getFeeTiers(self):
+		"""
+		Returns the fee tiers sorted by increasing minimal amount, as a list of
+		[minAmount, fixed, rate], the rate being the percentage divided by 100
+		"""
+		return [[minAmount, fixed, percentage / 100.] for minAmount, (fixed, percentage) in zip(self.feeMinAmounts, self.feeTiers)]
+
+	def getFeeExact(self, amount):
+		"""
+		Calculate the exact fee of an exact amount (a fraction), used in fixed
+		point mode. The fee tier is selected as with getFee.
+		"""
+		i = bisect.bisect_right(self.feeMinAmounts, float(amount)) - 1
+		if i < 0:
+			# No fee has been found, raise an error
+			raise error("No fee has been found for this amount.")
+		fixed, percentage = self.feeTiersExact[i]
+		return fixed + amount * percentage
+
+	def getFeeList(self, amountList):
+		"""
+		Calculate the fees of several amounts at once
+		"""
+		# With a single tier, only the minimal amount needs to be checked
+		if self.feeSingle != None:
+			fixed, percentage, minAmount = self.feeSingle
+			if len(amountList) and min(amountList) < minAmount:
+				raise error("No fee has been found for this amount.")
+			return [fixed + amount * percentage / 100. for amount in amountList]
+		return [self.getFee(amount) for amount in amountList]
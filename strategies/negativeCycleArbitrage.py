@@ -0,0 +1,290 @@
+#!/usr/bin/python
+# -*- coding: iso-8859-1 -*-
+
+from exchanges.exchange import *
+from exchanges.order import *
+from utilz.object import *
+from utilz.log import *
+
+import collections
+import math
+
+class negativeCycleArbitrage(object):
+	"""
+	This algorithm identifies arbitrage cycles of any length.
+
+	The exchange is represented as a graph where each currency is a node and
+	each pair (inverse pairs included) is an edge weighted by -log(rate * (1 - fee)).
+	A profitable cycle is a negative cycle of this graph, which is found with a
+	queue based Bellman-Ford search. The shortest path state is kept from one
+	tick to the other, so only the edges which pair has changed are re-relaxed.
+	A cycle rejected (too long or not profitable enough) is broken by excluding
+	one of its edges until the weight of an edge of this cycle changes, so that
+	the search goes on with the other cycles and the state stays valid on the
+	next ticks.
+	"""
+	# Maximal number of transactions of a cycle, None for no limit
+	MAX_DEPTH = None
+
+	# The minimal gain (in percent) of a cycle from which an opportunity
+	# should be considered
+	GAIN_THRESHOLD_PERCENT = 0
+
+	# Timeout until an order is valid
+	ORDER_TIMEOUT = 10
+
+	# Minimal improvement of a distance to be considered as a relaxation
+	EPSILON = 1e-12
+
+	def __init__(self, exchange):
+		# Save the exchange for future use
+		self.x = exchange
+		# Build the graph
+		self.currencies = sorted(self.x.currencyList())
+		index = {}
+		for i, currency in enumerate(self.currencies):
+			index[currency] = i
+		self.edges = []
+		self.outEdges = [[] for currency in self.currencies]
+		# Index of the edges using each pair
+		self.pairIndex = {}
+		for currency1 in self.currencies:
+			pairList = self.x.getPair(currency1)
+			for currency2 in pairList:
+				order = pairList[currency2].orderSell()
+				transaction = order.getTransaction()
+				# Use the lowest proportional fee of the tiers, the weights never hide a
+				# cycle profitable for some amount, the cycles found are estimated accurately
+				feeRate = min([tier[2] for tier in transaction.getFeeTiers()])
+				self.outEdges[index[currency1]].append(len(self.edges))
+				self.pairIndex.setdefault(order.getPair(), []).append(len(self.edges))
+				self.edges.append({
+					'from': index[currency1],
+					'to': index[currency2],
+					'order': order,
+					'feeFactor': 1. - feeRate,
+					'weight': float("inf"),
+					# Actual weight of the edge if it is excluded, None otherwise
+					'excluded': None
+				})
+		# Edges of the rejected cycle which excluded each edge
+		self.exclusions = {}
+		# Identifier of the last pair update processed
+		self.updateId = None
+		# Shortest path state
+		self.resetState()
+		self.opportunity = None
+		UtilzLog.info("Initialized negative cycle arbitrage algorithm with %i currencies and %i edges" % (len(self.currencies), len(self.edges)), 3)
+
+	def resetState(self):
+		"""
+		Clear the shortest path state, all nodes are reachable from a virtual
+		source at a distance 0
+		"""
+		self.distance = [0.] * len(self.currencies)
+		self.predecessor = [None] * len(self.currencies)
+		self.stateValid = False
+
+	def updateWeights(self):
+		"""
+		Update the weight of the edges which pair has changed since the last pass.
+		Returns the list of edges which weight has changed.
+		"""
+		if self.updateId == None:
+			edgeList = range(len(self.edges))
+		else:
+			edgeList = []
+			for pair in self.x.getChangedPairs(self.updateId):
+				edgeList.extend(self.pairIndex.get(pair, []))
+		self.updateId = self.x.getUpdateId()
+
+		changedEdges = []
+		changed = set()
+		for i in edgeList:
+			edge = self.edges[i]
+			order = edge['order']
+			try:
+				rate = order.getUpdatedRate(order.getPair())
+			except (TypeError, ZeroDivisionError):
+				rate = None
+			if rate == None or rate <= 0:
+				weight = float("inf")
+			else:
+				weight = -math.log(rate * edge['feeFactor'])
+			if edge['excluded'] != None:
+				if weight != edge['excluded']:
+					changed.add(i)
+				edge['excluded'] = weight
+			elif weight != edge['weight']:
+				changed.add(i)
+				changedEdges.append((i, edge['weight']))
+				edge['weight'] = weight
+
+		# Restore the edges excluded by a rejected cycle which has changed
+		for i in self.exclusions.keys():
+			if changed.isdisjoint(self.exclusions[i]):
+				continue
+			del self.exclusions[i]
+			edge = self.edges[i]
+			changedEdges.append((i, edge['weight']))
+			edge['weight'] = edge['excluded']
+			edge['excluded'] = None
+		return changedEdges
+
+	def excludeEdge(self, i, cycle):
+		"""
+		Exclude an edge of a rejected cycle from the search, its weight is
+		considered infinite until the weight of an edge of the cycle changes
+		"""
+		edge = self.edges[i]
+		edge['excluded'] = edge['weight']
+		edge['weight'] = float("inf")
+		self.exclusions[i] = set(cycle)
+
+	def findNegativeCycle(self, changedEdges):
+		"""
+		Relax the edges, starting only from the one which have changed, and
+		return the list of edges forming a negative cycle if any, None otherwise
+		"""
+		queue = collections.deque()
+		inQueue = [False] * len(self.currencies)
+		# If a weight of the shortest path tree increased, the state is no longer valid
+		if self.stateValid:
+			for i, previousWeight in changedEdges:
+				edge = self.edges[i]
+				if edge['weight'] > previousWeight and self.predecessor[edge['to']] == i:
+					self.stateValid = False
+					break
+		if self.stateValid:
+			for i, previousWeight in changedEdges:
+				edge = self.edges[i]
+				if edge['weight'] < previousWeight and not inQueue[edge['from']]:
+					inQueue[edge['from']] = True
+					queue.append(edge['from'])
+		else:
+			self.resetState()
+			queue.extend(range(len(self.currencies)))
+			inQueue = [True] * len(self.currencies)
+		self.stateValid = True
+
+		# Queue based Bellman-Ford
+		distance = self.distance
+		predecessor = self.predecessor
+		relaxCount = [0] * len(self.currencies)
+		while queue:
+			node = queue.popleft()
+			inQueue[node] = False
+			for i in self.outEdges[node]:
+				edge = self.edges[i]
+				d = distance[node] + edge['weight']
+				if d < distance[edge['to']] - self.EPSILON:
+					distance[edge['to']] = d
+					predecessor[edge['to']] = i
+					relaxCount[edge['to']] = relaxCount[edge['to']] + 1
+					# A node relaxed that many times is reachable from a negative cycle
+					if relaxCount[edge['to']] >= len(self.currencies):
+						self.stateValid = False
+						return self.extractCycle(edge['to'])
+					if not inQueue[edge['to']]:
+						inQueue[edge['to']] = True
+						queue.append(edge['to'])
+		return None
+
+	def extractCycle(self, node):
+		"""
+		Follow the predecessors from a node and return the cycle found if any
+		"""
+		visited = {}
+		while node != None and not visited.has_key(node):
+			visited[node] = True
+			i = self.predecessor[node]
+			node = None if i == None else self.edges[i]['from']
+		if node == None:
+			return None
+		# Build the cycle
+		cycle = []
+		start = node
+		while True:
+			i = self.predecessor[node]
+			cycle.insert(0, i)
+			node = self.edges[i]['from']
+			if node == start:
+				break
+		return cycle
+
+	def createChainOrder(self, cycle, startIndex = 0):
+		"""
+		Transform a cycle into an order chain, starting from the edge at startIndex
+		"""
+		order = None
+		for n in range(len(cycle)):
+			edge = self.edges[cycle[(startIndex + n) % len(cycle)]]
+			o = self.x.getPair(self.currencies[edge['from']], self.currencies[edge['to']]).orderSell()
+			# Add conditions to this order
+			o.setConditions(self.ORDER_TIMEOUT, "timeout")
+			if order == None:
+				order = o
+			else:
+				order.addChainOrder(o)
+		return order
+
+	def preprocess(self, initialAmount = 1.):
+		"""
+		Pre-process the algorithm
+		"""
+		self.opportunity = None
+		changedEdges = self.updateWeights()
+		if not changedEdges and self.stateValid:
+			return
+		# Each rejected cycle excludes an edge, which bounds the number of searches
+		for n in range(len(self.edges)):
+			cycle = self.findNegativeCycle(changedEdges)
+			if cycle == None:
+				return
+			if self.MAX_DEPTH == None or len(cycle) <= self.MAX_DEPTH:
+				# Estimate the cycle accurately from each of its currencies, as the
+				# flooring of the amounts depends on the one it starts from
+				best = None
+				for startIndex in range(len(cycle)):
+					order = self.createChainOrder(cycle, startIndex)
+					order.updateChain()
+					gainPercent = (order.estimateChain(initialAmount) - initialAmount) * 100
+					if best == None or gainPercent > best[0]:
+						best = [gainPercent, order]
+				gainPercent, order = best
+				if gainPercent > self.GAIN_THRESHOLD_PERCENT:
+					# Print the opportunity
+					UtilzLog.opportunity(UtilzLog.defer("(%+.2f%%) - %s", gainPercent, UtilzLog.defer(order.printEstimate)))
+					self.opportunity = {
+						'cycle': cycle,
+						'gain': gainPercent
+					}
+					return
+			# Break the rejected cycle on its heaviest edge and look for the other cycles
+			self.excludeEdge(max(cycle, key=lambda i: self.edges[i]['weight']), cycle)
+			changedEdges = []
+
+	def process(self, amountList):
+		"""
+		Process the algorithm
+		"""
+		self.preprocess()
+
+		if self.opportunity == None:
+			return None
+
+		# Start the cycle from a currency which can be traded
+		cycle = self.opportunity['cycle']
+		for startIndex, i in enumerate(cycle):
+			currency = self.currencies[self.edges[i]['from']]
+			if not amountList.has_key(currency):
+				continue
+			order = self.createChainOrder(cycle, startIndex)
+			order.updateChain()
+			# Set the amount
+			order.setAmount(amountList[currency])
+			# Make sure the cycle is still profitable with this amount
+			if order.estimateChain() <= order.getAmount():
+				continue
+			return [order]
+		return None
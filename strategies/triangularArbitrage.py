@@ -3,6 +3,7 @@
 
 from exchanges.exchange import *
 from exchanges.order import *
+from exchanges.orderUtilz import *
 from utilz.object import *
 from utilz.log import *
 
@@ -35,6 +36,8 @@ class triangularArbitrage(object):
 		UtilzLog.info("Transaction identified: %s" % (", ".join(stringList)), 1)
 		# Create chain orders from the triangular transactions identified
 		self.createChainOrders(self.transactions)
+		# Identifier of the last pair update processed
+		self.updateId = None
 		UtilzLog.info("Initialized triangular arbitrage algorithm", 3)
 
 	def preprocess(self, initialAmount = 1.):
@@ -43,6 +46,13 @@ class triangularArbitrage(object):
 		"""
 		self.opportunityList = {}
 
+		# Identify the order chains affected by the pairs that have changed since the last pass
+		changedOrders = set()
+		if self.updateId != None:
+			for pair in self.x.getChangedPairs(self.updateId):
+				changedOrders.update(self.pairIndex.get(pair, []))
+		self.updateId = self.x.getUpdateId()
+
 		# Monitor all currencies, we must to it to ensure that there is no gap when a new currency is used
 		for currency in self.x.currencyList():
 
@@ -54,14 +64,19 @@ class triangularArbitrage(object):
 
 				# Get the timestamp
 				timestamp = order['order'].getPair().getTimestamp()
-				# Update the rate of this order chain
-				order['order'].updateChain()
-				# Estimate the final currency amount of this order
-				amount = order['order'].estimateChain(initialAmount)
+				# Re-use the previous estimate if none of the pairs of this order chain have changed
+				if order.has_key('amount') and id(order) not in changedOrders:
+					amount = order['amount']
+					rate = order['rate']
+				else:
+					# Update the rate of this order chain
+					order['order'].updateChain()
+					# Estimate the final currency amount of this order
+					amount = order['order'].estimateChain(initialAmount)
+					# Identify the first order rate
+					rate = order['order'].getRate()
 				# Calculate the gain and save the opportunity if gain is sufficient
 				gainPercent = (amount - initialAmount) * 100
-				# Identify the first order rate
-				rate = order['order'].getRate()
 
 				# Before it can check if this is an opportunity, make sure the data are valid
 				if order.has_key('timestamp') and (timestamp - order['timestamp']) <= self.MAX_TIMESTAMP_SPREAD:
@@ -87,7 +102,7 @@ class triangularArbitrage(object):
 						# Save this opportunity if and only if it starts with a weak pair
 						if order['weakPair'] == True:
 							# Print the opportunity
-							UtilzLog.opportunity("(%+.2f%%) - %s" % (gainPercent, order['order'].printEstimate()))
+							UtilzLog.opportunity(UtilzLog.defer("(%+.2f%%) - %s", gainPercent, UtilzLog.defer(order['order'].printEstimate)))
 							# Store it
 							self.opportunityList[currency].append(order)
 
@@ -117,10 +132,22 @@ class triangularArbitrage(object):
 
 		# Loop through all available currencies
 		for currency in amountList:
-			# Get the amount
-			amount = amountList[currency]
 			# Look if there are potential opportunities
 			for order in self.opportunityList[currency]:
+				# Get the amount
+				amount = amountList[currency]
+				# Size the trade from the depth of the market if available
+				size = OrderUtilz.sizeChain(order['order'], amountList[currency], 1. + self.GAIN_THRESHOLD_PERCENT / 100.)
+				if size != None:
+					# The gain disappears once the order books are walked
+					if size[0] <= 0.:
+						UtilzLog.opportunity(UtilzLog.defer("No profitable amount for %s", UtilzLog.defer(order['order'].printOrder)))
+						continue
+					# The amount must be a valid amount for the transaction
+					amount = order['order'].floor(size[0])
+					if order['order'].getTransaction().withinLimits(order['order'].getRate(), amount)[0] == False:
+						UtilzLog.opportunity(UtilzLog.defer("The profitable amount `%f' is below the limits for %s", amount, UtilzLog.defer(order['order'].printOrder)))
+						continue
 				# Get the first order, it must be the most profitable one
 				order = order['order'].clone()
 				# Set the amount
@@ -129,6 +156,9 @@ class triangularArbitrage(object):
 				order2 = order.cloneInverse()
 				# Calculates the minimal rate
 				finalAmount = order.estimate(amount)
+				if finalAmount <= 0.:
+					UtilzLog.opportunity(UtilzLog.defer("The amount `%f' is too small for %s", amount, UtilzLog.defer(order.printOrder)))
+					continue
 				rate = (amount + order2.getTransaction().getFee(finalAmount)) / finalAmount
 				# Update the order and set the conditions
 				order2.setRate(rate)
@@ -146,6 +176,8 @@ class triangularArbitrage(object):
 		"""
 		# Initialize the order book
 		self.orderBook = {}
+		# Index of the order chains (by identifier) using each pair
+		self.pairIndex = {}
 		# Loop throguht the currencies
 		for currency in self.transactions:
 			# Create a new entry
@@ -170,7 +202,13 @@ class triangularArbitrage(object):
 					currency1 = currency2
 				# Save this new order chain
 				if order != None:
-					self.orderBook[currency].append({'order': order})
+					entry = {'order': order}
+					self.orderBook[currency].append(entry)
+					# Index the pairs used by this order chain
+					o = order
+					while o:
+						self.pairIndex.setdefault(o.getPair(), set()).add(id(entry))
+						o = o.next()
 
 	def identifyTransactions(self, currency):
 		"""
@@ -0,0 +1,193 @@
+#!/usr/bin/python
+# -*- coding: iso-8859-1 -*-
+
+from strategies.triangularArbitrage import *
+from exchanges.exchangepair import *
+from utilz.log import *
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+class triangularArbitrageVectorized(triangularArbitrage):
+	"""
+	Alternative engine of the triangular arbitrage algorithm.
+
+	All the order chains of the order book are compiled once into index arrays
+	(leg -> rate slot, fee tiers, decimals) so that the gain of every cycle is evaluated
+	in a single batched pass over a rate vector. The order chains are only
+	updated and estimated for the cycles that clear the gain threshold.
+	"""
+
+	def __init__(self, exchange):
+		if numpy == None:
+			raise error("The `triangularArbitrageVectorized' algorithm requires numpy.")
+		super(triangularArbitrageVectorized, self).__init__(exchange)
+		# Compile the order book into arrays
+		self.compileCycles()
+		UtilzLog.info("Compiled %i cycles over %i pairs" % (len(self.cycles), len(self.pairs)), 3)
+
+	def compileCycles(self):
+		"""
+		Compile the order chains of the order book into index arrays.
+		The rate vector is organized as follow:
+			- 2 * i: bid of the pair i (sell order)
+			- 2 * i + 1: 1 / ask of the pair i (buy order)
+			- last slot: constant 1, used to pad the shorter cycles
+		"""
+		# Identify all the pairs used by the order book
+		self.pairs = []
+		pairIndex = {}
+		# List of all cycles and the currency they start from
+		self.cycles = []
+		self.cycleCurrency = []
+		legs = []
+		for currency in self.orderBook:
+			for entry in self.orderBook[currency]:
+				legList = []
+				order = entry['order']
+				while order:
+					pair = order.getPair()
+					if not pairIndex.has_key(id(pair)):
+						pairIndex[id(pair)] = len(self.pairs)
+						self.pairs.append(pair)
+					slot = pairIndex[id(pair)] * 2 + (0 if order.getType() == "sell" else 1)
+					transaction = order.getTransaction()
+					legList.append((slot, transaction.getFeeTiers(), transaction.getScale()))
+					order = order.next()
+				self.cycles.append(entry)
+				self.cycleCurrency.append(currency)
+				legs.append(legList)
+
+		# Build the index arrays
+		paddingSlot = len(self.pairs) * 2
+		depth = max([len(legList) for legList in legs] + [1])
+		# Fee tiers of each leg, the unused tiers are never selected
+		nbTiers = max([len(leg[1]) for legList in legs for leg in legList] + [1])
+		self.legSlot = numpy.empty((len(legs), depth), dtype = numpy.intp)
+		self.legSlot.fill(paddingSlot)
+		self.legPadding = numpy.ones((len(legs), depth), dtype = numpy.bool_)
+		self.legFeeMinAmount = numpy.empty((len(legs), depth, nbTiers), dtype = numpy.float64)
+		self.legFeeMinAmount.fill(numpy.inf)
+		self.legFeeMinAmount[:, :, 0] = -numpy.inf
+		self.legFeeFixed = numpy.zeros((len(legs), depth, nbTiers), dtype = numpy.float64)
+		self.legFeePercentage = numpy.zeros((len(legs), depth, nbTiers), dtype = numpy.float64)
+		self.legScale = numpy.ones((len(legs), depth), dtype = numpy.float64)
+		for i, legList in enumerate(legs):
+			for j, leg in enumerate(legList):
+				self.legPadding[i, j] = False
+				self.legSlot[i, j], tiers, self.legScale[i, j] = leg
+				for k, tier in enumerate(tiers):
+					self.legFeeMinAmount[i, j, k], self.legFeeFixed[i, j, k], self.legFeePercentage[i, j, k] = tier
+		self.cycleIndex = numpy.arange(len(legs))
+		# Pair used for the timestamp of the cycle (the one of the first order)
+		self.firstPair = self.legSlot[:, 0] // 2
+
+		# Slot of each pair in the market state of the exchange
+		market = self.x.getMarketState()
+		for pair in self.pairs:
+			if pair.getMarketState()[0] is not market:
+				raise error("The pair `%s' is not part of the market state of this exchange." % (str(pair)))
+		self.pairSlots = numpy.array([pair.getMarketState()[1] for pair in self.pairs], dtype = numpy.intp)
+
+		# Rate vector and timestamp of each pairs
+		self.rates = numpy.ones(paddingSlot + 1, dtype = numpy.float64)
+		self.timestamps = numpy.zeros(len(self.pairs), dtype = numpy.float64)
+
+		# State of each cycle from the previous pass
+		self.prevTimestamp = numpy.empty(len(self.cycles), dtype = numpy.float64)
+		self.prevTimestamp.fill(numpy.nan)
+		self.prevAmount = numpy.zeros(len(self.cycles), dtype = numpy.float64)
+		self.prevRate = numpy.zeros(len(self.cycles), dtype = numpy.float64)
+		self.weakPair = numpy.zeros(len(self.cycles), dtype = numpy.bool_)
+
+	def updateRates(self):
+		"""
+		Fill the rate vector from the market state of the exchange
+		"""
+		market = self.x.getMarketState()
+		# The buy rate of a pair is the bid of its inverse pair
+		self.rates[0:-1:2] = numpy.frombuffer(market.getColumn('bid'))[self.pairSlots]
+		self.rates[1:-1:2] = numpy.frombuffer(market.getColumn('inverseBid'))[self.pairSlots]
+		self.timestamps = numpy.frombuffer(market.getColumn('timestamp'))[self.pairSlots]
+
+	def estimateCycles(self, initialAmount):
+		"""
+		Estimates the final amount of all the cycles, this follows the same
+		arithmetic as Order.estimate (flooring and fee tiers included). A
+		cycle with an amount below the first fee tier is estimated as NaN.
+		"""
+		amount = numpy.empty(len(self.cycles), dtype = numpy.float64)
+		amount.fill(initialAmount)
+		legRates = self.rates[self.legSlot]
+		for j in range(self.legSlot.shape[1]):
+			scale = self.legScale[:, j]
+			finalAmount = legRates[:, j] * (numpy.floor(amount * scale) / scale)
+			# Select the fee tier of each amount, as Transaction.getFee
+			minAmount = self.legFeeMinAmount[:, j]
+			if minAmount.shape[1] == 1:
+				tier = 0
+				fixed = self.legFeeFixed[:, j, 0]
+				percentage = self.legFeePercentage[:, j, 0]
+			else:
+				tier = numpy.maximum((minAmount <= finalAmount[:, None]).sum(axis = 1) - 1, 0)
+				fixed = self.legFeeFixed[self.cycleIndex, j, tier]
+				percentage = self.legFeePercentage[self.cycleIndex, j, tier]
+			finalAmount = numpy.where(finalAmount >= minAmount[self.cycleIndex, tier], finalAmount, numpy.nan)
+			finalAmount = finalAmount - (fixed + finalAmount * percentage)
+			amount = numpy.where(self.legPadding[:, j], amount, numpy.floor(finalAmount * scale) / scale)
+		return amount
+
+	def preprocess(self, initialAmount = 1.):
+		"""
+		Pre-process the algorithm
+		"""
+		self.opportunityList = {}
+		for currency in self.x.currencyList():
+			self.opportunityList[currency] = []
+
+		# Update the rates
+		self.updateRates()
+
+		with numpy.errstate(invalid = 'ignore', divide = 'ignore'):
+			# Evaluate all the cycles at once
+			amount = self.estimateCycles(initialAmount)
+			gainPercent = (amount - initialAmount) * 100
+			rate = self.rates[self.legSlot[:, 0]]
+			timestamp = self.timestamps[self.firstPair]
+
+			# Before it can check if this is an opportunity, make sure the data are valid
+			valid = (timestamp - self.prevTimestamp) <= self.MAX_TIMESTAMP_SPREAD
+			candidate = valid & (gainPercent > self.GAIN_THRESHOLD_PERCENT)
+
+			# Identify the weak pairs, same rules as triangularArbitrage.preprocess
+			diffRate = ((rate - self.prevRate) / self.prevRate) * 100
+			diffGain = ((amount - self.prevAmount) / self.prevAmount) * 100
+			weakPair = ((diffGain > 0.01) & (diffRate > 0.01) & (numpy.abs(diffGain - diffRate) < 0.1)) | (self.weakPair & (diffRate >= 0.) & (diffGain >= 0.))
+			self.weakPair = numpy.where(candidate, weakPair, self.weakPair & valid)
+
+		# Materialize the order chains of the opportunities only
+		for i in numpy.flatnonzero(candidate & self.weakPair):
+			order = self.cycles[i]
+			# Update the rate of this order chain and estimate it accurately
+			order['order'].updateChain()
+			order['amount'] = order['order'].estimateChain(initialAmount)
+			order['gain'] = (order['amount'] - initialAmount) * 100
+			order['rate'] = order['order'].getRate()
+			order['timestamp'] = timestamp[i]
+			order['weakPair'] = True
+			if order['gain'] > self.GAIN_THRESHOLD_PERCENT:
+				# Print the opportunity
+				UtilzLog.opportunity(UtilzLog.defer("(%+.2f%%) - %s", order['gain'], UtilzLog.defer(order['order'].printEstimate)))
+				# Store it
+				self.opportunityList[self.cycleCurrency[i]].append(order)
+
+		# Save the state for the next pass
+		self.prevTimestamp = timestamp
+		self.prevAmount = amount
+		self.prevRate = rate
+
+		# Sort the opportunities to get the most profitable first
+		for currency in self.opportunityList:
+			self.opportunityList[currency] = sorted(self.opportunityList[currency], key=lambda o: -o['gain'])
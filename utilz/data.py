@@ -2,21 +2,36 @@
 # -*- coding: iso-8859-1 -*-
 
 import re
+import httplib
 import socket
 import urllib
-import urllib2
 import unicodedata
 import inspect
 import json
+import time
 
 from log import *
 from object import *
+from pool import *
+
+# Use a faster JSON decoder if available
+try:
+	import ujson
+	jsonDecode = lambda data: ujson.loads(data, precise_float = True)
+except ImportError:
+	try:
+		import simplejson
+		jsonDecode = simplejson.loads
+	except ImportError:
+		jsonDecode = json.loads
 
 class UtilzData(object):
 	"""
 	Utility functions for data
 	"""
 	proxy = None
+	# Connection pool used to fetch the URLs
+	pool = UtilzConnectionPool.default
 
 	def __init__(self, data = ""):
 		self.data = data
@@ -28,6 +43,13 @@ class UtilzData(object):
 		"""
 		cls.proxy = proxy
 
+	@classmethod
+	def setPool(cls, pool):
+		"""
+		Set the connection pool used to fetch the URLs
+		"""
+		cls.pool = pool
+
 	def get(self):
 		"""
 		Return the value
@@ -42,15 +64,40 @@ class UtilzData(object):
 		# To enable chainability
 		return self
 
-	def fetch(self, options):
+	def fetchJSON(self, options):
 		"""
-		Fetch data from any location
+		Fetch JSON data from any location and parse it.
+		The raw data are parsed directly, unless the `normalize' option is set,
+		in which case the text is normalized (as with fetch) before being parsed.
+		If the `stats' option is set, the fetch and parse durations are recorded into it.
+		"""
+		if options.get("normalize", False):
+			return self.fetch(options).fromJSON()
+		stats = options.get("stats", None)
+		start = time.time()
+		data = self.fetchRaw(options)
+		if stats != None:
+			stats.record("fetch", time.time() - start)
+			start = time.time()
+		# Apply encoding if any
+		if options.has_key("encoding"):
+			data = data.decode(options["encoding"], 'replace')
+		self.data = jsonDecode(data)
+		if stats != None:
+			stats.record("parse", time.time() - start)
+		# To enable chainability
+		return self
+
+	def fetchRaw(self, options):
+		"""
+		Fetch data from any location and return them without any conversion
 		"""
 		data = ""
 		# If it needs to be fetched from a file
 		if options.has_key("file"):
 			UtilzLog.info("Fetching data from file: `%s'" % (str(options["file"])))
-			data = str(read_file(options["file"]))
+			with open(options["file"]) as f:
+				data = str(f.read())
 		# If it needs to be fetched from a string
 		elif options.has_key("string"):
 			UtilzLog.info("Fetching data from string: `%s'" % ((str(options["string"])[:75] + '..') if len(str(options["string"])) > 75 else str(options["string"])))
@@ -58,26 +105,25 @@ class UtilzData(object):
 		# If the data need to be fetched from a URL
 		elif options.has_key("url"):
 			proxy = self.proxy
+			pool = self.pool
 			data = ""
-			timeout = 10
 
 			# Default headers
 			headers = {
 				'Accept': '*/*',
 				'Accept-Charset': 'ISO-8859-1,utf-8;q=0.7,*;q=0.3',
 				'Accept-Language': 'en-US,en;q=0.8',
-				'Proxy-Connection': 'keep-alive',
+				'Connection': 'keep-alive',
 				'User-Agent':'Mozilla/5.0 (Windows NT 6.1; WOW64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/32.0.1700.102 Safari/537.36'
 			}
 
 			# Handle proxy
 			if options.has_key("proxy"):
 				proxy = options["proxy"]
-			# Set the proxy if needed
-			if proxy != None:
-				proxy = urllib2.ProxyHandler(proxy)
-				opener = urllib2.build_opener(proxy)
-				urllib2.install_opener(opener)
+			# Use a specific connection pool
+			if options.has_key("pool"):
+				pool = options["pool"]
+			timeout = pool.config['timeout']
 
 			data = None
 			# Handle POST data
@@ -99,21 +145,24 @@ class UtilzData(object):
 			if options.has_key("headers"):
 				headers.update(options['headers'])
 
-			# Build the request
-			request = urllib2.Request(str(options["url"]), data, headers)
-
 			# Handle timeout in seconds
 			if options.has_key("timeout"):
 				timeout = options['timeout']
-			# Build the request and process
+			# Send the request through a persistent connection
 			UtilzLog.info("Fetching data from url: `%s'" % (str(options["url"])))
 			try:
-				response = urllib2.urlopen(request, timeout = timeout)
-			except urllib2.URLError, e:
-				raise error("Error while retreiving the page `%s' (timeout [%is]): %r: %s" % (str(options["url"]), timeout, e, str(e)))
+				data = str(pool.request(str(options["url"]), data, headers, timeout, proxy))
 			except socket.timeout:
 				raise error("Timeout error (%is)" % (timeout))
-			data = str(response.read())
+			except (httplib.HTTPException, socket.error), e:
+				raise error("Error while retreiving the page `%s' (timeout [%is]): %r: %s" % (str(options["url"]), timeout, e, str(e)))
+		return data
+
+	def fetch(self, options):
+		"""
+		Fetch data from any location and normalize the text to ASCII
+		"""
+		data = self.fetchRaw(options)
 		# Apply encoding if any
 		if options.has_key("encoding"):
 			data = data.decode(options["encoding"], 'replace')
@@ -0,0 +1,81 @@
+#!/usr/bin/python
+# -*- coding: iso-8859-1 -*-
+
+import thread
+import threading
+
+from log import *
+
+class UtilzLock(object):
+	"""
+	Reentrant lock which can be released for a while by the thread holding
+	it, whatever the number of times it has been acquired. This is used to
+	not block the other threads during a request to a remote server.
+	"""
+
+	def __init__(self):
+		self.lock = threading.Lock()
+		# Thread holding the lock and number of times it has acquired it
+		self.owner = None
+		self.count = 0
+
+	def acquire(self):
+		identifier = thread.get_ident()
+		if self.owner == identifier:
+			self.count = self.count + 1
+			return
+		self.lock.acquire()
+		self.owner = identifier
+		self.count = 1
+
+	def release(self):
+		if self.owner != thread.get_ident():
+			raise error("This lock is not held by the current thread.")
+		self.count = self.count - 1
+		if self.count == 0:
+			self.owner = None
+			self.lock.release()
+
+	def __enter__(self):
+		self.acquire()
+		return self
+
+	def __exit__(self, *args):
+		self.release()
+
+	def isOwned(self):
+		"""
+		Returns True if the lock is held by the current thread
+		"""
+		return self.owner == thread.get_ident()
+
+	def released(self):
+		"""
+		Returns a context in which the lock is not held by the current thread,
+		it is acquired again as many times as it was on leaving the context.
+		Nothing is done if the current thread does not hold the lock.
+		"""
+		return UtilzLockReleased(self)
+
+class UtilzLockReleased(object):
+	"""
+	Context releasing a lock held by the current thread, see UtilzLock.released
+	"""
+
+	def __init__(self, lock):
+		self.lock = lock
+		self.count = 0
+
+	def __enter__(self):
+		if self.lock.isOwned():
+			self.count = self.lock.count
+			self.lock.owner = None
+			self.lock.count = 0
+			self.lock.lock.release()
+		return self
+
+	def __exit__(self, *args):
+		if self.count > 0:
+			self.lock.lock.acquire()
+			self.lock.owner = thread.get_ident()
+			self.lock.count = self.count
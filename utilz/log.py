@@ -2,7 +2,9 @@
 # -*- coding: iso-8859-1 -*-
 
 import logging
+import Queue
 import sys
+import threading
 
 class UtilzLog(object):
 	LOG_DEFAULT_LEVEL_ERROR = 0
@@ -43,6 +45,8 @@ class UtilzLog(object):
 
 	# Log instance
 	log = None
+	# Handler writing the records from a background thread, if enabled
+	asyncHandler = None
 
 	def __init__(self, level = LOG_DEFAULT_VERBOSE_LEVEL):
 		# Set this instance as the main one
@@ -64,6 +68,22 @@ class UtilzLog(object):
 		for name in UtilzLog.PRESETS:
 			UtilzLog.addPreset(name, UtilzLog.PRESETS[name])
 
+	@staticmethod
+	def getLoggingFunction(loggingType):
+		"""
+		Returns the function of the logger for a logging type
+		"""
+		logger = logging.getLogger('log')
+		if loggingType == "info":
+			return logger.info
+		elif loggingType == "error":
+			return logger.error
+		elif loggingType == "warn":
+			return logger.warn
+		elif loggingType == "debug":
+			return logger.debug
+		raise error("Unknown logging type `%s'." % (str(loggingType)))
+
 	@classmethod
 	def addPreset(cls, name, preset):
 		# Set default values to the preset
@@ -74,18 +94,67 @@ class UtilzLog(object):
 			'defaultLevel': 3
 		}
 		p.update(preset)
-		f = lambda m, l=p['defaultLevel']: UtilzLog.p(p['preWrap'] % (str(m)), l, name)
-		setattr(cls, name, staticmethod(f))
+		# Resolve everything once, the message is only built if its level is considered
+		fct = UtilzLog.getLoggingFunction(p['loggingType'])
+		preWrap = p['preWrap']
+		colorWrap = p['colorWrap']
+		def log(message = "", level = p['defaultLevel']):
+			# Ignore if this level is not considered
+			if level > UtilzLog.verboseLevel:
+				return
+			message = preWrap % (str(message))
+			# If a hook is defined
+			hooks = UtilzLog.hooks
+			if hooks.has_key(name):
+				message = hooks[name][0](name, message, hooks[name][1])
+			# Wrap the message with the color and call the function
+			fct(colorWrap % (str(message)), extra={"level": level, "preset": name})
+		p['function'] = log
+		setattr(cls, name, staticmethod(log))
 		# Add the preset information
 		UtilzLog.presets[name] = p
 
+	@staticmethod
+	def defer(message, *args):
+		"""
+		Returns a message built only if it is logged.
+		\param message A format string, formatted with the arguments, or a
+		function, called with the arguments and returning the message.
+		"""
+		return UtilzLogDeferred(message, args)
+
 	@staticmethod
 	def setHandler(handler):
 		handler.setLevel(logging.DEBUG)
 		formatter = logging.Formatter("[%(asctime)-15s] [%(preset)s %(level)s] - %(message)s")
 		handler.setFormatter(formatter)
+		if UtilzLog.asyncHandler != None:
+			UtilzLog.asyncHandler.addTarget(handler)
+		else:
+			logger = logging.getLogger('log')
+			logger.addHandler(handler)
+
+	@staticmethod
+	def setAsync(enable = True):
+		"""
+		Write the records from a background thread, the callers only queue
+		them and never wait for the disk or the console. The records queued
+		are written before the program exits.
+		"""
 		logger = logging.getLogger('log')
-		logger.addHandler(handler)
+		if enable and UtilzLog.asyncHandler == None:
+			handler = UtilzLogAsyncHandler(logger.handlers[:])
+			for target in handler.targets:
+				logger.removeHandler(target)
+			logger.addHandler(handler)
+			UtilzLog.asyncHandler = handler
+		elif not enable and UtilzLog.asyncHandler != None:
+			handler = UtilzLog.asyncHandler
+			UtilzLog.asyncHandler = None
+			logger.removeHandler(handler)
+			handler.stop()
+			for target in handler.targets:
+				logger.addHandler(target)
 
 	@staticmethod
 	def setVerbosity(level):
@@ -107,37 +176,82 @@ class UtilzLog(object):
 	def p(message = "", level = 3, preset = "info"):
 		if not isinstance(level, int):
 			raise error("Level must be an integer, `%s' given instead." % (str(level)))
-
-		# Ignore if this level is not considered
-		if level > UtilzLog.verboseLevel:
-			return
-
-		if UtilzLog.presets.has_key(preset):
-			colorWrap = UtilzLog.presets[preset]['colorWrap']
-			loggingType = UtilzLog.presets[preset]['loggingType']
-			if loggingType == "info":
-				fct = logging.getLogger('log').info
-			elif loggingType == "error":
-				fct = logging.getLogger('log').error
-			elif loggingType == "warn":
-				fct = logging.getLogger('log').warn
-			elif loggingType == "debug":
-				fct = logging.getLogger('log').debug
-			else:
-				raise error("Unknown logging type `%s'." % (str(loggingType)))
-		else:
+		if not UtilzLog.presets.has_key(preset):
 			raise error("Unknown preset `%s'." % (str(preset)))
+		UtilzLog.presets[preset]['function'](message, level)
+
+class UtilzLogDeferred(object):
+	"""
+	Message built when it is converted into a string
+	"""
+
+	def __init__(self, message, args):
+		self.message = message
+		self.args = args
+
+	def __str__(self):
+		if callable(self.message):
+			return str(self.message(*self.args))
+		return self.message % self.args
+
+class UtilzLogAsyncHandler(logging.Handler):
+	"""
+	Handler queueing the records, which are passed to the target handlers
+	by a background thread.
+	"""
+
+	def __init__(self, targets):
+		logging.Handler.__init__(self, logging.DEBUG)
+		self.targets = targets
+		self.queue = Queue.Queue()
+		self.thread = threading.Thread(target = self.taskWrite)
+		self.thread.daemon = True
+		self.thread.start()
+
+	def addTarget(self, handler):
+		self.targets.append(handler)
+
+	def emit(self, record):
+		self.queue.put_nowait(record)
+
+	def taskWrite(self):
+		while True:
+			record = self.queue.get()
+			try:
+				if record == None:
+					return
+				for target in self.targets:
+					if record.levelno >= target.level:
+						try:
+							target.handle(record)
+						except Exception:
+							# Report the error as the handlers of the standard library do
+							target.handleError(record)
+			finally:
+				self.queue.task_done()
 
-		# If a hook is defined
-		hooks = UtilzLog.hooks
-		if hooks.has_key(preset):
-			message = hooks[preset][0](preset, str(message), hooks[preset][1])
+	def flush(self):
+		"""
+		Wait until the records queued are written
+		"""
+		if self.thread.is_alive():
+			self.queue.join()
+		for target in self.targets:
+			target.flush()
 
-		# Wrap the message with the color
-		message = colorWrap % (str(message))
+	def stop(self):
+		"""
+		Write the records queued and stop the thread
+		"""
+		if self.thread.is_alive():
+			self.queue.put_nowait(None)
+			self.thread.join()
+		for target in self.targets:
+			target.flush()
 
-		# Call the function
-		fct(message, extra={"level": level, "preset": preset})
+	def close(self):
+		self.stop()
+		logging.Handler.close(self)
 
 # Inistialize the logging instance
 UtilzLog.log = UtilzLog()
@@ -0,0 +1,68 @@
+#!/usr/bin/python
+# -*- coding: iso-8859-1 -*-
+
+import threading
+
+from log import *
+
+class UtilzMailbox(object):
+	"""
+	Mailbox holding a single item, the latest one.
+
+	Putting an item replaces the pending one, which is then counted as
+	coalesced. The consumer always gets the freshest item and never lags
+	behind the producer, which is never blocked.
+	"""
+
+	def __init__(self):
+		self.condition = threading.Condition()
+		self.item = None
+		self.pending = False
+		self.closed = False
+		# Number of items put and of items replaced before being read
+		self.count = 0
+		self.coalesced = 0
+
+	def put(self, item):
+		"""
+		Put an item, replacing the pending one if any
+		"""
+		with self.condition:
+			if self.pending:
+				self.coalesced = self.coalesced + 1
+			self.item = item
+			self.pending = True
+			self.count = self.count + 1
+			self.condition.notify()
+
+	def get(self, timeout = None):
+		"""
+		Wait for an item and returns it.
+		Returns None if the timeout expires or if the mailbox is closed.
+		"""
+		with self.condition:
+			if not self.pending and not self.closed:
+				self.condition.wait(timeout)
+			if not self.pending:
+				return None
+			item = self.item
+			self.item = None
+			self.pending = False
+			return item
+
+	def close(self):
+		"""
+		Close the mailbox, the consumer waiting for an item is released
+		"""
+		with self.condition:
+			self.closed = True
+			self.condition.notify_all()
+
+	def isClosed(self):
+		return self.closed
+
+	def getCount(self):
+		"""
+		Returns the number of items put and the number of items coalesced
+		"""
+		return [self.count, self.coalesced]
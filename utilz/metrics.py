@@ -0,0 +1,147 @@
+#!/usr/bin/python
+# -*- coding: iso-8859-1 -*-
+
+import BaseHTTPServer
+import SocketServer
+import re
+import threading
+import urlparse
+
+from log import *
+
+class UtilzMetrics(object):
+	"""
+	Builder of a metrics page in the Prometheus text exposition format.
+
+	The samples of a metric must be added after its declaration, the
+	metrics are written in the order they have been declared.
+	"""
+	COUNTER = "counter"
+	GAUGE = "gauge"
+	SUMMARY = "summary"
+
+	def __init__(self, prefix = ""):
+		self.prefix = prefix
+		self.metrics = []
+		self.samples = {}
+
+	@staticmethod
+	def toName(name):
+		"""
+		Converts a camel case or dotted name into a metric name, `apiErrors' being `api_errors'
+		"""
+		name = re.sub("([a-z0-9])([A-Z])", "\\1_\\2", name)
+		return re.sub("[^a-zA-Z0-9_]", "_", name).lower()
+
+	@staticmethod
+	def escape(value):
+		return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+	def declare(self, name, metricType, description):
+		"""
+		Declare a metric, nothing is done if it is already declared
+		"""
+		name = self.prefix + name
+		if not self.samples.has_key(name):
+			self.metrics.append([name, metricType, description])
+			self.samples[name] = []
+		return name
+
+	def add(self, name, labels, value, suffix = ""):
+		"""
+		Add a sample to a declared metric
+		\param labels List of [name, value] labels
+		\param suffix Suffix of the sample name, `_sum' or `_count' for the summaries
+		"""
+		name = self.prefix + name
+		if not self.samples.has_key(name):
+			raise error("The metric `%s' must be declared first." % (name))
+		if value == None:
+			return
+		self.samples[name].append([name + suffix, labels, value])
+
+	def toText(self):
+		"""
+		Returns the metrics in the text exposition format
+		"""
+		stringList = []
+		for name, metricType, description in self.metrics:
+			stringList.append("# HELP %s %s" % (name, description))
+			stringList.append("# TYPE %s %s" % (name, metricType))
+			for sampleName, labels, value in self.samples[name]:
+				if len(labels):
+					sampleName = "%s{%s}" % (sampleName, ",".join(["%s=\"%s\"" % (key, UtilzMetrics.escape(v)) for key, v in labels]))
+				stringList.append("%s %s" % (sampleName, repr(float(value))))
+		return "\n".join(stringList) + "\n"
+
+class UtilzMetricsHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+	"""
+	Serve the pages of the metrics server
+	"""
+
+	def do_GET(self):
+		path = urlparse.urlparse(self.path).path
+		if not self.server.routes.has_key(path):
+			self.reply("Not found\n", "text/plain", 404)
+			return
+		contentType, callback = self.server.routes[path]
+		try:
+			body = callback()
+		except Exception as e:
+			UtilzLog.warning("Error while generating the page `%s': %s" % (path, str(e)))
+			self.reply("Internal error\n", "text/plain", 500)
+			return
+		self.reply(body, contentType)
+
+	def reply(self, body, contentType, status = 200):
+		self.send_response(status)
+		self.send_header("Content-Type", contentType)
+		self.send_header("Content-Length", str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, format, *args):
+		UtilzLog.info("Metrics server: " + (format % args), 3)
+
+class UtilzMetricsHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+	daemon_threads = True
+	allow_reuse_address = True
+
+class UtilzMetricsServer(object):
+	"""
+	Lightweight HTTP server exposing pages generated on request, to be
+	scraped by a monitoring system. It runs in a background thread.
+	"""
+
+	def __init__(self, routes, config = {}):
+		"""
+		\param routes Pages served by path, as [content type, function returning the body]
+		"""
+		self.config = {
+			'host': "127.0.0.1",
+			'port': 9108
+		}
+		self.config.update(config)
+		self.server = UtilzMetricsHTTPServer((self.config['host'], self.config['port']), UtilzMetricsHandler)
+		self.server.routes = routes
+		self.thread = None
+
+	def getUrl(self):
+		"""
+		Returns the base URL of the server
+		"""
+		return "http://%s:%i" % self.server.server_address[:2]
+
+	def start(self):
+		"""
+		Serve the requests in a background thread
+		"""
+		self.thread = threading.Thread(target = self.server.serve_forever)
+		self.thread.daemon = True
+		self.thread.start()
+		UtilzLog.info("Metrics served at `%s'" % (self.getUrl()), 1)
+		return self
+
+	def stop(self):
+		self.server.shutdown()
+		self.server.server_close()
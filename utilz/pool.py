@@ -0,0 +1,201 @@
+#!/usr/bin/python
+# -*- coding: iso-8859-1 -*-
+
+import gzip
+import httplib
+import socket
+import threading
+import time
+import urlparse
+import StringIO
+
+from log import *
+
+class UtilzConnectionPool(object):
+	"""
+	Pool of persistent (keep-alive) HTTP connections.
+
+	Idle connections are kept per host (and per proxy), so that consecutive
+	requests to the same host pay the TCP and TLS handshakes only once.
+	The pool is thread safe, a connection being used by a single request at
+	a time.
+	"""
+	# Pool used when none is specified
+	default = None
+
+	def __init__(self, config = {}):
+		self.config = {
+			# Maximum number of idle connections kept per host
+			'size': 4,
+			# Default timeout in seconds
+			'timeout': 10,
+			# Request gzip compressed responses
+			'gzip': True,
+			# Maximum number of redirections followed
+			'maxRedirect': 5,
+			# Idle time in seconds after which a connection is not used for a POST
+			# request, as the server might have closed it and the request cannot be retried
+			'keepAlive': 2.
+		}
+		self.config.update(config)
+		# Idle connections per key, with the time at which they have been released
+		self.idle = {}
+		self.lock = threading.Lock()
+
+	def setConfig(self, config):
+		"""
+		Update the configuration of the pool
+		"""
+		self.config.update(config)
+
+	@staticmethod
+	def getKey(scheme, host, port, proxy):
+		"""
+		Returns the key identifying the connections to a host
+		"""
+		return (scheme, host, port, proxy)
+
+	def connect(self, scheme, host, port, proxy, timeout):
+		"""
+		Create a new connection
+		"""
+		if proxy != None:
+			proxyUrl = urlparse.urlparse(proxy if "://" in proxy else "http://" + proxy)
+			if scheme == "https":
+				connection = httplib.HTTPSConnection(proxyUrl.hostname, proxyUrl.port or 80, timeout = timeout)
+				connection.set_tunnel(host, port)
+			else:
+				connection = httplib.HTTPConnection(proxyUrl.hostname, proxyUrl.port or 80, timeout = timeout)
+		elif scheme == "https":
+			connection = httplib.HTTPSConnection(host, port, timeout = timeout)
+		else:
+			connection = httplib.HTTPConnection(host, port, timeout = timeout)
+		return connection
+
+	def acquire(self, key, timeout, maxIdle = None):
+		"""
+		Returns an idle connection or a new one, and whether it has been reused
+		\param maxIdle Maximum idle time of the connection reused, the connections idle for longer are closed
+		"""
+		staleList = []
+		connection = None
+		with self.lock:
+			while self.idle.get(key):
+				connection, releaseTime = self.idle[key].pop()
+				if maxIdle == None or time.time() - releaseTime <= maxIdle:
+					break
+				staleList.append(connection)
+				connection = None
+		for stale in staleList:
+			stale.close()
+		if connection != None:
+			connection.timeout = timeout
+			if connection.sock != None:
+				connection.sock.settimeout(timeout)
+			return connection, True
+		return self.connect(key[0], key[1], key[2], key[3], timeout), False
+
+	def release(self, key, connection):
+		"""
+		Return a connection to the pool, it is closed if the pool is full
+		"""
+		with self.lock:
+			if not self.idle.has_key(key):
+				self.idle[key] = []
+			if len(self.idle[key]) < self.config['size']:
+				self.idle[key].append([connection, time.time()])
+				return
+		connection.close()
+
+	def close(self):
+		"""
+		Close all the idle connections
+		"""
+		with self.lock:
+			for key in self.idle:
+				for connection, releaseTime in self.idle[key]:
+					connection.close()
+			self.idle = {}
+
+	def request(self, url, data = None, headers = {}, timeout = None, proxy = None):
+		"""
+		Send a request and returns the body of the response.
+		A POST request is sent if data are set, a GET otherwise.
+		\param proxy Dictionary of proxies per scheme, for example {'https': 'http://host:3128'}
+		"""
+		if timeout == None:
+			timeout = self.config['timeout']
+		headers = dict(headers)
+		if self.config['gzip']:
+			headers['Accept-Encoding'] = 'gzip'
+
+		for redirect in range(self.config['maxRedirect'] + 1):
+			parsed = urlparse.urlparse(url)
+			scheme = parsed.scheme.lower()
+			if scheme not in ["http", "https"]:
+				raise error("Unsupported URL scheme `%s' for `%s'." % (scheme, url))
+			port = parsed.port or (443 if scheme == "https" else 80)
+			key = self.getKey(scheme, parsed.hostname, port, proxy.get(scheme) if proxy else None)
+			# Requests through a plain HTTP proxy use the absolute URL
+			if key[3] != None and scheme == "http":
+				path = url
+			else:
+				path = parsed.path or "/"
+				if parsed.query:
+					path = path + "?" + parsed.query
+			requestHeaders = dict(headers)
+			requestHeaders['Host'] = parsed.netloc
+
+			status, reason, responseHeaders, body = self.send(key, "POST" if data != None else "GET", path, data, requestHeaders, timeout)
+
+			# Follow the redirections
+			if status in [301, 302, 303, 307] and responseHeaders.has_key('location'):
+				url = urlparse.urljoin(url, responseHeaders['location'])
+				# As browsers do, the redirected request is a GET
+				if data != None and status != 307:
+					data = None
+					headers.pop("Content-Type", None)
+					headers.pop("Content-Length", None)
+				continue
+			if status >= 400:
+				raise error("HTTP Error %i: %s" % (status, reason))
+			# Decompress the response if needed
+			if responseHeaders.get('content-encoding') == 'gzip':
+				body = gzip.GzipFile(fileobj = StringIO.StringIO(body)).read()
+			return body
+
+		raise error("Too many redirections for `%s'." % (url))
+
+	def send(self, key, method, path, data, headers, timeout):
+		"""
+		Send a request over a pooled connection.
+		A request over a reused connection is retried on a new connection, as
+		the server might have closed it in the meantime. A POST request is not
+		idempotent, it is retried only if it could not be sent entirely, never
+		once the server might have received it. To avoid this, a POST request
+		only reuses a connection which has been idle for less than the
+		keep-alive time.
+		"""
+		while True:
+			connection, reused = self.acquire(key, timeout, self.config['keepAlive'] if method == "POST" else None)
+			sent = False
+			try:
+				connection.request(method, path, data, headers)
+				sent = True
+				response = connection.getresponse()
+				body = response.read()
+			except (httplib.HTTPException, socket.error) as e:
+				connection.close()
+				if reused and not isinstance(e, socket.timeout) and (method == "GET" or not sent):
+					continue
+				raise
+			responseHeaders = dict(response.getheaders())
+			# Keep the connection only if the server allows it
+			if response.will_close:
+				connection.close()
+			else:
+				self.release(key, connection)
+			return response.status, response.reason, responseHeaders, body
+
+# Create the default pool
+UtilzConnectionPool.default = UtilzConnectionPool()
@@ -0,0 +1,175 @@
+#!/usr/bin/python
+# -*- coding: iso-8859-1 -*-
+
+import array
+import math
+import threading
+
+from log import *
+
+class UtilzHistogram(object):
+	"""
+	Histogram of values (durations in seconds) with a bounded relative error,
+	in the spirit of the HDR histograms.
+
+	The buckets grow geometrically from the lowest value, each one being
+	wider than the previous one by the precision factor. Recording a value
+	is done in constant time and memory, and any percentile can be read
+	with an error lower than the precision.
+	"""
+
+	def __init__(self, config = {}):
+		self.config = {
+			# Lowest and highest values distinguished, the others are clamped
+			'lowest': 0.000001,
+			'highest': 3600.,
+			# Relative precision of the values read
+			'precision': 0.01
+		}
+		self.config.update(config)
+		self.lowest = self.config['lowest']
+		self.ratio = math.log(1. + self.config['precision'])
+		self.size = int(math.log(self.config['highest'] / self.lowest) / self.ratio) + 2
+		self.lock = threading.Lock()
+		self.reset()
+
+	def reset(self):
+		"""
+		Remove all the values recorded
+		"""
+		with self.lock:
+			self.counts = array.array('L', [0]) * self.size
+			self.count = 0
+			self.total = 0.
+			self.min = None
+			self.max = None
+
+	def getIndex(self, value):
+		"""
+		Returns the index of the bucket of a value
+		"""
+		if value <= self.lowest:
+			return 0
+		return min(self.size - 1, int(math.log(value / self.lowest) / self.ratio) + 1)
+
+	def getValue(self, index):
+		"""
+		Returns the highest value of a bucket
+		"""
+		return self.lowest * math.exp(index * self.ratio)
+
+	def record(self, value):
+		"""
+		Record a value
+		"""
+		index = self.getIndex(value)
+		with self.lock:
+			self.counts[index] = self.counts[index] + 1
+			self.count = self.count + 1
+			self.total = self.total + value
+			if self.min == None or value < self.min:
+				self.min = value
+			if self.max == None or value > self.max:
+				self.max = value
+
+	def getCount(self):
+		return self.count
+
+	def getPercentile(self, percent):
+		"""
+		Returns the value below which a percentage of the values recorded fall,
+		None if no value has been recorded
+		"""
+		with self.lock:
+			if self.count == 0:
+				return None
+			target = max(1, int(math.ceil(self.count * percent / 100.)))
+			cumulative = 0
+			for index in xrange(self.size):
+				cumulative = cumulative + self.counts[index]
+				if cumulative >= target:
+					return max(self.min, min(self.getValue(index), self.max))
+			return self.max
+
+	def getSnapshot(self):
+		"""
+		Returns the count, sum, minimum, maximum, mean and main percentiles
+		"""
+		snapshot = {
+			'count': self.count,
+			'sum': self.total,
+			'min': self.min,
+			'max': self.max,
+			'mean': self.total / self.count if self.count else None
+		}
+		for name, percent in UtilzStats.PERCENTILES:
+			snapshot[name] = self.getPercentile(percent)
+		return snapshot
+
+class UtilzStats(object):
+	"""
+	Set of named histograms and counters, created on their first use.
+	"""
+	# Percentiles reported, by name
+	PERCENTILES = [['p50', 50], ['p90', 90], ['p99', 99], ['p999', 99.9]]
+
+	def __init__(self, config = {}):
+		# Configuration of the histograms
+		self.config = config
+		self.histograms = {}
+		self.counters = {}
+		self.lock = threading.Lock()
+
+	def get(self, name):
+		"""
+		Returns the histogram of a name
+		"""
+		histogram = self.histograms.get(name)
+		if histogram == None:
+			with self.lock:
+				if not self.histograms.has_key(name):
+					self.histograms[name] = UtilzHistogram(self.config)
+				histogram = self.histograms[name]
+		return histogram
+
+	def record(self, name, value):
+		"""
+		Record a value into the histogram of a name
+		"""
+		self.get(name).record(value)
+
+	def increment(self, name, value = 1):
+		"""
+		Increment a counter
+		"""
+		with self.lock:
+			self.counters[name] = self.counters.get(name, 0) + value
+
+	def getCounters(self):
+		"""
+		Returns a copy of the counters by name
+		"""
+		with self.lock:
+			return self.counters.copy()
+
+	def getNames(self):
+		return sorted(self.histograms.keys())
+
+	def getSnapshot(self):
+		"""
+		Returns the snapshot of all the histograms by name
+		"""
+		return dict([(name, self.get(name).getSnapshot()) for name in self.getNames()])
+
+	def printReport(self, prefix = ""):
+		"""
+		Print the histograms as a text report, in milliseconds
+		"""
+		stringList = []
+		for name in self.getNames():
+			snapshot = self.get(name).getSnapshot()
+			if snapshot['count'] == 0:
+				continue
+			stringList.append("%s%s: n=%i p50:%.1fms p90:%.1fms p99:%.1fms p99.9:%.1fms max:%.1fms" % (prefix, name, snapshot['count'],
+					snapshot['p50'] * 1000, snapshot['p90'] * 1000, snapshot['p99'] * 1000, snapshot['p999'] * 1000, snapshot['max'] * 1000))
+		return "\n".join(stringList)